@@ -0,0 +1,95 @@
+"""Compare full decoding with scaled decoding for image previews.
+
+Writes large JPEG, PNG and WebP fixtures to a temporary directory, then
+decodes each one to a preview-sized image in a fresh subprocess, once by
+decoding in full and scaling (the old preview path) and once through
+thumbnails.get_image_thumbnail. Reports wall time and the growth of the
+process's peak RSS. Linux only (reads VmHWM from /proc/self/status).
+
+Usage: python benchmarks/bench_image_decode.py [--megapixels N] [--repeat N]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def write_fixtures(directory, megapixels):
+    import cv2
+    import numpy as np
+
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = width * 3 // 4
+    # Smooth gradients plus mild noise compress like a photo, not like static
+    y, x = np.mgrid[0:height, 0:width]
+    image = np.stack([(x * 255 // width), (y * 255 // height), ((x + y) * 127 // (width + height))], axis=-1)
+    image = (image + np.random.default_rng(0).integers(0, 16, image.shape)).clip(0, 255).astype(np.uint8)
+    paths = []
+    for ext in ('.jpg', '.png', '.webp'):
+        path = os.path.join(directory, f"fixture{ext}")
+        cv2.imwrite(path, image)
+        paths.append(path)
+    return paths
+
+
+def peak_rss_kb():
+    # VmHWM belongs to the current address space, so unlike ru_maxrss it is
+    # not inherited from the parent that spawned this process
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1])
+    return 0
+
+
+def child(method, path, repeat):
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5.QtCore import Qt
+    from PyQt5.QtGui import QImage
+    from thumbnails import get_image_thumbnail, IMAGE_PREVIEW_SIZE
+
+    baseline = peak_rss_kb()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        if method == 'full':
+            image = QImage(path).scaled(IMAGE_PREVIEW_SIZE, IMAGE_PREVIEW_SIZE, Qt.KeepAspectRatio,
+                                        Qt.SmoothTransformation)
+        else:
+            image = get_image_thumbnail(path)
+    elapsed = (time.perf_counter() - start) / repeat
+    peak = peak_rss_kb() - baseline
+    print(json.dumps({'seconds': elapsed, 'peak_kb': peak, 'size': [image.width(), image.height()]}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--megapixels', type=float, default=48)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--child', nargs=2, metavar=('METHOD', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child[0], args.child[1], args.repeat)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_fixtures(directory, args.megapixels)
+        print(f"{'fixture':14s} {'method':7s} {'time (ms)':>10s} {'peak RSS (MB)':>14s}")
+        for path in paths:
+            for method in ('full', 'scaled'):
+                output = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), '--repeat', str(args.repeat),
+                     '--child', method, path],
+                    check=True, capture_output=True, text=True).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+                print(f"{os.path.basename(path):14s} {method:7s} {result['seconds'] * 1000:10.1f} "
+                      f"{result['peak_kb'] / 1024:14.1f}")
+
+
+if __name__ == '__main__':
+    main()
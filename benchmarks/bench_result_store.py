@@ -0,0 +1,58 @@
+"""Compare memory use of the tuple list and ResultStore for scan results.
+
+Usage: python benchmarks/bench_result_store.py [--files N]
+"""
+import argparse
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from result_store import ResultStore
+
+EXTENSIONS = ['.jpg', '.png', '.mp4', '.mov', '.pdf', '.txt', '.log', '.bin', '']
+
+
+def synthetic_records(count, files_per_dir=50):
+    # Realistic-looking paths: a few levels of directories, ~50 files each
+    for i in range(count):
+        dir_id = i // files_per_dir
+        ext = EXTENSIONS[i % len(EXTENSIONS)]
+        name = f"file_{i:08d}{ext}"
+        root = os.path.join('/srv', 'share', f"project_{dir_id // 100:04d}", f"batch_{dir_id:06d}")
+        yield (name, ext, (i * 7919) % (1 << 32), os.path.join(root, name)), 1_700_000_000_000_000_000 + i
+
+
+def measure(build):
+    tracemalloc.start()
+    result = build()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    def build_list():
+        # Mirrors the old FileScanner output, which kept no mtimes at all
+        return [record for record, _ in synthetic_records(args.files)]
+
+    def build_store():
+        store = ResultStore()
+        for record, mtime in synthetic_records(args.files):
+            store.append(record, mtime)
+        return store
+
+    for label, build in (('tuple list', build_list), ('ResultStore', build_store)):
+        result, current, peak = measure(build)
+        print(f"{label:12s} {args.files:,} files: {current / 2**20:8.1f} MB retained, "
+              f"{peak / 2**20:8.1f} MB peak, {current / args.files:6.1f} B/file")
+        del result
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Time the GUI's startup: imports, window construction and first paint.
+
+Each run starts the app in a fresh subprocess, so imports are timed cold
+(apart from the OS file cache), and reports the seconds to import Qt, to
+import file_sorter_new, to build the window, to its first paint and to the
+first tab being ready, plus which of the heavy optional modules (numpy,
+cv2, send2trash) had been imported by the first paint. Runs headless: Qt
+uses the offscreen platform unless QT_QPA_PLATFORM is already set.
+
+Usage: python benchmarks/bench_startup.py [--repeat N]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+HEAVY_MODULES = ('numpy', 'cv2', 'send2trash')
+STEPS = ('qt', 'import', 'window', 'first_paint', 'tab_ready')
+
+
+def child():
+    started = time.perf_counter()
+    from PyQt5.QtCore import QEvent, QObject
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication([])
+    times = {'qt': time.perf_counter()}
+    import file_sorter_new
+    times['import'] = time.perf_counter()
+    window = file_sorter_new.FileSorterApp()
+    window.resize(1200, 800)
+    times['window'] = time.perf_counter()
+
+    loaded = {}
+
+    class PaintWatcher(QObject):
+        def eventFilter(self, watched, event):
+            if event.type() == QEvent.Paint and 'first_paint' not in times:
+                times['first_paint'] = time.perf_counter()
+                loaded.update((name, name in sys.modules) for name in HEAVY_MODULES)
+            return False
+
+    watcher = PaintWatcher()
+    window.installEventFilter(watcher)
+    window.show()
+    deadline = time.perf_counter() + 30
+    while (('first_paint' not in times or window.all_files_table is None)
+           and time.perf_counter() < deadline):
+        app.processEvents()
+    times['tab_ready'] = time.perf_counter()
+    result = {step: round(times[step] - started, 6) for step in STEPS if step in times}
+    result['loaded_at_first_paint'] = loaded
+    print(json.dumps(result))
+
+
+def run_once():
+    env = dict(os.environ)
+    env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child'], check=True,
+                            capture_output=True, text=True, env=env).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    # Includes starting the interpreter, which the child cannot time itself
+    result['process'] = round(time.perf_counter() - start, 6)
+    return result
+
+
+def measure(repeat):
+    # Median of each step over `repeat` fresh processes; min and median of
+    # first paint are the headline numbers
+    runs = [run_once() for _ in range(repeat)]
+    paints = [run['first_paint'] for run in runs]
+    result = {'seconds': paints, 'min': min(paints), 'median': round(statistics.median(paints), 6)}
+    for step in STEPS + ('process',):
+        values = [run[step] for run in runs if step in run]
+        if values:
+            result[step] = round(statistics.median(values), 6)
+    result['loaded_at_first_paint'] = runs[-1]['loaded_at_first_paint']
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child()
+        return
+
+    result = measure(args.repeat)
+    print(f"{'step':14s} {'median (ms)':>12s}")
+    for step in STEPS + ('process',):
+        if step in result:
+            print(f"{step:14s} {result[step] * 1000:12.1f}")
+    loaded = [name for name, present in result['loaded_at_first_paint'].items() if present]
+    print(f"loaded at first paint: {', '.join(loaded) or 'none of ' + ', '.join(HEAVY_MODULES)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,460 @@
+"""Time the main scan, display and file-handling paths on a generated tree.
+
+Generates a deterministic tree (see tree_generator.py), or reuses one given
+with --tree, then times each scenario --repeat times: GUI startup to first
+paint, scanning (serial, parallel, with allocated sizes and through
+FileScanner), classification, model population, sorting each column,
+multi-selection statistics, snapshot saving and diffing, image and video
+thumbnails one at a time and in a batch, perceptual hashing and grouping of
+similar media, and permanent deletion. Results are written as
+JSON, with the environment and tree options, so runs can be compared with
+--compare.
+
+Runs headless: Qt uses the offscreen platform unless QT_QPA_PLATFORM is
+already set, and the app's caches are redirected to a temporary directory.
+
+Usage: python benchmarks/bench_suite.py [--tree DIR] [--repeat N] [--only a,b]
+       [--output results.json] [--compare baseline.json] [tree options]
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import tree_generator
+
+
+class Context:
+    # State shared between scenarios; the app is only built when a
+    # scenario needs it
+    def __init__(self, root, manifest, workers, selection, delete_files):
+        self.root = root
+        self.manifest = manifest
+        self.workers = workers
+        self.selection = selection
+        self.delete_files = delete_files
+        self.store = None
+        self._app = None
+        self._window = None
+
+    def records(self):
+        if self.store is None:
+            from result_store import ResultStore
+            from scan_engine import scan_tree
+            self.store = ResultStore()
+            for records, mtimes, _, _ in scan_tree(self.root):
+                self.store.extend(records, mtimes)
+        return self.store
+
+    def window(self):
+        if self._window is None:
+            from PyQt5.QtWidgets import QApplication
+            self._app = QApplication.instance() or QApplication([])
+            import file_sorter_new
+            self._window = file_sorter_new.FileSorterApp()
+            self._window.resize(1200, 800)
+            # Tabs are otherwise built when first shown
+            self._window.show_tab('all')
+        return self._window
+
+    def process_events(self):
+        if self._app is not None:
+            self._app.processEvents()
+
+
+def time_repeated(run, repeat, setup=None):
+    seconds = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        run()
+        seconds.append(time.perf_counter() - start)
+    return {'seconds': [round(value, 6) for value in seconds],
+            'min': round(min(seconds), 6), 'median': round(statistics.median(seconds), 6)}
+
+
+def bench_scan_serial(ctx, repeat):
+    from scan_engine import scan_tree
+    counted = []
+
+    def run():
+        counted.append(sum(len(records) for records, _, _, _ in scan_tree(ctx.root)))
+    result = time_repeated(run, repeat)
+    result['files'] = counted[-1]
+    result['files_per_s'] = round(counted[-1] / result['min'], 1)
+    return result
+
+
+def bench_scan_parallel(ctx, repeat):
+    from scan_engine import scan_tree_parallel
+    counted = []
+
+    def run():
+        counted.append(sum(len(records) for records, _, _, _ in scan_tree_parallel(ctx.root, ctx.workers)))
+    result = time_repeated(run, repeat)
+    result['workers'] = ctx.workers
+    result['files'] = counted[-1]
+    result['files_per_s'] = round(counted[-1] / result['min'], 1)
+    return result
+
+
+def bench_scan_allocated(ctx, repeat):
+    # A serial scan counting allocated sizes, then adding a million
+    # synthetic inodes, a tenth of them repeats, to the hard-link set
+    import numpy as np
+    from scan_engine import InodeSet, scan_tree
+    counted = []
+
+    def run():
+        counted.append(sum(len(records) for records, _, _, _ in scan_tree(ctx.root, inodes=InodeSet())))
+    result = time_repeated(run, repeat)
+    result['files'] = counted[-1]
+    result['files_per_s'] = round(counted[-1] / result['min'], 1)
+    rng = np.random.default_rng(0)
+    inodes = rng.integers(1, 2 ** 40, 1000000, dtype=np.int64).astype(np.uint64)
+    inodes[:100000] = inodes[100000:200000]
+    sets = []
+
+    def insert():
+        inodes_seen = InodeSet()
+        for start in range(0, len(inodes), 1000):
+            inodes_seen.add(1, inodes[start:start + 1000])
+        sets.append(inodes_seen)
+    insertion = time_repeated(insert, repeat)
+    insertion['inodes'] = len(sets[-1])
+    insertion['bytes'] = sets[-1].nbytes()
+    result['inode_set'] = insertion
+    return result
+
+
+def bench_file_scanner(ctx, repeat):
+    # The GUI's scan thread, run synchronously: scan, store, totals and
+    # folder tree, without a scan index
+    ctx.window()
+    from file_sorter_new import FileScanner
+    scanners = []
+
+    def run():
+        scanner = FileScanner(ctx.root, ctx.workers)
+        scanner.run()
+        scanners.append(scanner)
+    result = time_repeated(run, repeat)
+    result['telemetry'] = scanners[-1].telemetry.as_dict()
+    return result
+
+
+def bench_classification(ctx, repeat):
+    from result_store import ResultStore
+    from scan_engine import classify_extension
+    store = ctx.records()
+    records = list(store)
+    mtimes = list(store.mtimes)
+    result = time_repeated(lambda: [classify_extension(record[1]) for record in records], repeat)
+    result['files'] = len(records)
+    result['store_build'] = time_repeated(lambda: ResultStore(records, mtimes), repeat)
+    return result
+
+
+def bench_model_population(ctx, repeat):
+    from result_store import ResultStore
+    window = ctx.window()
+    store = ctx.records()
+
+    def setup():
+        window.file_model.set_files(ResultStore())
+        ctx.process_events()
+
+    def run():
+        window.file_model.set_files(store)
+        ctx.process_events()
+    result = time_repeated(run, repeat, setup)
+    result['rows'] = len(store)
+    return result
+
+
+def bench_sort(ctx, repeat):
+    from PyQt5.QtCore import Qt
+    window = ctx.window()
+    table = window.all_files_table
+    if window.file_model.rowCount() != len(ctx.records()):
+        window.file_model.set_files(ctx.records())
+    results = {}
+    model = table.model()
+    count = model.columnCount()
+    for column in range(count):
+        # Start from a different order each time so every sort does the work
+        other = (column + 1) % count
+        results[model.headerData(column, Qt.Horizontal).lower()] = time_repeated(
+            lambda: table.sortByColumn(column, Qt.DescendingOrder), repeat,
+            lambda: table.sortByColumn(other, Qt.AscendingOrder))
+    total = sum(result['min'] for result in results.values())
+    return {'min': round(total, 6), 'median': round(sum(result['median'] for result in results.values()), 6),
+            'columns': results}
+
+
+def bench_selection_stats(ctx, repeat):
+    from PyQt5.QtCore import QItemSelection, QItemSelectionModel
+    window = ctx.window()
+    table = window.all_files_table
+    if window.file_model.rowCount() != len(ctx.records()):
+        window.file_model.set_files(ctx.records())
+    window.show_tab('all')
+    model = table.model()
+    rows = min(ctx.selection, model.rowCount())
+    selection = QItemSelection(model.index(0, 0), model.index(rows - 1, model.columnCount() - 1))
+    table.selectionModel().select(selection, QItemSelectionModel.ClearAndSelect | QItemSelectionModel.Rows)
+    ctx.process_events()
+    result = time_repeated(window.update_preview, repeat)
+    result['rows'] = rows
+    table.clearSelection()
+    return result
+
+
+def bench_snapshot(ctx, repeat):
+    # Save the scan as a snapshot, then diff it with a copy missing every
+    # hundredth file
+    from result_store import ResultStore
+    from snapshots import diff_snapshots, save_snapshot
+    store = ctx.records()
+    changed = ResultStore()
+    changed.merge(store)
+    changed.remove_rows(list(range(0, len(changed), 100)))
+    scratch = tempfile.mkdtemp(prefix='bench_snapshot_')
+    old_path = os.path.join(scratch, 'old.fssnap')
+    new_path = os.path.join(scratch, 'new.fssnap')
+    try:
+        save_snapshot(new_path, changed)
+        result = time_repeated(lambda: save_snapshot(old_path, store), repeat)
+        diff = time_repeated(lambda: diff_snapshots(old_path, new_path), repeat)
+        result['bytes'] = os.path.getsize(old_path)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    result['files'] = len(store)
+    result['diff'] = diff
+    return result
+
+
+def bench_thumbnails(ctx, repeat):
+    media = [os.path.join(ctx.root, path) for path in ctx.manifest.get('media', [])]
+    images = [path for path in media if not path.endswith('.mp4')]
+    videos = [path for path in media if path.endswith('.mp4')]
+    if not media:
+        return {'skipped': 'no media in the tree; generate it with --images/--videos'}
+    ctx.window()
+    from thumbnails import get_image_thumbnail, get_video_thumbnail
+    timings = {}
+    for kind, paths, make in (('images', images, get_image_thumbnail), ('videos', videos, get_video_thumbnail)):
+        if paths:
+            timing = time_repeated(lambda: [make(path) for path in paths], repeat)
+            timing['files'] = len(paths)
+            timing['per_file_ms'] = round(timing['min'] * 1000 / len(paths), 3)
+            timings[kind] = timing
+    return {'min': round(sum(timing['min'] for timing in timings.values()), 6),
+            'median': round(sum(timing['median'] for timing in timings.values()), 6),
+            **timings}
+
+
+def bench_thumbnail_batch(ctx, repeat):
+    # Pre-generating the tree's media into an empty cache each time, in
+    # one worker process per CPU
+    media = [os.path.join(ctx.root, path) for path in ctx.manifest.get('media', [])]
+    if not media:
+        return {'skipped': 'no media in the tree; generate it with --images/--videos'}
+    from thumbnail_batch import pregenerate
+    files = []
+    for path in media:
+        stat = os.stat(path)
+        files.append((path, stat.st_size, stat.st_mtime_ns, 'video' if path.endswith('.mp4') else 'image'))
+    scratch = tempfile.mkdtemp(prefix='bench_thumbnails_')
+    stats = []
+    try:
+        result = time_repeated(lambda: stats.append(pregenerate(files, tempfile.mkdtemp(dir=scratch))), repeat)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    result['files'] = len(files)
+    result['per_file_ms'] = round(result['min'] * 1000 / len(files), 3)
+    result['failed'] = stats[-1]['failed'] + stats[-1]['timed_out']
+    return result
+
+
+def bench_similar(ctx, repeat):
+    # Perceptual hashing of the tree's media in worker processes, without
+    # the cache, then grouping 100,000 synthetic hashes of which a tenth
+    # are near copies
+    import numpy as np
+    from result_store import ResultStore
+    from similarity import DEFAULT_THRESHOLD, find_similar, group_similar
+    rng = np.random.default_rng(0)
+    hashes = rng.integers(0, 2 ** 63, 100000, dtype=np.int64).astype(np.uint64)
+    flips = np.uint64(1) << rng.integers(0, 64, 10000).astype(np.uint64)
+    hashes[:10000] = hashes[10000:20000] ^ flips
+    grouping = time_repeated(lambda: group_similar(hashes, DEFAULT_THRESHOLD), repeat)
+    grouping['hashes'] = len(hashes)
+    media = [os.path.join(ctx.root, path) for path in ctx.manifest.get('media', [])]
+    if not media:
+        return {'min': grouping['min'], 'median': grouping['median'],
+                'hashing': {'skipped': 'no media in the tree; generate it with --images/--videos'},
+                'grouping': grouping}
+    store = ResultStore()
+    for path in media:
+        store.append((os.path.basename(path), os.path.splitext(path)[1].lower(), os.path.getsize(path), path))
+    stats = []
+    hashing = time_repeated(lambda: stats.append(find_similar(store, workers=ctx.workers)[1]), repeat)
+    hashing['files'] = len(media)
+    hashing['per_file_ms'] = round(hashing['min'] * 1000 / len(media), 3)
+    hashing['groups'] = stats[-1]['similar_groups']
+    return {'min': round(hashing['min'] + grouping['min'], 6),
+            'median': round(hashing['median'] + grouping['median'], 6),
+            'hashing': hashing, 'grouping': grouping}
+
+
+def bench_delete(ctx, repeat):
+    # Permanent deletion of small files in a scratch directory; the trash
+    # is never touched
+    ctx.window()
+    from file_sorter_new import FileDeleter
+    scratch = tempfile.mkdtemp(prefix='bench_delete_')
+    files = []
+
+    def setup():
+        files.clear()
+        for i in range(ctx.delete_files):
+            path = os.path.join(scratch, f"delete_{i:06d}.tmp")
+            with open(path, 'wb') as f:
+                f.write(b'x')
+            files.append((i, path))
+
+    try:
+        result = time_repeated(lambda: FileDeleter(list(files), use_trash=False).run(), repeat, setup)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    result['files'] = ctx.delete_files
+    return result
+
+
+def bench_startup(ctx, repeat):
+    # Fresh processes, so imports are timed cold; see bench_startup.py
+    import bench_startup
+    return bench_startup.measure(repeat)
+
+
+SCENARIOS = {
+    'startup': bench_startup,
+    'scan_serial': bench_scan_serial,
+    'scan_parallel': bench_scan_parallel,
+    'scan_allocated': bench_scan_allocated,
+    'file_scanner': bench_file_scanner,
+    'classification': bench_classification,
+    'model_population': bench_model_population,
+    'sort': bench_sort,
+    'selection_stats': bench_selection_stats,
+    'snapshot': bench_snapshot,
+    'thumbnails': bench_thumbnails,
+    'thumbnail_batch': bench_thumbnail_batch,
+    'similar': bench_similar,
+    'delete': bench_delete,
+}
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)['scenarios']
+    print(f"\n{'scenario':20s} {'baseline':>10s} {'now':>10s} {'ratio':>7s}", file=sys.stderr)
+    for name, result in results.items():
+        old = baseline.get(name)
+        if not old or 'median' not in old or 'median' not in result:
+            continue
+        ratio = result['median'] / old['median'] if old['median'] else float('inf')
+        print(f"{name:20s} {old['median']:10.4f} {result['median']:10.4f} {ratio:6.2f}x", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tree', help='tree to use; generated there if it has no manifest (default: a temporary tree)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=8, help='threads for the parallel scans (default: 8)')
+    parser.add_argument('--selection', type=int, default=10000, help='rows selected for selection_stats')
+    parser.add_argument('--delete-files', type=int, default=2000, help='files deleted per delete run')
+    parser.add_argument('--only', help='comma-separated scenarios to run: ' + ', '.join(SCENARIOS))
+    parser.add_argument('--output', help='write the JSON results here instead of stdout')
+    parser.add_argument('--compare', metavar='BASELINE', help='print median ratios against an earlier JSON result')
+    tree_generator.add_arguments(parser)
+    # A tree large enough to time, with a few sparse files and some media
+    parser.set_defaults(fanout=8, depth=3, files_per_dir=100, sparse_files=2, images=6, videos=2)
+    args = parser.parse_args()
+    names = args.only.split(',') if args.only else list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    scratch = tempfile.mkdtemp(prefix='file_sorter_bench_')
+    # Thumbnail, hash and index caches live under LOCALAPPDATA when it is set
+    os.environ['LOCALAPPDATA'] = os.path.join(scratch, 'cache')
+    try:
+        root = args.tree or os.path.join(scratch, 'tree')
+        if os.path.exists(os.path.join(root, tree_generator.MANIFEST_NAME)):
+            manifest = tree_generator.load_manifest(root)
+        else:
+            start = time.perf_counter()
+            manifest = tree_generator.generate_from_args(root, args)
+            print(f"Generated {manifest['files']:,} files in {manifest['dirs']:,} directories "
+                  f"in {time.perf_counter() - start:.1f} s", file=sys.stderr)
+
+        ctx = Context(root, manifest, args.workers, args.selection, args.delete_files)
+        results = {}
+        for name in names:
+            results[name] = SCENARIOS[name](ctx, args.repeat)
+            result = results[name]
+            if 'skipped' in result:
+                print(f"{name:20s} skipped: {result['skipped']}", file=sys.stderr)
+            else:
+                print(f"{name:20s} min {result['min']:9.4f} s  median {result['median']:9.4f} s", file=sys.stderr)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    report = {
+        'environment': environment(),
+        'tree': {key: manifest[key] for key in ('options', 'files', 'dirs', 'bytes')},
+        'repeat': args.repeat,
+        'scenarios': results,
+    }
+    text = json.dumps(report, indent=1)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+"""Generate a deterministic directory tree for benchmarks.
+
+The same options and seed always produce the same directories, names and
+sizes. Ordinary files are created sparse (truncated to size) unless
+--write-data is given, so large trees cost little disk space; --sparse-files
+adds multi-gigabyte sparse files on top. Real JPEG/PNG images and MP4
+videos, for the thumbnail scenarios, need OpenCV and numpy.
+
+Usage: python benchmarks/tree_generator.py ROOT [--fanout N] [--depth N]
+       [--files-per-dir N] [--size-dist lognormal|uniform|fixed]
+       [--ext-mix .jpg=20,.txt=10,...] [--sparse-files N] [--images N] [--videos N]
+"""
+import argparse
+import json
+import math
+import os
+import random
+
+GiB = 1024 ** 3
+
+# Relative weights of each extension; '' is a file with no extension
+DEFAULT_EXT_MIX = {
+    '.jpg': 20, '.png': 6, '.gif': 1, '.webp': 1,
+    '.mp4': 3, '.mov': 1, '.mkv': 1,
+    '.pdf': 6, '.docx': 4, '.txt': 10, '.xlsx': 2,
+    '.log': 10, '.json': 8, '.py': 8, '.bin': 4, '.zip': 2, '': 3,
+}
+SIZE_DISTRIBUTIONS = ('lognormal', 'uniform', 'fixed')
+MANIFEST_NAME = '.bench_manifest.json'
+
+
+def parse_ext_mix(text):
+    # ".jpg=20,.txt=10,=3" -> {'.jpg': 20, '.txt': 10, '': 3}
+    mix = {}
+    for item in text.split(','):
+        ext, _, weight = item.strip().partition('=')
+        mix[ext.lower()] = float(weight or 1)
+    return mix
+
+
+def parse_size(text):
+    # "4G", "512M", "64k" or a plain number of bytes
+    units = {'k': 1024, 'm': 1024 ** 2, 'g': GiB, 't': 1024 ** 4}
+    text = text.strip().lower().rstrip('b')
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def _file_size(rng, size_dist, median, max_size):
+    if size_dist == 'fixed':
+        return median
+    if size_dist == 'uniform':
+        return rng.randint(0, 2 * median)
+    # File sizes are roughly log-normal: many small files, a long tail
+    return min(max_size, int(rng.lognormvariate(math.log(max(median, 1)), 2.0)))
+
+
+def _write_file(path, size, rng, write_data):
+    with open(path, 'wb') as f:
+        if write_data and size:
+            f.write(rng.randbytes(size))
+        else:
+            f.truncate(size)
+
+
+def write_media(directory, images=0, videos=0, megapixels=12, seed=0):
+    """Write real images (alternating JPEG and PNG) and short MP4 videos."""
+    import cv2
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = width * 3 // 4
+    # Gradients plus mild noise compress like a photo rather than like static
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([(x * 255 // width), (y * 255 // height), ((x + y) * 127 // (width + height))], axis=-1)
+    paths = []
+    for i in range(images):
+        image = (base + rng.integers(0, 16, base.shape)).clip(0, 255).astype(np.uint8)
+        path = os.path.join(directory, f"image_{i:04d}{'.jpg' if i % 2 == 0 else '.png'}")
+        cv2.imwrite(path, image)
+        paths.append(path)
+    for i in range(videos):
+        path = os.path.join(directory, f"video_{i:04d}.mp4")
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), 30, (640, 360))
+        for frame in range(90):
+            writer.write(np.full((360, 640, 3), (frame * 2 + i * 17) % 256, dtype=np.uint8))
+        writer.release()
+        paths.append(path)
+    return paths
+
+
+def generate_tree(root, fanout=4, depth=3, files_per_dir=25, size_dist='lognormal',
+                  size_median=64 * 1024, max_size=256 * 1024 * 1024, ext_mix=None,
+                  sparse_files=0, sparse_size=4 * GiB, images=0, videos=0,
+                  image_megapixels=12, seed=0, write_data=False):
+    """Create the tree under root and return its manifest.
+
+    Every directory above `depth` has `fanout` subdirectories, and each
+    directory holds between half and one and a half times `files_per_dir`
+    files. The manifest (options plus file, directory and byte counts) is
+    also written to root/.bench_manifest.json.
+    """
+    if size_dist not in SIZE_DISTRIBUTIONS:
+        raise ValueError(f"unknown size distribution {size_dist!r}")
+    rng = random.Random(seed)
+    ext_mix = ext_mix or DEFAULT_EXT_MIX
+    extensions = list(ext_mix)
+    weights = [ext_mix[ext] for ext in extensions]
+    os.makedirs(root, exist_ok=True)
+
+    files = dirs = total_bytes = 0
+    level = [root]
+    for current_depth in range(depth + 1):
+        next_level = []
+        for directory in level:
+            dirs += 1
+            count = rng.randint(files_per_dir // 2, files_per_dir * 3 // 2)
+            for ext in rng.choices(extensions, weights, k=count):
+                size = _file_size(rng, size_dist, size_median, max_size)
+                _write_file(os.path.join(directory, f"file_{files:07d}{ext}"), size, rng, write_data)
+                files += 1
+                total_bytes += size
+            if current_depth < depth:
+                for child in range(fanout):
+                    path = os.path.join(directory, f"dir_{current_depth}_{child:03d}")
+                    os.makedirs(path, exist_ok=True)
+                    next_level.append(path)
+        level = next_level
+
+    if sparse_files:
+        sparse_dir = os.path.join(root, 'sparse')
+        os.makedirs(sparse_dir, exist_ok=True)
+        dirs += 1
+        for i in range(sparse_files):
+            _write_file(os.path.join(sparse_dir, f"sparse_{i:03d}.bin"), sparse_size, rng, False)
+            files += 1
+            total_bytes += sparse_size
+
+    media = []
+    if images or videos:
+        media = write_media(os.path.join(root, 'media'), images, videos, image_megapixels, seed)
+        dirs += 1
+        files += len(media)
+        total_bytes += sum(os.path.getsize(path) for path in media)
+
+    manifest = {
+        'options': {
+            'fanout': fanout, 'depth': depth, 'files_per_dir': files_per_dir,
+            'size_dist': size_dist, 'size_median': size_median, 'max_size': max_size,
+            'ext_mix': ext_mix, 'sparse_files': sparse_files, 'sparse_size': sparse_size,
+            'images': images, 'videos': videos, 'image_megapixels': image_megapixels,
+            'seed': seed, 'write_data': write_data,
+        },
+        'files': files,
+        'dirs': dirs,
+        'bytes': total_bytes,
+        'media': [os.path.relpath(path, root) for path in media],
+    }
+    with open(os.path.join(root, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
+def load_manifest(root):
+    with open(os.path.join(root, MANIFEST_NAME)) as f:
+        return json.load(f)
+
+
+def add_arguments(parser):
+    parser.add_argument('--fanout', type=int, default=4, help='subdirectories per directory (default: 4)')
+    parser.add_argument('--depth', type=int, default=3, help='levels below the root (default: 3)')
+    parser.add_argument('--files-per-dir', type=int, default=25, help='mean files per directory (default: 25)')
+    parser.add_argument('--size-dist', choices=SIZE_DISTRIBUTIONS, default='lognormal')
+    parser.add_argument('--size-median', type=parse_size, default=64 * 1024,
+                        help='median file size, e.g. 64k (default: 64k)')
+    parser.add_argument('--max-size', type=parse_size, default=256 * 1024 * 1024,
+                        help='largest ordinary file (default: 256M)')
+    parser.add_argument('--ext-mix', type=parse_ext_mix, default=None,
+                        help='extension weights, e.g. .jpg=20,.txt=10,=3')
+    parser.add_argument('--sparse-files', type=int, default=0, help='extra sparse multi-GB files')
+    parser.add_argument('--sparse-size', type=parse_size, default=4 * GiB, help='size of each sparse file (default: 4G)')
+    parser.add_argument('--images', type=int, default=0, help='real JPEG/PNG images to write (needs OpenCV)')
+    parser.add_argument('--videos', type=int, default=0, help='real MP4 videos to write (needs OpenCV)')
+    parser.add_argument('--image-megapixels', type=float, default=12)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--write-data', action='store_true',
+                        help='write pseudo-random contents instead of sparse files')
+
+
+def generate_from_args(root, args):
+    return generate_tree(
+        root, fanout=args.fanout, depth=args.depth, files_per_dir=args.files_per_dir,
+        size_dist=args.size_dist, size_median=args.size_median, max_size=args.max_size,
+        ext_mix=args.ext_mix, sparse_files=args.sparse_files, sparse_size=args.sparse_size,
+        images=args.images, videos=args.videos, image_megapixels=args.image_megapixels,
+        seed=args.seed, write_data=args.write_data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('root', help='directory to create the tree in')
+    add_arguments(parser)
+    args = parser.parse_args()
+    manifest = generate_from_args(args.root, args)
+    print(f"{manifest['files']:,} files in {manifest['dirs']:,} directories, "
+          f"{manifest['bytes'] / GiB:.2f} GiB apparent size")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+import os
+import sqlite3
+
+from scan_engine import CATEGORIES, OTHER, run_bounded
+
+SNIFF_BYTES = 512  # Enough for every signature below, including MPEG-TS sync bytes
+
+# Magic signatures: (offset, bytes, category). Checked in order; the first
+# match wins. Container formats that need more than a prefix are handled in
+# sniff_header.
+SIGNATURES = (
+    (0, b'\xff\xd8\xff', 'images'),                  # JPEG
+    (0, b'\x89PNG\r\n\x1a\n', 'images'),             # PNG
+    (0, b'GIF87a', 'images'),
+    (0, b'GIF89a', 'images'),
+    (0, b'II*\x00', 'images'),                       # TIFF and most camera raw
+    (0, b'MM\x00*', 'images'),
+    (0, b'\x00\x00\x01\x00', 'images'),              # ICO
+    (0, b'\x1a\x45\xdf\xa3', 'videos'),              # Matroska and WebM
+    (0, b'\x30\x26\xb2\x75\x8e\x66\xcf\x11', 'videos'),  # ASF: WMV
+    (0, b'FLV\x01', 'videos'),
+    (0, b'\x00\x00\x01\xba', 'videos'),              # MPEG program stream
+    (0, b'\x00\x00\x01\xb3', 'videos'),              # MPEG-1/2 video
+    (0, b'%PDF-', 'documents'),
+)
+
+# ISO base media brands (the four bytes after 'ftyp') that are still images
+IMAGE_BRANDS = {b'heic', b'heix', b'heim', b'heis', b'hevc', b'mif1', b'msf1', b'avif', b'avis'}
+# ... and those that are audio only: AAC and Apple Lossless, audiobooks,
+# protected iTunes audio, and their Flash equivalents
+AUDIO_BRANDS = {b'M4A ', b'M4B ', b'M4P ', b'F4A ', b'F4B '}
+
+RIFF_TYPES = {b'WEBP': 'images', b'AVI ': 'videos'}
+
+
+def default_type_cache_path():
+    base = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'file_sorter', 'type_cache.sqlite')
+
+
+def sniff_header(header):
+    """Return the category a file's first bytes identify, or None."""
+    for offset, magic, category in SIGNATURES:
+        if header.startswith(magic, offset):
+            return category
+    if header[:2] == b'BM' and len(header) >= 14 and header[6:10] == b'\x00\x00\x00\x00':
+        # BMP: reserved bytes are zero, which rules out most text starting "BM"
+        return 'images'
+    if header[:4] == b'RIFF':
+        return RIFF_TYPES.get(header[8:12])
+    if header[4:8] == b'ftyp':
+        # MP4, QuickTime, 3GP, M4V, M4A and HEIF/AVIF all use ISO boxes
+        brand = header[8:12]
+        if brand in IMAGE_BRANDS:
+            return 'images'
+        return OTHER if brand in AUDIO_BRANDS else 'videos'
+    if header[4:8] in (b'moov', b'mdat', b'wide', b'free'):
+        # Older QuickTime files without an ftyp box
+        return 'videos'
+    if len(header) > 188 and header[0] == 0x47 and header[188] == 0x47:
+        # MPEG transport stream: a sync byte every 188-byte packet
+        return 'videos'
+    return None
+
+
+def sniff_file(path):
+    with open(path, 'rb') as f:
+        return sniff_header(f.read(SNIFF_BYTES))
+
+
+class TypeCache:
+    """SQLite cache of sniffed categories keyed by (path, size, mtime).
+
+    An empty category records that a file matched no signature, so it is
+    not read again until its size or mtime changes. Use it from a single
+    thread.
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or default_type_cache_path()
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS types (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime INTEGER NOT NULL,
+                category TEXT NOT NULL
+            ) WITHOUT ROWID
+        ''')
+
+    def get(self, path, size, mtime):
+        # None when unknown, '' when known to match no signature
+        row = self.conn.execute(
+            'SELECT category FROM types WHERE path = ? AND size = ? AND mtime = ?',
+            (path, size, mtime)).fetchone()
+        return row[0] if row is not None else None
+
+    def put(self, path, size, mtime, category):
+        self.conn.execute('INSERT OR REPLACE INTO types (path, size, mtime, category) VALUES (?, ?, ?, ?)',
+                          (path, size, mtime, category or ''))
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+def sniff_files(files, cache=None, workers=8, read_ahead=None, progress=None, cancel=None):
+    """Classify files by their magic bytes.
+
+    files is a sequence of (key, path, size, mtime). Only the first
+    SNIFF_BYTES of each file are read, in a pool of worker threads, and
+    results are looked up in and saved to cache when one is given. Returns
+    (categories, stats): categories maps key to category for the files whose
+    contents identify one of CATEGORIES; unreadable and unrecognised files
+    are left out. progress, if given, is called as progress(done, total).
+    """
+    read_ahead = read_ahead or workers * 4
+    stats = {'files': len(files), 'cached': 0, 'read': 0, 'recognised': 0, 'cancelled': False}
+    categories = {}
+    jobs = []
+    for key, path, size, mtime in files:
+        known = cache.get(path, size, mtime) if cache is not None else None
+        if known is None:
+            jobs.append((key, (path,)))
+        else:
+            stats['cached'] += 1
+            if known:
+                categories[key] = known
+    by_key = {key: (path, size, mtime) for key, path, size, mtime in files} if cache is not None else None
+
+    done = stats['cached']
+    for done, (key, category) in enumerate(run_bounded(jobs, sniff_file, workers, read_ahead, cancel), done + 1):
+        stats['read'] += 1
+        if category is not None:
+            categories[key] = category
+        if cache is not None:
+            # Unreadable files (None from the pool) are cached as unknown too
+            # and retried once they change
+            cache.put(*by_key[key], category)
+        if progress is not None:
+            progress(done, len(files))
+    if cache is not None:
+        cache.commit()
+    stats['cancelled'] = cancel is not None and cancel.is_set()
+
+    # Signatures may name categories the table no longer has
+    categories = {key: category for key, category in categories.items() if category in CATEGORIES}
+    stats['recognised'] = sum(1 for category in categories.values() if category != OTHER)
+    return categories, stats
@@ -0,0 +1,195 @@
+import os
+
+import numpy as np
+
+from scan_engine import CATEGORIES, classify_extension
+
+_CATEGORY_COLUMN = {category: column for column, category in enumerate(CATEGORIES, 1)}
+
+
+def _normalize(path):
+    # Paths built by os.scandir are already normal apart from a root given
+    # with a trailing or alternative separator, so skip normpath otherwise
+    if path.endswith(os.sep) or (os.altsep and os.altsep in path):
+        return os.path.normpath(path)
+    return path
+
+
+class DirectoryTree:
+    """Recursive size, file and folder totals for every directory scanned.
+
+    Pass each scan batch (one directory's records) to add() as it arrives,
+    which only sums values already in the records, then call finish() with
+    the scan root and the directories visited. Totals are rolled up once
+    into arrays indexed by node id, and each node's children are stored
+    contiguously, so walking into a node is a slice rather than a
+    recomputation. Node 0 is the root.
+    """
+
+    def __init__(self):
+        # Directory -> [bytes, then one file count per category]
+        self._direct = {}
+        self.paths = []
+        self.ids = {}
+        self.parents = np.full(0, -1, dtype=np.int64)
+        self.sizes = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros((0, len(CATEGORIES)), dtype=np.int64)
+        self.folders = np.zeros(0, dtype=np.int64)
+        self.child_start = np.zeros(1, dtype=np.int64)
+        self.child_order = np.zeros(0, dtype=np.int64)
+        self.child_position = np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def add(self, records):
+        if not records:
+            return
+        directory = _normalize(os.path.dirname(records[0][3]))
+        totals = self._direct.get(directory)
+        if totals is None:
+            totals = self._direct[directory] = [0] * (1 + len(CATEGORIES))
+        for record in records:
+            totals[0] += record[2]
+            totals[_CATEGORY_COLUMN[classify_extension(record[1])]] += 1
+
+    def finish(self, root, dirs=()):
+        root = os.path.normpath(root)
+        paths = [root]
+        ids = {root: 0}
+        parents = [-1]
+        sep = os.sep
+        for directory in list(dirs) + list(self._direct):
+            if directory in ids:
+                continue
+            directory = _normalize(directory)
+            # Fast path: scans report parents before children, so the
+            # parent is usually known already
+            parent = ids.get(directory[:directory.rfind(sep)])
+            if parent is None:
+                self._add_node(directory, paths, ids, parents)
+            elif directory not in ids:
+                ids[directory] = len(paths)
+                paths.append(directory)
+                parents.append(parent)
+        self.paths = paths
+        self.ids = ids
+        self.parents = np.array(parents, dtype=np.int64)
+
+        count = len(paths)
+        self.sizes = np.zeros(count, dtype=np.int64)
+        self.counts = np.zeros((count, len(CATEGORIES)), dtype=np.int64)
+        for directory, totals in self._direct.items():
+            node = ids[directory]
+            self.sizes[node] = totals[0]
+            self.counts[node] = totals[1:]
+        self._direct = {}
+        self.folders = np.ones(count, dtype=np.int64)
+        self.folders[0] = 0
+
+        # Roll totals up one depth level at a time, deepest first, so the
+        # whole pass is a few array operations per level
+        depth = self._depths()
+        for level in range(int(depth.max()), 0, -1):
+            nodes = np.flatnonzero(depth == level)
+            np.add.at(self.sizes, self.parents[nodes], self.sizes[nodes])
+            np.add.at(self.counts, self.parents[nodes], self.counts[nodes])
+            np.add.at(self.folders, self.parents[nodes], self.folders[nodes])
+        # Each node counted itself; folders are the descendants only
+        self.folders[1:] -= 1
+        self.sort('size', descending=True)
+        return self
+
+    def _add_node(self, directory, paths, ids, parents):
+        # Add the directory and any ancestors the scan did not report
+        missing = []
+        while directory not in ids:
+            parent_path = os.path.dirname(directory)
+            if parent_path == directory:
+                # Outside the scan root; attach to the root
+                break
+            missing.append(directory)
+            directory = parent_path
+        parent = ids.get(directory, 0)
+        for directory in reversed(missing):
+            node = ids[directory] = len(paths)
+            paths.append(directory)
+            parents.append(parent)
+            parent = node
+
+    def _depths(self):
+        # Pointer jumping: each pass extends every known depth by one level
+        depth = np.zeros(len(self.parents), dtype=np.int64)
+        has_parent = self.parents >= 0
+        while True:
+            updated = np.where(has_parent, depth[np.maximum(self.parents, 0)] + 1, 0)
+            if np.array_equal(updated, depth):
+                return depth
+            depth = updated
+
+    def name(self, node):
+        return os.path.basename(self.paths[node]) or self.paths[node]
+
+    def files(self, node=None):
+        if node is None:
+            return self.counts.sum(axis=1)
+        return int(self.counts[node].sum())
+
+    def children(self, node):
+        return self.child_order[self.child_start[node]:self.child_start[node + 1]]
+
+    def child_count(self, node):
+        return int(self.child_start[node + 1] - self.child_start[node])
+
+    def direct_size(self, node):
+        # Bytes in files directly inside the node, not in subdirectories
+        return int(self.sizes[node] - self.sizes[self.children(node)].sum())
+
+    def sort(self, key='size', descending=True):
+        """Order every node's children by `key`: name, size, files, folders or a category."""
+        if key == 'name':
+            names = [self.name(node).lower() for node in range(len(self))]
+            keys = np.empty(len(names), dtype=np.int64)
+            keys[sorted(range(len(names)), key=names.__getitem__)] = np.arange(len(names))
+        elif key == 'size':
+            keys = self.sizes
+        elif key == 'files':
+            keys = self.files()
+        elif key == 'folders':
+            keys = self.folders
+        else:
+            keys = self.counts[:, CATEGORIES.index(key)]
+        if descending:
+            keys = -keys
+        # Children end up grouped by parent and ordered by key within it
+        order = np.lexsort((keys, self.parents))
+        self.child_order = order[1:]
+        child_counts = np.bincount(self.parents[1:], minlength=len(self))
+        self.child_start = np.concatenate(([0], np.cumsum(child_counts)))
+        self.child_position = np.zeros(len(self), dtype=np.int64)
+        self.child_position[self.child_order] = (
+            np.arange(len(self.child_order)) - self.child_start[self.parents[self.child_order]])
+
+    def adjust(self, records, sign=1, categories=None):
+        """Add (or with sign=-1, remove) files after the tree was built.
+
+        Files are counted in their directory's node, or in the nearest
+        ancestor the tree knows about, and in every ancestor above it.
+        categories, if given, holds each file's category; otherwise it is
+        taken from the extension.
+        """
+        if categories is None:
+            categories = [classify_extension(record[1]) for record in records]
+        for record, category in zip(records, categories):
+            directory = _normalize(os.path.dirname(record[3]))
+            node = self.ids.get(directory)
+            while node is None and os.path.dirname(directory) != directory:
+                directory = os.path.dirname(directory)
+                node = self.ids.get(directory)
+            if node is None:
+                continue
+            column = _CATEGORY_COLUMN[category] - 1
+            while node >= 0:
+                self.sizes[node] += sign * record[2]
+                self.counts[node, column] += sign
+                node = self.parents[node]
@@ -0,0 +1,249 @@
+import hashlib
+import os
+import sqlite3
+
+import numpy as np
+
+from scan_engine import run_bounded
+
+PARTIAL_BYTES = 4096  # Bytes hashed from each end of a file in the partial stage
+READ_CHUNK = 1024 * 1024
+
+
+def default_hash_cache_path():
+    base = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'file_sorter', 'hash_cache.sqlite')
+
+
+def partial_hash(path, size, partial_bytes=PARTIAL_BYTES):
+    """Hash the first and last partial_bytes of a file.
+
+    Returns (digest, bytes_read). Files no larger than two blocks are read
+    whole, so their partial hash is also their full hash.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        head = f.read(partial_bytes)
+        digest.update(head)
+        bytes_read = len(head)
+        if size > 2 * partial_bytes:
+            f.seek(-partial_bytes, os.SEEK_END)
+            tail = f.read(partial_bytes)
+            digest.update(tail)
+            bytes_read += len(tail)
+        elif size > partial_bytes:
+            rest = f.read()
+            digest.update(rest)
+            bytes_read += len(rest)
+    return digest.digest(), bytes_read
+
+
+def full_hash(path):
+    digest = hashlib.blake2b(digest_size=16)
+    bytes_read = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK), b''):
+            digest.update(chunk)
+            bytes_read += len(chunk)
+    return digest.digest(), bytes_read
+
+
+class HashCache:
+    """SQLite cache of partial and full hashes keyed by (path, size, mtime).
+
+    A row only matches while the file's size and mtime are unchanged, so
+    edited files are hashed again. Use it from a single thread.
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or default_hash_cache_path()
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS hashes (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime INTEGER NOT NULL,
+                partial BLOB,
+                full BLOB
+            ) WITHOUT ROWID
+        ''')
+
+    def get(self, path, size, mtime):
+        row = self.conn.execute(
+            'SELECT partial, full FROM hashes WHERE path = ? AND size = ? AND mtime = ?',
+            (path, size, mtime)).fetchone()
+        return row if row is not None else (None, None)
+
+    def put(self, path, size, mtime, partial=None, full=None):
+        self.conn.execute('''
+            INSERT INTO hashes (path, size, mtime, partial, full) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (path) DO UPDATE SET
+                partial = CASE WHEN size = excluded.size AND mtime = excluded.mtime
+                               THEN COALESCE(excluded.partial, partial) ELSE excluded.partial END,
+                full = CASE WHEN size = excluded.size AND mtime = excluded.mtime
+                            THEN COALESCE(excluded.full, full) ELSE excluded.full END,
+                size = excluded.size,
+                mtime = excluded.mtime
+        ''', (path, size, mtime, partial, full))
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+def _linked_inode(path):
+    # (st_dev, st_ino) of a file with several hard links, else None
+    st = os.stat(path)
+    return (st.st_dev, st.st_ino) if st.st_nlink > 1 and st.st_ino else None
+
+
+def _group_by(keys_by_row):
+    groups = {}
+    for row, key in keys_by_row.items():
+        groups.setdefault(key, []).append(row)
+    return [rows for rows in groups.values() if len(rows) > 1]
+
+
+def find_duplicates(store, rows=None, cache=None, workers=4, read_ahead=None,
+                    min_size=1, partial_bytes=PARTIAL_BYTES, progress=None, cancel=None):
+    """Find groups of identical files in a ResultStore.
+
+    Runs in three stages: group by size, then by a hash of each file's first
+    and last partial_bytes, then by a full hash of the files that still
+    collide. Only the last stage reads whole files. Hard links to one inode
+    are the same file, so only the first of them takes part; deleting the
+    others would free nothing. Returns (groups, stats)
+    where groups is a list of lists of store rows, largest waste first, and
+    stats counts the files and bytes handled by each stage. progress, if
+    given, is called as progress(stage, done, total).
+
+    cancel is an optional threading.Event. Once it is set, no further files
+    are read and ([], stats) is returned with stats['cancelled'] true;
+    hashes already computed are still written to the cache.
+    """
+    read_ahead = read_ahead or workers * 2
+    sizes = np.frombuffer(store.sizes, dtype=np.int64)
+    mtimes = np.frombuffer(store.mtimes, dtype=np.int64)
+    if rows is None:
+        rows = np.arange(len(sizes))
+    rows = np.asarray(rows, dtype=np.int64)
+    rows = rows[sizes[rows] >= min_size]
+
+    stats = {
+        'files': int(len(rows)),
+        'total_bytes': int(sizes[rows].sum()),
+        'size_candidates': 0,
+        'candidate_bytes': 0,
+        'hard_links': 0,
+        'partial_hashed': 0,
+        'partial_bytes_read': 0,
+        'full_hashed': 0,
+        'full_bytes_read': 0,
+        'cache_hits': 0,
+        'duplicate_groups': 0,
+        'duplicate_files': 0,
+        'wasted_bytes': 0,
+        'cancelled': False,
+    }
+
+    # Stage 1: only files that share their size with another file can match
+    unique_sizes, inverse, counts = np.unique(sizes[rows], return_inverse=True, return_counts=True)
+    rows = rows[counts[inverse] > 1]
+
+    # Extra links to an inode already among the candidates are dropped, the
+    # lowest row staying; a size left with a single file is no longer a
+    # candidate
+    first_links = {}
+    linked = []
+    jobs = [(row, (store.path(row),)) for row in rows.tolist()]
+    for row, inode in run_bounded(jobs, _linked_inode, workers, read_ahead, cancel):
+        if inode is not None:
+            first = first_links.setdefault(inode, row)
+            if first != row:
+                linked.append(max(first, row))
+                first_links[inode] = min(first, row)
+    if cancel is not None and cancel.is_set():
+        return _cancelled(stats, cache)
+    stats['hard_links'] = len(linked)
+    if linked:
+        rows = np.setdiff1d(rows, linked, assume_unique=True)
+        _, inverse, counts = np.unique(sizes[rows], return_inverse=True, return_counts=True)
+        rows = rows[counts[inverse] > 1]
+    stats['size_candidates'] = int(len(rows))
+    stats['candidate_bytes'] = int(sizes[rows].sum())
+
+    def cached(row):
+        if cache is None:
+            return None, None
+        return cache.get(store.path(row), int(sizes[row]), int(mtimes[row]))
+
+    # Stage 2: hash both ends of each candidate
+    partial_keys = {}
+    jobs = []
+    for row in rows.tolist():
+        partial, _ = cached(row)
+        if partial is not None:
+            stats['cache_hits'] += 1
+            partial_keys[row] = (int(sizes[row]), partial)
+        else:
+            jobs.append((row, (store.path(row), int(sizes[row]), partial_bytes)))
+    for done, (row, result) in enumerate(run_bounded(jobs, partial_hash, workers, read_ahead, cancel), 1):
+        if result is not None:
+            partial_keys[row] = (int(sizes[row]), result[0])
+            stats['partial_bytes_read'] += result[1]
+            if cache is not None:
+                cache.put(store.path(row), int(sizes[row]), int(mtimes[row]), partial=result[0])
+        if progress is not None:
+            progress('partial', done, len(jobs))
+    stats['partial_hashed'] = len(jobs)
+    if cancel is not None and cancel.is_set():
+        return _cancelled(stats, cache)
+
+    # Stage 3: fully hash files whose partial hashes still collide; small
+    # files were read whole in stage 2 and need no second read
+    full_keys = {}
+    jobs = []
+    for group in _group_by(partial_keys):
+        for row in group:
+            size = int(sizes[row])
+            if size <= 2 * partial_bytes:
+                full_keys[row] = partial_keys[row]
+                continue
+            _, full = cached(row)
+            if full is not None:
+                stats['cache_hits'] += 1
+                full_keys[row] = (size, full)
+            else:
+                jobs.append((row, (store.path(row),)))
+    for done, (row, result) in enumerate(run_bounded(jobs, full_hash, workers, read_ahead, cancel), 1):
+        if result is not None:
+            full_keys[row] = (int(sizes[row]), result[0])
+            stats['full_bytes_read'] += result[1]
+            if cache is not None:
+                cache.put(store.path(row), int(sizes[row]), int(mtimes[row]), full=result[0])
+        if progress is not None:
+            progress('full', done, len(jobs))
+    stats['full_hashed'] = len(jobs)
+    if cancel is not None and cancel.is_set():
+        return _cancelled(stats, cache)
+    if cache is not None:
+        cache.commit()
+
+    groups = [sorted(group) for group in _group_by(full_keys)]
+    groups.sort(key=lambda group: int(sizes[group[0]]) * (len(group) - 1), reverse=True)
+    stats['duplicate_groups'] = len(groups)
+    stats['duplicate_files'] = sum(len(group) for group in groups)
+    stats['wasted_bytes'] = sum(int(sizes[group[0]]) * (len(group) - 1) for group in groups)
+    return groups, stats
+
+
+def _cancelled(stats, cache):
+    if cache is not None:
+        cache.commit()
+    stats['cancelled'] = True
+    return [], stats
@@ -0,0 +1,286 @@
+"""Headless scanning and reporting for File Sorter.
+
+Run through file_sorter_new.py, for example:
+
+    python file_sorter_new.py scan /data --format csv > files.csv
+    python file_sorter_new.py top /data -n 1000 --per-category
+    python file_sorter_new.py stats /data /backup
+    python file_sorter_new.py snapshot /data -o monday.fssnap
+    python file_sorter_new.py diff monday.fssnap friday.fssnap -n 50
+    python file_sorter_new.py similar /photos --threshold 8
+    python file_sorter_new.py thumbnails /videos --timeout 20
+
+Only the Qt-free scan engine is imported, so this works on machines with no
+display and without PyQt5 or OpenCV installed; similar and thumbnails also
+need OpenCV.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from datetime import datetime, timezone
+
+from scan_engine import (CATEGORIES, InodeSet, ScanFilter, ScanStats, ScanTelemetry, TopFiles, classify_extension,
+                         iter_files, unique_roots)
+
+COMMANDS = ('scan', 'top', 'stats', 'snapshot', 'diff', 'similar', 'thumbnails')
+FIELDS = ('path', 'name', 'ext', 'category', 'size', 'mtime')
+CHANGE_FIELDS = ('change', 'kind', 'path', 'old_size', 'new_size', 'delta')
+SIMILAR_FIELDS = ('group', 'path', 'category', 'size', 'largest')
+
+
+def file_row(record, mtime):
+    name, ext, size, file_path = record[:4]
+    row = {
+        'path': file_path,
+        'name': name,
+        'ext': ext,
+        'category': classify_extension(ext),
+        'size': size,
+        'mtime': datetime.fromtimestamp(mtime / 1e9, timezone.utc).isoformat(),
+    }
+    if len(record) > 4:
+        row['reclaimable'] = record[4]
+    return row
+
+
+class RowWriter:
+    # Writes rows one at a time as NDJSON or CSV, so nothing is buffered
+    # beyond the output stream itself
+    def __init__(self, out, output_format, fields):
+        self.out = out
+        self.output_format = output_format
+        if output_format == 'csv':
+            self.csv = csv.DictWriter(out, fieldnames=fields, lineterminator='\n')
+            self.csv.writeheader()
+
+    def write(self, row):
+        if self.output_format == 'csv':
+            self.csv.writerow(row)
+        else:
+            self.out.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='file_sorter_new.py',
+        description='Scan directories without the GUI and stream the results.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_common(command):
+        command.add_argument('path', nargs='+',
+                             help='directories to scan; nested and repeated ones are scanned once')
+        command.add_argument('--format', choices=('ndjson', 'csv'), default='ndjson',
+                             help='output format (default: ndjson)')
+        command.add_argument('--workers', type=int, default=1,
+                             help='directory listing threads (default: 1)')
+        command.add_argument('--category', choices=CATEGORIES, action='append',
+                             help='only report files in this category; repeatable')
+        command.add_argument('--exclude', action='append', default=[], metavar='PATTERN',
+                             help="skip folders matching a glob (name, or full path if it contains '/') "
+                                  "or a 're:' regular expression; repeatable")
+        command.add_argument('-x', '--one-file-system', action='store_true',
+                             help='do not descend into other filesystems')
+        command.add_argument('--telemetry', action='store_true',
+                             help='time the scan and write throughput and stat latency as JSON to stderr')
+
+    scan = commands.add_parser('scan', help='stream every file as it is found')
+    add_common(scan)
+    scan.add_argument('--min-size', type=int, default=0, help='skip files smaller than this many bytes')
+
+    top = commands.add_parser('top', help='report the largest files')
+    add_common(top)
+    top.add_argument('-n', '--count', type=int, default=100, help='number of files to keep (default: 100)')
+    top.add_argument('--per-category', action='store_true', help='keep N files per category')
+    top.add_argument('--min-size', type=int, default=0, help='ignore files smaller than this many bytes')
+
+    stats = commands.add_parser('stats', help='report file counts and sizes per category, per root and in total')
+    add_common(stats)
+    for command in (scan, top, stats):
+        command.add_argument('--allocated', action='store_true',
+                             help='also report reclaimable bytes: allocated blocks, counting each hard-linked '
+                                  'file once; top and --min-size then go by them')
+    
+    snapshot = commands.add_parser('snapshot', help='save every file and folder size to a snapshot file')
+    add_common(snapshot)
+    snapshot.add_argument('-o', '--output', required=True, help='snapshot file to write')
+    
+    similar = commands.add_parser('similar', help='group visually similar images and videos')
+    add_common(similar)
+    similar.add_argument('--threshold', type=int, default=None,
+                         help='bits of the 64-bit hash that may differ (default: 6)')
+    similar.add_argument('--algorithm', choices=('dhash', 'phash'), default='dhash',
+                         help='perceptual hash (default: dhash)')
+    similar.add_argument('--processes', type=int, default=None,
+                         help='hashing processes (default: one per CPU)')
+    similar.add_argument('--cache', help='hash cache database (default: the GUI\'s cache)')
+    similar.add_argument('--timeout', type=float, default=None,
+                         help='seconds one file may take to decode before it is given up on (default: 30)')
+    similar.add_argument('--summary', action='store_true', help='write the group counts as JSON to stderr')
+    
+    thumbnails = commands.add_parser('thumbnails',
+                                     help='make the preview thumbnails of images and video contact sheets '
+                                          'ahead of time, e.g. from a scheduled job')
+    add_common(thumbnails)
+    thumbnails.add_argument('--processes', type=int, default=None,
+                            help='rendering processes (default: one per CPU)')
+    thumbnails.add_argument('--timeout', type=float, default=None,
+                            help='seconds one file may take before it is given up on (default: 30)')
+    thumbnails.add_argument('--cache-dir', help='thumbnail cache folder (default: the GUI\'s cache)')
+    thumbnails.add_argument('--cache-limit', type=int, default=None, metavar='MB',
+                            help='disk space the cache folder may use; the least recently used previews '
+                                 'beyond it are deleted (default: 256, as in the GUI)')
+    
+    diff = commands.add_parser('diff', help='list the largest changes between two snapshots')
+    diff.add_argument('old', help='earlier snapshot')
+    diff.add_argument('new', help='later snapshot')
+    diff.add_argument('-n', '--count', type=int, default=100, help='number of changes to list (default: 100)')
+    diff.add_argument('--format', choices=('ndjson', 'csv'), default='ndjson',
+                      help='output format (default: ndjson)')
+    diff.add_argument('--summary', action='store_true', help='write the change counts as JSON to stderr')
+    return parser
+
+
+def main(argv=None, out=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    out = out or sys.stdout
+    if args.command == 'diff':
+        try:
+            return run_diff(args, out)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+    try:
+        args.scan_filter = ScanFilter(args.exclude, args.one_file_system)
+    except ValueError as e:
+        parser.error(str(e))
+    args.telemetry = ScanTelemetry() if args.telemetry else None
+    args.inodes = InodeSet() if getattr(args, 'allocated', False) else None
+    # One root is walked as before; several go through scan_roots
+    args.roots = args.path[0] if len(args.path) == 1 else args.path
+    try:
+        run(args, out)
+    except BrokenPipeError:
+        # Output was closed early, e.g. piped into head; exit quietly
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        return 1
+    if args.telemetry is not None:
+        args.telemetry.finish()
+        sys.stderr.write(json.dumps(args.telemetry.as_dict()) + '\n')
+    return 0
+
+
+def run(args, out):
+    categories = set(args.category) if args.category else None
+
+    def wanted(record):
+        return categories is None or classify_extension(record[1]) in categories
+
+    if args.command == 'scan':
+        writer = RowWriter(out, args.format, FIELDS + ('reclaimable',) if args.allocated else FIELDS)
+        size_field = 4 if args.allocated else 2
+        for record, mtime in iter_files(args.roots, args.workers, scan_filter=args.scan_filter,
+                                        telemetry=args.telemetry, inodes=args.inodes):
+            if record[size_field] >= args.min_size and wanted(record):
+                writer.write(file_row(record, mtime))
+
+    elif args.command == 'top':
+        writer = RowWriter(out, args.format, FIELDS + ('reclaimable',) if args.allocated else FIELDS)
+        # Filter before ranking so --category keeps N files of that category
+        top = TopFiles(args.count, args.per_category, args.min_size, args.allocated)
+        for record, mtime in iter_files(args.roots, args.workers, scan_filter=args.scan_filter,
+                                        telemetry=args.telemetry, inodes=args.inodes):
+            if wanted(record):
+                top.add(record, mtime)
+        for record, mtime in top.results():
+            writer.write(file_row(record, mtime))
+
+    elif args.command == 'snapshot':
+        # The whole result is held in the columnar store, since a snapshot
+        # is sorted by path before it is written
+        from dir_tree import DirectoryTree
+        from result_store import ResultStore
+        from snapshots import save_snapshot
+        store = ResultStore()
+        tree = DirectoryTree()
+        for record, mtime in iter_files(args.roots, args.workers, scan_filter=args.scan_filter,
+                                        telemetry=args.telemetry):
+            if wanted(record):
+                store.append(record, mtime)
+                tree.add([record])
+        roots = unique_roots(args.path) if len(args.path) > 1 else [args.roots]
+        tree.finish(os.path.commonpath(roots) if len(roots) > 1 else roots[0])
+        info = save_snapshot(args.output, store, tree, roots)
+        writer = RowWriter(out, args.format, list(info))
+        writer.write(info)
+
+    elif args.command == 'similar':
+        from result_store import ResultStore
+        from similarity import DEFAULT_THRESHOLD, DEFAULT_TIMEOUT, SimilarityCache, find_similar
+        store = ResultStore()
+        for record, mtime in iter_files(args.roots, args.workers, scan_filter=args.scan_filter,
+                                        telemetry=args.telemetry):
+            if wanted(record):
+                store.append(record, mtime)
+        threshold = DEFAULT_THRESHOLD if args.threshold is None else args.threshold
+        timeout = DEFAULT_TIMEOUT if args.timeout is None else args.timeout
+        cache = SimilarityCache(args.cache)
+        try:
+            groups, summary = find_similar(store, cache=cache, workers=args.processes, threshold=threshold,
+                                           algorithm=args.algorithm, timeout=timeout)
+        finally:
+            cache.close()
+        writer = RowWriter(out, args.format, SIMILAR_FIELDS)
+        for number, group in enumerate(groups, 1):
+            for position, row in enumerate(group):
+                writer.write({'group': number, 'path': store.path(row), 'category': store.category(row),
+                              'size': store[row][2], 'largest': position == 0})
+        if args.summary:
+            sys.stderr.write(json.dumps(summary) + '\n')
+
+    elif args.command == 'thumbnails':
+        from thumbnail_batch import DEFAULT_CACHE_LIMIT, DEFAULT_TIMEOUT, pregenerate
+        kinds = {'images': 'image', 'videos': 'video'}
+        files = []
+        for record, mtime in iter_files(args.roots, args.workers, scan_filter=args.scan_filter,
+                                        telemetry=args.telemetry):
+            kind = kinds.get(classify_extension(record[1]))
+            if kind is not None and wanted(record):
+                files.append((record[3], record[2], mtime, kind))
+        timeout = DEFAULT_TIMEOUT if args.timeout is None else args.timeout
+        cache_limit = DEFAULT_CACHE_LIMIT if args.cache_limit is None else args.cache_limit * 1024 * 1024
+        summary = pregenerate(files, args.cache_dir, args.processes, timeout, cache_limit=cache_limit)
+        writer = RowWriter(out, args.format, list(summary))
+        writer.write(summary)
+
+    else:
+        stats = ScanStats()
+        root_stats = {}
+        for _ in iter_files(args.roots, args.workers, stats, args.scan_filter, args.telemetry, root_stats,
+                            args.inodes):
+            pass
+        rows = [root.as_dict() for root in root_stats.values()]
+        summary = stats.as_dict()
+        if rows:
+            # One row per root, then the total with the root fields empty
+            summary = {**dict.fromkeys(rows[0]), **summary}
+        writer = None
+        for row in rows + [summary]:
+            if categories is not None:
+                row = {key: value for key, value in row.items() if key not in CATEGORIES or key in categories}
+            writer = writer or RowWriter(out, args.format, list(row))
+            writer.write(row)
+
+
+def run_diff(args, out):
+    from snapshots import diff_snapshots
+    changes, summary = diff_snapshots(args.old, args.new, args.count)
+    writer = RowWriter(out, args.format, CHANGE_FIELDS)
+    for change, kind, path, old_size, new_size in changes:
+        writer.write({'change': change, 'kind': kind, 'path': path, 'old_size': old_size,
+                      'new_size': new_size, 'delta': (new_size or 0) - (old_size or 0)})
+    if args.summary:
+        sys.stderr.write(json.dumps(summary) + '\n')
+    return 0
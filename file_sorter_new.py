@@ -1,160 +1,450 @@
 import sys
 import os
+import copy
+import threading
+import time
 from datetime import datetime
-from PyQt5.QtWidgets import (QApplication, QMainWindow, QPushButton, QFileDialog,
-                           QTabWidget, QWidget, QVBoxLayout, QHBoxLayout,
-                           QTableWidget, QTableWidgetItem, QLabel, QHeaderView,
-                           QFrame, QScrollArea, QMessageBox, QProgressDialog)
-from PyQt5.QtCore import Qt, QSize, QThread, pyqtSignal
-from PyQt5.QtGui import QPixmap, QIcon, QImage
-from send2trash import send2trash
-import cv2
-import numpy as np
+from functools import partial
 
-class SizeTableWidgetItem(QTableWidgetItem):
-    def __init__(self, size_in_bytes):
-        self.size_in_bytes = size_in_bytes
-        size_in_mb = size_in_bytes / (1024 * 1024)
-        super().__init__(f"{size_in_mb:.2f} MB")
+# Headless commands only need the Qt-free scan engine, so dispatch them
+# before PyQt5 and OpenCV are imported
+if __name__ == '__main__' and len(sys.argv) > 1:
+    from file_sorter_cli import COMMANDS, main
+    if sys.argv[1] in COMMANDS or sys.argv[1] in ('-h', '--help'):
+        sys.exit(main(sys.argv[1:]))
 
-    def __lt__(self, other):
-        if isinstance(other, SizeTableWidgetItem):
-            return self.size_in_bytes < other.size_in_bytes
-        return super().__lt__(other)
+from PyQt5.QtWidgets import (QApplication, QMainWindow, QPushButton, QFileDialog,
+                           QTabWidget, QWidget, QVBoxLayout, QHBoxLayout,
+                           QTableView, QLabel, QHeaderView,
+                           QFrame, QScrollArea, QMessageBox, QProgressDialog, QProgressBar,
+                           QSpinBox, QCheckBox, QTreeView, QSplitter, QLineEdit)
+from PyQt5.QtCore import Qt, QThread, QTimer, pyqtSignal, QItemSelection, QItemSelectionModel
+from PyQt5.QtGui import QPixmap, QIcon
+from scan_engine import (scan_tree, scan_tree_parallel, scan_roots, unique_roots, relist_directories,
+                         TopFiles, ScanStats, ScanFilter, ScanTelemetry, ProgressThrottle, InodeSet,
+                         classify_extension, CATEGORIES, CATEGORY_LABELS, OTHER)
+from scan_index import ScanIndex, default_index_path
+from content_types import TypeCache, sniff_files, default_type_cache_path
+from thumbnails import ThumbnailService
+from thumbnail_batch import DEFAULT_CACHE_LIMIT
+from fs_watcher import DirectoryWatcher
+from treemap import TreemapWidget
 
 class FileScanner(QThread):
     progress = pyqtSignal(int)  # Signal for progress updates
-    finished = pyqtSignal(list, dict, int)  # Signal for scan completion
+    files_found = pyqtSignal(object)  # ResultStore of the files found since the last batch, when streaming
+    types_found = pyqtSignal(dict)  # Path -> category read from file contents, when streaming
+    finished = pyqtSignal(object, dict, object)  # Store, file counts and total size; no store when streamed
     
-    def __init__(self, path):
+    def __init__(self, path, workers=1, index_path=None, incremental=False,
+                 top_n=0, per_category=False, min_size=0, scan_filter=None,
+                 sniff_content=False, type_cache_path=None, stream=False, allocated=False):
+        from dir_tree import DirectoryTree
         super().__init__()
-        self.path = path
-        self.chunk_size = 100
+        # One root, or a list of roots scanned together (see scan_roots);
+        # the folder tree is rooted at their common parent
+        self.roots = [path] if isinstance(path, str) else unique_roots(path)
+        try:
+            self.path = self.roots[0] if len(self.roots) == 1 else os.path.commonpath(self.roots)
+        except ValueError:
+            # Roots on different drives have no common parent
+            self.path = self.roots[0]
+        self.root_stats = {}  # Root -> RootStats, when scanning several roots
+        self.stream = stream  # Send files to the GUI as they are found instead of building a store
+        self.workers = workers  # More than one worker scans directories in parallel
+        self.index_path = index_path  # Persist results to a ScanIndex when set
+        self.incremental = incremental  # Only re-list directories whose mtime changed
+        self.top_n = top_n  # Keep only the N largest files when non-zero
+        self.per_category = per_category  # Keep N files per category instead of overall
+        self.min_size = min_size  # Smallest file kept in top-N mode, in bytes
+        self.directories = []  # Every directory listed, for watch mode
+        self.tree = DirectoryTree()  # Per-folder totals, built in the same pass
+        self.scan_filter = scan_filter  # Excluded subtrees are never listed
+        self.dirs_skipped = 0
+        self.time_saved = None  # Estimated seconds, when the index knows the skipped subtrees
+        self.telemetry = ScanTelemetry()  # Throughput, stat latency and time per phase
+        self.sniff_content = sniff_content  # Classify 'other' files by their magic bytes
+        self.type_cache_path = type_cache_path
+        self.sniff_stats = None
+        # Count allocated blocks, once per inode, in a Reclaimable column
+        self.allocated = allocated
+        self.reclaimable_size = None  # Total reclaimable bytes, when not streamed
+        self.cancelled = False
+        self.cancel_event = threading.Event()
+        
+    def cancel(self):
+        # Checked between directories; the partial results are still reported
+        self.cancelled = True
+        self.cancel_event.set()
         
     def run(self):
-        files_info = []
-        total_size = 0
-        file_counts = {'images': 0, 'videos': 0, 'documents': 0, 'other': 0}
-        
-        # First count total files
-        total_files = sum(len(files) for _, _, files in os.walk(self.path))
-        processed_files = 0
-        
-        # Now process files in chunks
-        current_chunk = []
-        for root, _, files in os.walk(self.path):
-            for file in files:
-                try:
-                    file_path = os.path.join(root, file)
-                    size = os.path.getsize(file_path)
-                    ext = os.path.splitext(file)[1].lower()
-                    
-                    # Update statistics
-                    total_size += size
-                    if ext in {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}:
-                        file_counts['images'] += 1
-                    elif ext in {'.mp4', '.avi', '.mov', '.mkv', '.wmv'}:
-                        file_counts['videos'] += 1
-                    elif ext in {'.pdf', '.docx', '.txt', '.xlsx', '.pptx'}:
-                        file_counts['documents'] += 1
-                    else:
-                        file_counts['other'] += 1
-                    
-                    current_chunk.append((file, ext, size, file_path))
-                    
-                    # When chunk is full, sort and extend to main list
-                    if len(current_chunk) >= self.chunk_size:
-                        current_chunk.sort(key=lambda x: x[0].lower())
-                        files_info.extend(current_chunk)
-                        current_chunk = []
-                    
-                    processed_files += 1
-                    progress = (processed_files * 100) // total_files
+        from result_store import ResultStore
+        stats = ScanStats()
+        
+        # In top-N mode only a bounded heap is kept, so memory stays O(N)
+        # however large the tree is
+        top_files = TopFiles(self.top_n, self.per_category, self.min_size, self.allocated) if self.top_n else None
+        # Streamed files are stored by the GUI thread, which owns its store;
+        # top-N results are only known at the end, so they are never streamed
+        stream = self.stream and top_files is None
+        files_info = None if stream else ResultStore()
+        # Batches are packed into a small store here, so the GUI thread only
+        # merges arrays
+        pending = ResultStore()
+        batch_throttle = ProgressThrottle(4)
+        files_seen = 0
+        others = []  # Streamed (record, mtime) pairs to classify by content
+        
+        # Single pass over the tree; progress is estimated from directories
+        # visited versus directories still queued, and sent at most 20 times
+        # a second
+        throttle = ProgressThrottle(20)
+        last_progress = 0
+        dirs_visited = 0
+        # Content detection reports the last tenth of the progress
+        scan_share = 90 if self.sniff_content else 100
+        started = time.perf_counter()
+        telemetry = self.telemetry
+        scan_filter = self.scan_filter
+        if scan_filter is not None:
+            try:
+                scan_filter.start(self.roots[0])
+            except OSError:
+                pass
+        # The index connection must be created on the scanning thread. The
+        # index keeps no block counts or inode numbers, so allocated-size
+        # scans list every directory
+        index = ScanIndex(self.index_path) if self.index_path and not self.allocated else None
+        inodes = InodeSet() if self.allocated else None
+        if index is not None and len(self.roots) > 1:
+            batches = index.scan_roots(self.roots, self.incremental, self.workers, self.directories, scan_filter,
+                                       telemetry, self.root_stats)
+        elif index is not None:
+            batches = index.scan(self.path, self.incremental, self.directories, scan_filter, telemetry,
+                                 self.workers)
+        elif len(self.roots) > 1:
+            batches = scan_roots(self.roots, self.workers, self.directories, scan_filter, telemetry,
+                                 self.root_stats, inodes=inodes)
+        elif self.workers > 1:
+            batches = scan_tree_parallel(self.path, self.workers, self.directories, scan_filter, telemetry, inodes)
+        else:
+            batches = scan_tree(self.path, self.directories, scan_filter, telemetry, inodes)
+        with telemetry.phase('scan'):
+            for records, mtimes, dirs_visited, dirs_pending in batches:
+                if self.cancelled:
+                    # Closing the generator stops the workers and commits
+                    # what the index has seen so far
+                    batches.close()
+                    break
+                self.tree.add(records)
+                if stream:
+                    pending.extend(records, mtimes)
+                    if self.sniff_content:
+                        others.extend(pair for pair in zip(records, mtimes) if classify_extension(pair[0][1]) == OTHER)
+                    files_seen += len(records)
+                    if batch_throttle.ready(files_seen):
+                        self.files_found.emit(pending)
+                        pending = ResultStore()
+                elif top_files is None:
+                    files_info.extend(records, mtimes)
+                else:
+                    top_files.extend(records, mtimes)
+                    stats.add(records)
+                
+                progress = (dirs_visited * scan_share) // (dirs_visited + dirs_pending)
+                if progress > last_progress and throttle.ready(progress):
+                    last_progress = progress
                     self.progress.emit(progress)
-                    
-                except (OSError, PermissionError):
-                    continue
+        if len(pending):
+            self.files_found.emit(pending)
+        
+        with telemetry.phase('totals'):
+            if stream:
+                # The GUI keeps running totals as it adds the batches
+                total_size = None
+                file_counts = {}
+            elif top_files is None:
+                # Statistics come straight from the store's columns
+                total_size = files_info.total_size()
+                file_counts = files_info.category_counts()
+                self.reclaimable_size = files_info.total_reclaimable()
+            else:
+                total_size = stats.total_size
+                file_counts = stats.file_counts
+                self.reclaimable_size = stats.reclaimable_size
+                for record, mtime in top_files.results():
+                    files_info.append(record, mtime)
         
-        # Add remaining files
-        if current_chunk:
-            current_chunk.sort(key=lambda x: x[0].lower())
-            files_info.extend(current_chunk)
+        if scan_filter is not None and scan_filter.skipped:
+            self.dirs_skipped = len(scan_filter.skipped)
+            if index is not None:
+                # Estimate from the skipped subtrees' size in earlier scans
+                # and this scan's average time per directory
+                skipped_dirs, _ = index.subtree_counts(scan_filter.skipped)
+                elapsed = time.perf_counter() - started
+                self.time_saved = skipped_dirs * elapsed / max(dirs_visited, 1)
+        if index is not None:
+            index.close()
+        with telemetry.phase('folders'):
+            self.tree.finish(self.path, self.directories)
+        if self.sniff_content and not self.cancelled:
+            # Only files whose extension says nothing are read; those whose
+            # first bytes match a signature move to that category everywhere
+            with telemetry.phase('content types'):
+                if stream:
+                    moved = self.detect_types([(record[3], record[3], record[2], mtime) for record, mtime in others])
+                    by_path = {record[3]: record for record, _ in others}
+                    records = [by_path[path] for path in moved]
+                    self.types_found.emit(moved)
+                else:
+                    rows = files_info.rows_in_category(OTHER)
+                    moved = self.detect_types([(int(row), files_info.path(row), files_info.sizes[row],
+                                                files_info.mtimes[row]) for row in rows])
+                    files_info.set_categories(list(moved), list(moved.values()))
+                    records = [files_info[row] for row in moved]
+                    for category in moved.values():
+                        file_counts[OTHER] -= 1
+                        file_counts[category] += 1
+                self.tree.adjust(records, -1, [OTHER] * len(records))
+                self.tree.adjust(records, 1, list(moved.values()))
+        if files_info is not None:
+            with telemetry.phase('search index'):
+                # Built here so the first search in the GUI is instant
+                files_info.search_index()
+        telemetry.finish()
         
         self.finished.emit(files_info, file_counts, total_size)
+        
+    def detect_types(self, files):
+        # files are (key, path, size, mtime); returns key -> category for
+        # the files whose contents put them outside 'other'
+        throttle = ProgressThrottle(20)
+        
+        def report(done, total):
+            progress = 90 + (done * 10) // total
+            if throttle.ready(progress):
+                self.progress.emit(progress)
+                
+        cache = TypeCache(self.type_cache_path)
+        try:
+            found, self.sniff_stats = sniff_files(files, cache, max(self.workers, 4), progress=report,
+                                                  cancel=self.cancel_event)
+        finally:
+            cache.close()
+        return {key: category for key, category in found.items() if category != OTHER}
 
-class TableUpdater(QThread):
+class DuplicateFinder(QThread):
     progress = pyqtSignal(int)
-    finished = pyqtSignal()
+    finished = pyqtSignal(list, dict)  # Duplicate groups (lists of store rows) and stage stats
     
-    def __init__(self, files_info, tables, file_extensions):
+    def __init__(self, files_info, cache_path=None, workers=4):
         super().__init__()
         self.files_info = files_info
-        self.tables = tables
-        self.file_extensions = file_extensions
-        self.chunk_size = 100
+        self.cache_path = cache_path
+        self.workers = workers
+        self.cancel_event = threading.Event()
+        
+    def cancel(self):
+        # Files already being hashed finish; no new ones are started
+        self.cancel_event.set()
         
     def run(self):
-        total_files = len(self.files_info)
-        processed_files = 0
+        # Partial hashing is the first half of the bar, full hashing the second
+        throttle = ProgressThrottle(20)
         
-        for i in range(0, total_files, self.chunk_size):
-            chunk = self.files_info[i:i + self.chunk_size]
-            
-            # Process each file in the chunk
-            for file, ext, size, file_path in chunk:
-                # Update all files table
-                row = self.tables['all'].rowCount()
-                self.tables['all'].insertRow(row)
-                self.tables['all'].setItem(row, 0, QTableWidgetItem(file))
-                self.tables['all'].setItem(row, 1, QTableWidgetItem(ext))
-                self.tables['all'].setItem(row, 2, SizeTableWidgetItem(size))
-                self.tables['all'].setItem(row, 3, QTableWidgetItem(file_path))
-                
-                # Update category-specific tables
-                if ext in self.file_extensions['image']:
-                    self._add_to_images_table(file, size, file_path)
-                elif ext in self.file_extensions['video']:
-                    self._add_to_videos_table(file, size, file_path)
-                elif ext in self.file_extensions['doc']:
-                    self._add_to_docs_table(file, ext, size, file_path)
-                else:
-                    self._add_to_other_table(file, ext, size, file_path)
-                
-                processed_files += 1
-                progress = (processed_files * 100) // total_files
+        def report(stage, done, total):
+            offset = 0 if stage == 'partial' else 50
+            progress = offset + (done * 50) // max(total, 1)
+            if throttle.ready(progress):
                 self.progress.emit(progress)
         
-        self.finished.emit()
+        from duplicates import find_duplicates, HashCache
+        # The cache connection must be created on the hashing thread
+        cache = HashCache(self.cache_path)
+        try:
+            groups, stats = find_duplicates(self.files_info, cache=cache, workers=self.workers, progress=report,
+                                            cancel=self.cancel_event)
+        finally:
+            cache.close()
+        self.finished.emit(groups, stats)
+
+class SimilarityFinder(QThread):
+    progress = pyqtSignal(int)
+    finished = pyqtSignal(list, dict)  # Groups of similar files (lists of store rows) and stats
     
-    def _add_to_images_table(self, file, size, file_path):
-        row = self.tables['images'].rowCount()
-        self.tables['images'].insertRow(row)
-        self.tables['images'].setItem(row, 0, QTableWidgetItem(file))
-        self.tables['images'].setItem(row, 1, SizeTableWidgetItem(size))
-        self.tables['images'].setItem(row, 2, QTableWidgetItem(file_path))
+    def __init__(self, files_info, threshold, cache_path=None):
+        super().__init__()
+        self.files_info = files_info
+        self.threshold = threshold
+        self.cache_path = cache_path
+        self.cancel_event = threading.Event()
+        
+    def cancel(self):
+        # Files already sent to the worker processes finish; no new ones start
+        self.cancel_event.set()
+        
+    def run(self):
+        throttle = ProgressThrottle(20)
+        
+        def report(done, total):
+            progress = (done * 100) // max(total, 1)
+            if throttle.ready(progress):
+                self.progress.emit(progress)
+        
+        from similarity import find_similar, SimilarityCache
+        # The cache connection must be created on the hashing thread. The
+        # hashing processes are spawned, since forking a process with Qt
+        # and scan threads running is unsafe
+        cache = SimilarityCache(self.cache_path)
+        try:
+            groups, stats = find_similar(self.files_info, cache=cache, threshold=self.threshold, progress=report,
+                                         cancel=self.cancel_event, start_method='spawn')
+        finally:
+            cache.close()
+        self.finished.emit(groups, stats)
+
+class ThumbnailBatcher(QThread):
+    progress = pyqtSignal(int)
+    finished = pyqtSignal(dict)  # Stats of the run
     
-    def _add_to_videos_table(self, file, size, file_path):
-        row = self.tables['videos'].rowCount()
-        self.tables['videos'].insertRow(row)
-        self.tables['videos'].setItem(row, 0, QTableWidgetItem(file))
-        self.tables['videos'].setItem(row, 1, SizeTableWidgetItem(size))
-        self.tables['videos'].setItem(row, 2, QTableWidgetItem(file_path))
+    def __init__(self, files, cache_dir, cache_limit):
+        super().__init__()
+        self.files = files  # (path, size, mtime, kind) of each file
+        self.cache_dir = cache_dir
+        self.cache_limit = cache_limit  # Bytes; the preview cache's own limit
+        self.cancel_event = threading.Event()
+        
+    def cancel(self):
+        # Files being rendered finish; no new ones start
+        self.cancel_event.set()
+        
+    def run(self):
+        throttle = ProgressThrottle(20)
+        
+        def report(done, total):
+            progress = (done * 100) // max(total, 1)
+            if throttle.ready(progress):
+                self.progress.emit(progress)
+        
+        from thumbnail_batch import pregenerate
+        # Spawned, since forking a process with Qt and scan threads running
+        # is unsafe
+        stats = pregenerate(self.files, self.cache_dir, progress=report, cancel=self.cancel_event,
+                            start_method='spawn', cache_limit=self.cache_limit)
+        self.finished.emit(stats)
+
+class SnapshotWorker(QThread):
+    # Saves the results as a snapshot and, given an older snapshot, diffs
+    # it against the new one; emits (info, (changes, summary) or None), or
+    # failed with a message
+    finished = pyqtSignal(dict, object)
+    failed = pyqtSignal(str)
     
-    def _add_to_docs_table(self, file, ext, size, file_path):
-        row = self.tables['docs'].rowCount()
-        self.tables['docs'].insertRow(row)
-        self.tables['docs'].setItem(row, 0, QTableWidgetItem(file))
-        self.tables['docs'].setItem(row, 1, QTableWidgetItem(ext))
-        self.tables['docs'].setItem(row, 2, SizeTableWidgetItem(size))
-        self.tables['docs'].setItem(row, 3, QTableWidgetItem(file_path))
+    def __init__(self, files_info, tree, roots, path, compare_with=None):
+        super().__init__()
+        self.files_info = files_info  # Copies: the window keeps changing its own
+        self.tree = tree
+        self.roots = roots
+        self.path = path
+        self.compare_with = compare_with
+        
+    def run(self):
+        from snapshots import save_snapshot, diff_snapshots
+        try:
+            info = save_snapshot(self.path, self.files_info, self.tree, self.roots)
+            diff = diff_snapshots(self.compare_with, self.path) if self.compare_with else None
+        except (OSError, ValueError) as e:
+            self.failed.emit(str(e))
+            return
+        self.finished.emit(info, diff)
+
+class DirectoryRefresher(QThread):
+    # Listings, gone dirs, added (record, mtime) pairs, new dirs, and path ->
+    # category for listed files whose contents identify one
+    finished = pyqtSignal(dict, list, list, list, dict)
     
-    def _add_to_other_table(self, file, ext, size, file_path):
-        row = self.tables['other'].rowCount()
-        self.tables['other'].insertRow(row)
-        self.tables['other'].setItem(row, 0, QTableWidgetItem(file))
-        self.tables['other'].setItem(row, 1, QTableWidgetItem(ext))
-        self.tables['other'].setItem(row, 2, SizeTableWidgetItem(size))
-        self.tables['other'].setItem(row, 3, QTableWidgetItem(file_path))
+    def __init__(self, paths, known_dirs, scan_filter=None, sniff_content=False, type_cache_path=None, roots=()):
+        super().__init__()
+        self.paths = paths
+        self.known_dirs = known_dirs
+        self.scan_filter = scan_filter
+        self.roots = roots  # The scan's roots; each directory is filtered as part of its own
+        self.sniff_content = sniff_content
+        self.type_cache_path = type_cache_path
+        
+    def run(self):
+        listings, gone, added, new_dirs = relist_directories(self.paths, self.known_dirs, self.scan_filter,
+                                                             self.roots)
+        types = {}
+        if self.sniff_content:
+            # Unchanged files are answered by the cache without being read
+            pairs = [pair for records, mtimes in listings.values() for pair in zip(records, mtimes)]
+            files = [(record[3], record[3], record[2], mtime) for record, mtime in pairs + added
+                     if classify_extension(record[1]) == OTHER]
+            cache = TypeCache(self.type_cache_path)
+            try:
+                types, _ = sniff_files(files, cache)
+            finally:
+                cache.close()
+        self.finished.emit(listings, gone, added, new_dirs, types)
+
+class FileDeleter(QThread):
+    progress = pyqtSignal(int)
+    finished = pyqtSignal(list, list, bool)  # Deleted rows, (path, error) failures, cancelled
+    
+    def __init__(self, files, use_trash=True, batch_size=64):
+        super().__init__()
+        self.files = files  # (row, path) pairs
+        self.use_trash = use_trash
+        self.batch_size = batch_size
+        self.cancelled = False
+        
+    def cancel(self):
+        # Checked between batches; a batch already handed to the OS finishes
+        self.cancelled = True
+        
+    def run(self):
+        deleted, failed = [], []
+        total = len(self.files)
+        throttle = ProgressThrottle(20)
+        for start in range(0, total, self.batch_size):
+            if self.cancelled:
+                break
+            batch = self.files[start:start + self.batch_size]
+            if self.use_trash:
+                self._trash_batch(batch, deleted, failed)
+            else:
+                for row, file_path in batch:
+                    try:
+                        os.remove(file_path)
+                        deleted.append(row)
+                    except OSError as e:
+                        failed.append((file_path, str(e)))
+            progress = ((start + len(batch)) * 100) // total
+            if throttle.ready(progress):
+                self.progress.emit(progress)
+        self.finished.emit(deleted, failed, self.cancelled)
+        
+    def _trash_batch(self, batch, deleted, failed):
+        # One send2trash call moves the whole batch; if it fails, retry file
+        # by file so each error is reported against the right path
+        from send2trash import send2trash
+        try:
+            send2trash([os.path.normpath(file_path) for _, file_path in batch])
+            deleted.extend(row for row, _ in batch)
+            return
+        except Exception:
+            pass
+        for row, file_path in batch:
+            if not os.path.lexists(file_path):
+                # Already moved by the batch call before it failed
+                deleted.append(row)
+                continue
+            try:
+                send2trash(os.path.normpath(file_path))
+                deleted.append(row)
+            except Exception as e:
+                failed.append((file_path, str(e)))
 
 class FileSorterApp(QMainWindow):
     def __init__(self):
@@ -182,29 +472,141 @@ class FileSorterApp(QMainWindow):
         self.select_button.clicked.connect(self.select_directory)
         self.path_label = QLabel("No directory selected")
         
+        # Further roots are scanned together with the selected directory
+        self.add_folder_button = QPushButton("Add Folder")
+        self.add_folder_button.setToolTip("Scan another folder alongside the current ones")
+        self.add_folder_button.clicked.connect(self.add_folder)
+        self.roots = []
+        
+        self.refresh_button = QPushButton("Refresh")
+        self.refresh_button.clicked.connect(self.refresh_directory)
+        
+        self.duplicates_button = QPushButton("Find Duplicates")
+        self.duplicates_button.clicked.connect(self.find_duplicates)
+        
+        self.thumbnails_button = QPushButton("Generate Thumbnails")
+        self.thumbnails_button.setToolTip(
+            "Make previews ahead of time for the images and videos of the current tab (its selected rows, "
+            "or all of them) or of the folder selected in Folders. Videos get a contact sheet of frames.")
+        self.thumbnails_button.clicked.connect(self.generate_thumbnails)
+        self.thumbnail_cache_spin = QSpinBox()
+        self.thumbnail_cache_spin.setRange(16, 1000000)
+        self.thumbnail_cache_spin.setSingleStep(64)
+        self.thumbnail_cache_spin.setValue(DEFAULT_CACHE_LIMIT // (1024 * 1024))
+        self.thumbnail_cache_spin.setPrefix("Preview cache ")
+        self.thumbnail_cache_spin.setSuffix(" MB")
+        self.thumbnail_cache_spin.setToolTip(
+            "Disk space kept for preview thumbnails, by the preview pane and Generate Thumbnails alike; "
+            "the least recently used ones are deleted beyond it.")
+        
+        # Top-N mode: keep only the largest files instead of every file
+        self.top_n_spin = QSpinBox()
+        self.top_n_spin.setRange(0, 1000000)
+        self.top_n_spin.setSingleStep(100)
+        self.top_n_spin.setSpecialValueText("All files")
+        self.top_n_spin.setPrefix("Largest ")
+        self.per_category_check = QCheckBox("Per category")
+        self.min_size_spin = QSpinBox()
+        self.min_size_spin.setRange(0, 1000000)
+        self.min_size_spin.setPrefix("Min ")
+        self.min_size_spin.setSuffix(" MB")
+        
+        # Exclusions prune whole subtrees before they are listed
+        filter_panel = QWidget()
+        filter_layout = QHBoxLayout(filter_panel)
+        filter_layout.setContentsMargins(0, 0, 0, 0)
+        self.exclude_edit = QLineEdit()
+        self.exclude_edit.setPlaceholderText(".git; node_modules; */build; re:^/proc/")
+        self.exclude_edit.setToolTip(
+            "Folders to skip, separated by ';'. Globs match a folder's name, or its full path "
+            "if they contain '/'; prefix a regular expression with 're:'.")
+        self.one_filesystem_check = QCheckBox("Stay on one filesystem")
+        self.sniff_check = QCheckBox("Detect type from content")
+        self.sniff_check.setToolTip(
+            "Read the first bytes of files with unknown extensions, so renamed or extensionless "
+            "images, videos and PDFs land in the right tab. Results are cached.")
+        filter_layout.addWidget(QLabel("Exclude:"))
+        filter_layout.addWidget(self.exclude_edit)
+        self.allocated_check = QCheckBox("Allocated sizes")
+        self.allocated_check.setToolTip(
+            "Also count the disk space files really use: sparse files count only their written blocks "
+            "and hard links to one file count once. Shown in a sortable Reclaimable column.")
+        filter_layout.addWidget(self.one_filesystem_check)
+        filter_layout.addWidget(self.sniff_check)
+        filter_layout.addWidget(self.allocated_check)
+        
+        # Watch mode keeps full-scan results in step with the disk
+        self.watch_check = QCheckBox("Watch for changes")
+        self.watch_check.toggled.connect(self.set_watching)
+        
         top_layout.addWidget(self.select_button)
         top_layout.addWidget(self.path_label)
+        top_layout.addWidget(self.add_folder_button)
+        top_layout.addWidget(self.refresh_button)
+        top_layout.addWidget(self.watch_check)
         top_layout.addStretch()
+        top_layout.addWidget(self.top_n_spin)
+        top_layout.addWidget(self.per_category_check)
+        top_layout.addWidget(self.min_size_spin)
+        top_layout.addWidget(self.duplicates_button)
+        top_layout.addWidget(self.thumbnails_button)
+        top_layout.addWidget(self.thumbnail_cache_spin)
         
-        # Create tab widget
-        self.tabs = QTabWidget()
+        # Search filters every tab through the store's search index; typing
+        # is debounced so a burst of keys costs one search
+        search_panel = QWidget()
+        search_layout = QHBoxLayout(search_panel)
+        search_layout.setContentsMargins(0, 0, 0, 0)
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("Search names; include '/' to search paths; * ? [] for globs")
+        self.search_edit.setClearButtonEnabled(True)
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(150)
+        self.search_timer.timeout.connect(self.apply_search)
+        self.search_edit.textChanged.connect(self.search_timer.start)
+        self.search_edit.returnPressed.connect(self.apply_search)
+        search_layout.addWidget(QLabel("Search:"))
+        search_layout.addWidget(self.search_edit)
         
-        # Create tables for each tab
-        self.all_files_table = self.create_table(["Name", "Type", "Size", "Path"])
-        self.images_table = self.create_table(["Name", "Size", "Path"])
-        self.videos_table = self.create_table(["Name", "Size", "Path"])
-        self.docs_table = self.create_table(["Name", "Type", "Size", "Path"])
-        self.other_files_table = self.create_table(["Name", "Type", "Size", "Path"])
+        # Selection changes are coalesced, so dragging across rows or
+        # selecting everything updates the preview once
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(50)
+        self.preview_timer.timeout.connect(self.update_preview)
         
-        # Add tables to tabs
-        self.tabs.addTab(self.all_files_table, "All Files")
-        self.tabs.addTab(self.images_table, "Images")
-        self.tabs.addTab(self.videos_table, "Videos")
-        self.tabs.addTab(self.docs_table, "Documents")
-        self.tabs.addTab(self.other_files_table, "Other Files")
+        # Create tab widget. Each tab starts as an empty page and is built the
+        # first time it is shown (see build_tab), so the window paints before
+        # the result models, and numpy with them, are loaded
+        self.tabs = QTabWidget()
+        self.file_model = None  # One model holds the scan results; see load_models
+        self.folder_tree = None  # Folder totals of the last scan
+        self.folder_model = None
+        self.changes_model = None
+        self.all_files_table = None
+        self.category_tables = {}
+        self.duplicates_table = None
+        self.similar_panel = None
+        self.similar_table = None
+        self.tab_builders = {'all': ("All Files", partial(self.build_table_tab, None))}
+        for category in CATEGORIES:
+            title = "Other Files" if category == OTHER else CATEGORY_LABELS[category]
+            self.tab_builders[category] = (title, partial(self.build_table_tab, category))
+        self.tab_builders['duplicates'] = ("Duplicates", self.build_duplicates_tab)
+        self.tab_builders['similar'] = ("Similar", self.build_similar_tab)
+        self.tab_builders['folders'] = ("Folders", self.build_folders_tab)
+        self.tab_builders['changes'] = ("Changes", self.build_changes_tab)
+        self.built_tabs = set()
+        for title, _ in self.tab_builders.values():
+            self.tabs.addTab(QWidget(), title)
+        self.tabs.currentChanged.connect(self.build_tab)
+        self.snapshot_worker = None
         
         # Add widgets to left layout
         left_layout.addWidget(top_panel)
+        left_layout.addWidget(filter_panel)
+        left_layout.addWidget(search_panel)
         left_layout.addWidget(self.tabs)
         
         # Right panel for preview
@@ -225,11 +627,11 @@ class FileSorterApp(QMainWindow):
         
         # Multi-selection buttons
         self.open_images_button = QPushButton("Open Selected Images")
-        self.open_images_button.clicked.connect(lambda: self.open_selected_files(self.image_extensions))
+        self.open_images_button.clicked.connect(lambda: self.open_selected_files(('images',)))
         self.open_images_button.hide()
         
         self.open_documents_button = QPushButton("Open Selected Documents")
-        self.open_documents_button.clicked.connect(lambda: self.open_selected_files(self.doc_extensions))
+        self.open_documents_button.clicked.connect(lambda: self.open_selected_files(('documents', OTHER)))
         self.open_documents_button.hide()
         
         self.delete_button = QPushButton("Delete Selected")
@@ -260,130 +662,834 @@ class FileSorterApp(QMainWindow):
         # Add content layout to main layout
         main_layout.addLayout(content_layout)
         
-        # Add status label at bottom
+        # Add status label at bottom, with the scan's progress beside it;
+        # results stay usable while a scan runs
+        status_panel = QWidget()
+        status_layout = QHBoxLayout(status_panel)
+        status_layout.setContentsMargins(0, 0, 0, 0)
+        self.scan_progress_bar = QProgressBar()
+        self.scan_progress_bar.setRange(0, 100)
+        self.scan_progress_bar.setMaximumWidth(200)
+        self.scan_progress_bar.hide()
+        self.cancel_scan_button = QPushButton("Cancel Scan")
+        self.cancel_scan_button.hide()
         self.status_label = QLabel()
         self.status_label.setAlignment(Qt.AlignRight | Qt.AlignVCenter)
         self.status_label.setWordWrap(True)
-        main_layout.addWidget(self.status_label)
+        status_layout.addWidget(self.scan_progress_bar)
+        status_layout.addWidget(self.cancel_scan_button)
+        status_layout.addWidget(self.status_label, stretch=1)
+        main_layout.addWidget(status_panel)
+        
+        # Directory listing is I/O bound, so use more threads than cores
+        self.scan_workers = min(32, (os.cpu_count() or 1) + 4)
+        self.index_path = default_index_path()
+        self.hash_cache_path = None  # HashCache's default location
+        self.similarity_cache_path = None  # SimilarityCache's default location
+        self.type_cache_path = default_type_cache_path()
+        
+        # Totals for the whole scanned tree, kept current as files are deleted
+        self.file_counts = {category: 0 for category in CATEGORIES}
+        self.total_size = 0
+        self.total_reclaimable = None  # Only counted by allocated-size scans
+        self.allocated_sizes = False  # The tables show the Reclaimable column
+        self.dirs_skipped = 0
+        self.time_saved = None
+        self.scan_telemetry = None
+        self.sniff_stats = None
+        self.scan_cancelled = False
+        self.scanner = None
+        self.scanning = False
+        self.root_stats = []  # RootStats per root, when several roots were scanned
+        
+        # Streamed scan batches are applied on a timer that backs off when
+        # applying them gets slow (e.g. a tab sorted by name), so the GUI
+        # stays responsive however fast files arrive
+        self.pending_files = []
+        self.removed_during_scan = []  # (record, category) of files deleted mid-scan
+        self.batch_timer = QTimer(self)
+        self.batch_timer.setSingleShot(True)
+        self.batch_timer.setInterval(250)
+        self.batch_timer.timeout.connect(self.apply_pending_files)
         
-        self.image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
-        self.video_extensions = {'.mp4', '.avi', '.mov', '.mkv', '.wmv'}
-        self.doc_extensions = {'.pdf', '.docx', '.txt', '.xlsx', '.pptx'}
+        # Filesystem events are coalesced and applied to the results in place
+        self.dir_watcher = DirectoryWatcher(parent=self)
+        self.dir_watcher.directories_changed.connect(self.on_directories_changed)
+        self.scanned_dirs = set()
+        self.watchable = False
+        self.unwatched_dirs = 0
+        
+        # Previews are decoded by a background pool with an LRU cache
+        self.thumbnails = ThumbnailService(parent=self)
+        self.thumbnail_cache_spin.valueChanged.connect(
+            lambda megabytes: self.thumbnails.cache.set_disk_limit(megabytes * 1024 * 1024))
+        self.thumbnails.thumbnail_ready.connect(self.on_thumbnail_ready)
+        self.preview_path = None
+        self.preview_kind = None
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.built_tabs:
+            # The current tab is built once the window has been painted, so
+            # the window appears before the result models are loaded
+            QTimer.singleShot(0, lambda: self.build_tab(self.tabs.currentIndex()))
+
+    def build_tab(self, index):
+        # Swap a tab's empty page for its contents the first time it is shown
+        if index < 0:
+            return
+        name = list(self.tab_builders)[index]
+        if name in self.built_tabs:
+            return
+        self.built_tabs.add(name)
+        title, build = self.tab_builders[name]
+        widget = build()
+        current = self.tabs.currentIndex()
+        placeholder = self.tabs.widget(index)
+        self.tabs.blockSignals(True)
+        self.tabs.removeTab(index)
+        self.tabs.insertTab(index, widget, title)
+        self.tabs.setCurrentIndex(current)
+        self.tabs.blockSignals(False)
+        placeholder.deleteLater()
+
+    def show_tab(self, name):
+        # Build (if needed) and select a tab by its key in tab_builders
+        index = list(self.tab_builders).index(name)
+        self.build_tab(index)
+        self.tabs.setCurrentIndex(index)
+        return self.tabs.widget(index)
 
-    def create_table(self, headers):
-        table = QTableWidget()
-        table.setColumnCount(len(headers))
-        table.setHorizontalHeaderLabels(headers)
+    def load_models(self):
+        # The results model, and the result store and numpy behind it, are
+        # created when first needed: a tab is built, a scan starts, or a
+        # search is typed
+        if self.file_model is not None:
+            return
+        from result_models import FileTableModel
+        self.file_model = FileTableModel(self)
+        self.file_model.set_query(self.search_edit.text())
+
+    def build_table_tab(self, category):
+        # Media tabs leave out the Type column
+        self.load_models()
+        if category is None:
+            self.all_files_table = self.create_table(None, (0, 1, 2, 4, 3))
+            return self.all_files_table
+        columns = (0, 2, 4, 3) if category in ('images', 'videos') else (0, 1, 2, 4, 3)
+        self.category_tables[category] = self.create_table(category, columns)
+        return self.category_tables[category]
+
+    def build_duplicates_tab(self):
+        from result_models import DuplicateProxyModel
+        self.load_models()
+        self.duplicates_table = self.create_table(None, None, DuplicateProxyModel(self.file_model))
+        self.duplicates_table.setSortingEnabled(False)
+        return self.duplicates_table
+
+    def build_similar_tab(self):
+        # Review tab for resized, re-encoded and re-saved copies: each group
+        # lists its largest file first, and everything else in the groups
+        # can be selected in one click and deleted
+        from result_models import DuplicateProxyModel
+        self.load_models()
+        self.similar_panel = QWidget()
+        similar_layout = QVBoxLayout(self.similar_panel)
+        similar_buttons = QHBoxLayout()
+        self.find_similar_button = QPushButton("Find Similar Images and Videos")
+        self.find_similar_button.clicked.connect(self.find_similar)
+        self.similar_threshold_spin = QSpinBox()
+        self.similar_threshold_spin.setRange(0, 20)
+        self.similar_threshold_spin.setValue(6)
+        self.similar_threshold_spin.setPrefix("Tolerance ")
+        self.similar_threshold_spin.setToolTip(
+            "How many of the 64 bits of two pictures' hashes may differ; raise it to catch cropped "
+            "or retouched copies, at the risk of grouping pictures that only look alike")
+        self.select_similar_button = QPushButton("Select All But Largest")
+        self.select_similar_button.setToolTip("Select every file in the groups except the largest of each")
+        self.select_similar_button.clicked.connect(self.select_similar_copies)
+        similar_buttons.addWidget(self.find_similar_button)
+        similar_buttons.addWidget(self.similar_threshold_spin)
+        similar_buttons.addWidget(self.select_similar_button)
+        similar_buttons.addStretch()
+        self.similar_summary = QLabel("Group images and videos that look the same, even when they were "
+                                      "resized, re-encoded or saved in another format.")
+        self.similar_summary.setWordWrap(True)
+        self.similar_table = self.create_table(None, None, DuplicateProxyModel(self.file_model))
+        self.similar_table.setSortingEnabled(False)
+        similar_layout.addLayout(similar_buttons)
+        similar_layout.addWidget(self.similar_summary)
+        similar_layout.addWidget(self.similar_table)
+        self.find_similar_button.setEnabled(not self.scanning)
+        return self.similar_panel
+
+    def build_folders_tab(self):
+        # Folder totals as a sortable tree, with a treemap of the selected folder
+        from result_models import DirectoryTreeModel
+        self.folder_model = DirectoryTreeModel(self)
+        self.folder_view = QTreeView()
+        self.folder_view.setModel(self.folder_model)
+        self.folder_view.setSortingEnabled(True)
+        self.folder_view.sortByColumn(1, Qt.DescendingOrder)
+        self.folder_view.setUniformRowHeights(True)
+        self.folder_view.header().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.folder_view.header().setStretchLastSection(False)
+        self.folder_view.selectionModel().currentChanged.connect(
+            lambda current, previous: self.treemap.set_node(max(self.folder_model.node(current), 0)))
+        self.treemap = TreemapWidget()
+        self.treemap.node_clicked.connect(self.select_folder)
+        self.folders_panel = QSplitter(Qt.Vertical)
+        self.folders_panel.addWidget(self.folder_view)
+        self.folders_panel.addWidget(self.treemap)
+        if self.folder_tree is not None:
+            self.set_folder_tree(self.folder_tree)
+        return self.folders_panel
+
+    def build_changes_tab(self):
+        # Snapshots of the results on disk, and what changed between two
+        from result_models import ChangesModel
+        self.changes_panel = QWidget()
+        changes_layout = QVBoxLayout(self.changes_panel)
+        changes_buttons = QHBoxLayout()
+        self.save_snapshot_button = QPushButton("Save Snapshot")
+        self.save_snapshot_button.clicked.connect(self.save_snapshot)
+        self.compare_snapshot_button = QPushButton("Compare With Snapshot...")
+        self.compare_snapshot_button.setToolTip(
+            "Save a snapshot of the current results and list what changed since an earlier one")
+        self.compare_snapshot_button.clicked.connect(self.compare_snapshot)
+        self.changes_summary = QLabel("Save a snapshot now, then compare a later scan with it.")
+        self.changes_summary.setWordWrap(True)
+        changes_buttons.addWidget(self.save_snapshot_button)
+        changes_buttons.addWidget(self.compare_snapshot_button)
+        changes_buttons.addStretch()
+        self.changes_model = ChangesModel(self)
+        self.changes_view = QTableView()
+        self.changes_view.setModel(self.changes_model)
+        self.changes_view.setSortingEnabled(True)
+        self.changes_view.setEditTriggers(QTableView.NoEditTriggers)
+        self.changes_view.setSelectionBehavior(QTableView.SelectRows)
+        self.changes_view.horizontalHeader().setSectionResizeMode(2, QHeaderView.Stretch)
+        changes_layout.addLayout(changes_buttons)
+        changes_layout.addWidget(self.changes_summary)
+        changes_layout.addWidget(self.changes_view)
+        self.set_snapshot_buttons()
+        return self.changes_panel
+
+    def create_table(self, category, columns, proxy=None):
+        from result_models import CategoryProxyModel
+        table = QTableView()
+        table.setModel(proxy or CategoryProxyModel(self.file_model, category, columns))
+        table.model().setParent(table)
         table.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
         table.horizontalHeader().setStretchLastSection(True)
-        table.setSelectionBehavior(QTableWidget.SelectRows)
-        table.setSelectionMode(QTableWidget.ExtendedSelection)  # Allow multiple selection
-        table.setEditTriggers(QTableWidget.NoEditTriggers)
-        table.itemSelectionChanged.connect(self.update_preview)
+        table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        table.setSelectionBehavior(QTableView.SelectRows)
+        table.setSelectionMode(QTableView.ExtendedSelection)  # Allow multiple selection
+        table.setEditTriggers(QTableView.NoEditTriggers)
+        table.selectionModel().selectionChanged.connect(self.preview_timer.start)
         table.setSortingEnabled(True)
+        if proxy is None:
+            self.show_reclaimable_column(table)
         # Add keypress event for delete key
         table.keyPressEvent = lambda event: self.handle_key_press(event, table)
         return table
         
+    def show_reclaimable_column(self, table):
+        # Largest first: streamed scan batches slot in with a cheap numeric
+        # search, and the biggest files found so far stay on top. After an
+        # allocated-size scan that means the most reclaimable
+        from result_models import FileTableModel
+        columns = table.model().columns
+        reclaimable = columns.index(FileTableModel.RECLAIMABLE_COLUMN)
+        table.setColumnHidden(reclaimable, not self.allocated_sizes)
+        size = reclaimable if self.allocated_sizes else columns.index(FileTableModel.SIZE_COLUMN)
+        table.sortByColumn(size, Qt.DescendingOrder)
+
+    def current_table(self):
+        # The file table of the current tab, if it has one; the Similar
+        # tab's table sits in a panel with its controls
+        widget = self.tabs.currentWidget()
+        if widget is not None and widget is self.similar_panel:
+            return self.similar_table
+        return widget if isinstance(widget, QTableView) else None
+        
     def handle_key_press(self, event, table):
         if event.key() == Qt.Key_Delete:
             self.delete_selected_files()
         else:
             # Call the parent class's keyPressEvent for other keys
-            QTableWidget.keyPressEvent(table, event)
+            QTableView.keyPressEvent(table, event)
+    
+    def selected_rows(self, table):
+        # Source rows of the selection as an array. Each selection range is
+        # a slice of the proxy's row array, so selecting every row of a huge
+        # table costs one slice rather than an index per cell
+        import numpy as np
+        if not isinstance(table, QTableView):
+            return np.zeros(0, dtype=np.int64)
+        proxy_rows = table.model().rows
+        parts = [proxy_rows[selected.top():selected.bottom() + 1] for selected in table.selectionModel().selection()]
+        if not parts:
+            return np.zeros(0, dtype=np.int64)
+        # Ctrl+click can leave overlapping ranges
+        return np.unique(np.concatenate(parts)) if len(parts) > 1 else parts[0]
         
     def select_directory(self):
         dir_path = QFileDialog.getExistingDirectory(self, "Select Directory")
         if dir_path:
-            self.path_label.setText(dir_path)
+            self.set_roots([dir_path])
             self.scan_directory(dir_path)
+            
+    def add_folder(self):
+        # Rescans every root; nested or repeated folders are dropped
+        dir_path = QFileDialog.getExistingDirectory(self, "Add Folder")
+        if dir_path:
+            self.set_roots(unique_roots(self.roots + [dir_path]))
+            self.scan_directory(self.roots)
+            
+    def set_roots(self, roots):
+        self.roots = list(roots)
+        self.path_label.setText("; ".join(self.roots) if self.roots else "No directory selected")
+        self.path_label.setToolTip("\n".join(self.roots))
+            
+    def refresh_directory(self):
+        # Pick up changes made outside the app; only directories whose mtime
+        # changed are listed again
+        roots = [root for root in self.roots if os.path.exists(root)]
+        if roots:
+            self.scan_directory(roots if len(roots) > 1 else roots[0], incremental=True)
 
-    def scan_directory(self, path):
-        # Clear all tables
-        for table in [self.all_files_table, self.images_table, self.videos_table, self.docs_table, self.other_files_table]:
-            table.setRowCount(0)
-            table.setSortingEnabled(False)  # Disable sorting while loading
-        
-        # Create progress dialog for file scanning
-        scan_progress = QProgressDialog("Scanning files...", "Cancel", 0, 100, self)
-        scan_progress.setWindowModality(Qt.WindowModal)
-        scan_progress.setAutoClose(True)
-        scan_progress.show()
+    def scan_directory(self, path, incremental=False):
+        from dir_tree import DirectoryTree
+        from result_store import ResultStore
+        try:
+            scan_filter = ScanFilter(self.exclude_edit.text().split(';'), self.one_filesystem_check.isChecked())
+        except ValueError as e:
+            QMessageBox.warning(self, "Invalid Exclusion", str(e))
+            return
+            
+        # Clear all tables; files are added to them as the scan finds them
+        self.load_models()
+        self.file_model.set_files(ResultStore())
+        self.set_folder_tree(DirectoryTree())
+        self.dir_watcher.clear()
+        self.scanned_dirs = set()
+        self.watchable = False
+        self.file_counts = {category: 0 for category in CATEGORIES}
+        self.total_size = 0
+        allocated = self.allocated_check.isChecked()
+        self.total_reclaimable = 0 if allocated else None
+        if allocated != self.allocated_sizes:
+            self.allocated_sizes = allocated
+            for table in [self.all_files_table, *self.category_tables.values()]:
+                if table is not None:
+                    self.show_reclaimable_column(table)
+        self.dirs_skipped = 0
+        self.time_saved = None
+        self.scan_telemetry = None
+        self.sniff_stats = None
+        self.scan_cancelled = False
+        self.root_stats = []
+        self.pending_files = []
+        self.removed_during_scan = []
         
         # Create and start file scanner thread
-        self.scanner = FileScanner(path)
-        self.scanner.progress.connect(scan_progress.setValue)
-        self.scanner.finished.connect(lambda files_info, file_counts, total_size: 
-            self.on_scan_complete(files_info, file_counts, total_size, path))
+        self.scanner = FileScanner(path, self.scan_workers, self.index_path, incremental,
+                                   self.top_n_spin.value(), self.per_category_check.isChecked(),
+                                   self.min_size_spin.value() * 1024 * 1024, scan_filter,
+                                   self.sniff_check.isChecked(), self.type_cache_path, stream=True,
+                                   allocated=allocated)
+        self.scanner.progress.connect(self.scan_progress_bar.setValue)
+        self.scanner.files_found.connect(self.on_files_found)
+        self.scanner.types_found.connect(self.on_types_found)
+        self.scanner.finished.connect(self.on_scan_complete)
+        self.cancel_scan_button.clicked.connect(self.scanner.cancel)
+        self.set_scanning(True)
         self.scanner.start()
+        
+    def set_scanning(self, scanning):
+        # Controls that would start another scan, or read the store from a
+        # worker thread while rows are still being added, wait for the scan
+        self.scanning = scanning
+        self.scan_progress_bar.setValue(0)
+        self.scan_progress_bar.setVisible(scanning)
+        self.cancel_scan_button.setVisible(scanning)
+        if not scanning:
+            self.cancel_scan_button.clicked.disconnect()
+        for widget in (self.select_button, self.add_folder_button, self.refresh_button, self.duplicates_button,
+                       self.thumbnails_button):
+            widget.setEnabled(not scanning)
+        if self.similar_panel is not None:
+            self.find_similar_button.setEnabled(not scanning)
+        self.set_snapshot_buttons()
+        self.update_status()
+        
+    def on_files_found(self, batch):
+        self.pending_files.append(batch)
+        if not self.batch_timer.isActive():
+            self.batch_timer.start()
+            
+    def apply_pending_files(self):
+        import numpy as np
+        self.batch_timer.stop()
+        if not self.pending_files:
+            return
+        started = time.perf_counter()
+        batch = self.pending_files[0]
+        for more in self.pending_files[1:]:
+            batch.merge(more)
+        self.pending_files = []
+        files_info = self.file_model.files_info
+        first = len(files_info)
+        # Sorted tabs insert the new rows in place, so the largest files
+        # found so far stay at the top
+        self.file_model.merge_files(batch)
+        added = np.arange(first, len(files_info))
+        self.total_size += files_info.total_size(added)
+        if self.total_reclaimable is not None:
+            self.total_reclaimable += files_info.total_reclaimable(added) or 0
+        for category, count in files_info.category_counts(added).items():
+            self.file_counts[category] += count
+        # Indexed as rows arrive, so searching is instant when the scan ends
+        files_info.search_index()
+        self.update_status()
+        # Spend at most about a fifth of the time applying batches
+        self.batch_timer.setInterval(max(250, int((time.perf_counter() - started) * 4000)))
+        
+    def on_types_found(self, found):
+        # Files the scan recognised from their contents; rows deleted in the
+        # meantime are no longer found
+        self.apply_pending_files()
+        files_info = self.file_model.files_info
+        paths = list(found)
+        rows = files_info.rows_for_paths(paths)
+        kept = [(int(row), found[path]) for row, path in zip(rows, paths) if row >= 0]
+        if not kept:
+            return
+        self.file_model.set_categories([row for row, _ in kept], [category for _, category in kept])
+        for _, category in kept:
+            self.file_counts[OTHER] -= 1
+            self.file_counts[category] += 1
     
-    def on_scan_complete(self, files_info, file_counts, total_size, path):
-        # Create progress dialog for table updates
-        update_progress = QProgressDialog("Updating tables...", "Cancel", 0, 100, self)
-        update_progress.setWindowModality(Qt.WindowModal)
-        update_progress.setAutoClose(True)
-        update_progress.show()
-        
-        # Create tables dict for the updater
-        tables = {
-            'all': self.all_files_table,
-            'images': self.images_table,
-            'videos': self.videos_table,
-            'docs': self.docs_table,
-            'other': self.other_files_table
-        }
-        
-        # Create file extensions dict
-        extensions = {
-            'image': self.image_extensions,
-            'video': self.video_extensions,
-            'doc': self.doc_extensions
-        }
-        
-        # Create and start table updater thread
-        self.updater = TableUpdater(files_info, tables, extensions)
-        self.updater.progress.connect(update_progress.setValue)
-        self.updater.finished.connect(lambda: self.on_update_complete(file_counts, total_size))
-        self.updater.start()
-    
-    def on_update_complete(self, file_counts, total_size):
-        # Re-enable sorting
-        for table in [self.all_files_table, self.images_table, self.videos_table, self.docs_table, self.other_files_table]:
-            table.setSortingEnabled(True)
+    def on_scan_complete(self, files_info, file_counts, total_size):
+        cancelled = self.scanner.cancelled
+        telemetry = self.scanner.telemetry
+        with telemetry.phase('display'):
+            if files_info is None:
+                # Streamed: the rows are already in the views
+                self.apply_pending_files()
+            else:
+                # The views read rows from the model on demand, so there is
+                # no separate table population pass
+                self.file_model.set_files(files_info)
+                self.file_counts = file_counts
+                self.total_size = total_size
+                self.total_reclaimable = self.scanner.reclaimable_size
+            tree = self.scanner.tree
+            if self.removed_during_scan:
+                records, categories = zip(*self.removed_during_scan)
+                tree.adjust(records, -1, categories)
+                self.removed_during_scan = []
+            self.set_folder_tree(tree)
+        self.dirs_skipped = self.scanner.dirs_skipped
+        self.time_saved = self.scanner.time_saved
+        self.scan_telemetry = telemetry
+        self.sniff_stats = self.scanner.sniff_stats
+        self.scan_cancelled = cancelled
+        self.root_stats = list(self.scanner.root_stats.values()) if len(self.scanner.roots) > 1 else []
+        # Top-N results hold too few files to be kept current file by file,
+        # a cancelled scan never listed some of the tree, and a file
+        # rewritten in place would find its inode already counted
+        self.scanned_dirs = set(self.scanner.directories)
+        self.watchable = self.scanner.top_n == 0 and not cancelled and not self.scanner.allocated
+        self.set_scanning(False)
+        self.set_watching(self.watch_check.isChecked())
+        
+    def set_folder_tree(self, tree):
+        self.folder_tree = tree
+        if self.folder_model is None:
+            # Shown when the Folders tab is built
+            return
+        self.folder_model.set_tree(tree)
+        self.treemap.set_tree(tree)
+        if len(tree):
+            self.folder_view.expand(self.folder_model.index_for_node(0))
+            
+    def select_folder(self, node):
+        # Selecting a folder also zooms the treemap into it
+        index = self.folder_model.index_for_node(node)
+        self.folder_view.setCurrentIndex(index)
+        self.folder_view.scrollTo(index)
+        
+    def set_watching(self, enabled):
+        self.dir_watcher.clear()
+        self.unwatched_dirs = 0
+        if enabled and self.watchable:
+            self.unwatched_dirs = len(self.dir_watcher.watch(sorted(self.scanned_dirs)))
+        self.update_status()
+        
+    def on_directories_changed(self, paths):
+        # Hold further batches until this one has been applied
+        self.dir_watcher.hold()
+        files_info = self.file_model.files_info
+        self.refresher = DirectoryRefresher(paths, set(self.scanned_dirs), self.scanner.scan_filter,
+                                            self.scanner.sniff_content, self.type_cache_path, self.scanner.roots)
+        self.refresher.finished.connect(lambda listings, gone, added, new_dirs, types:
+            self.on_directories_refreshed(files_info, paths, listings, gone, added, new_dirs, types))
+        self.refresher.start()
+        
+    def on_directories_refreshed(self, files_info, paths, listings, gone, added, new_dirs, types):
+        self.dir_watcher.release()
+        if files_info is not self.file_model.files_info or not self.dir_watcher.directories():
+            return
+        if self.dir_watcher.holds:
+            # Rows are being deleted or compared; apply the changes after
+            self.dir_watcher.defer(paths)
+            return
+        
+        stale_rows = files_info.rows_in_directories(gone, recursive=True).tolist()
+        fresh = list(added)
+        for directory, (records, mtimes) in listings.items():
+            rows, pairs = files_info.diff_listing(directory, records, mtimes)
+            stale_rows.extend(rows)
+            fresh.extend(pairs)
+        self.remove_deleted_rows(files_info, stale_rows)
+        self.add_found_files(files_info, fresh, types)
+        
+        if gone:
+            prefixes = tuple(os.path.join(directory, '') for directory in gone)
+            self.scanned_dirs = {directory for directory in self.scanned_dirs
+                                 if directory not in gone and not directory.startswith(prefixes)}
+            self.dir_watcher.unwatch_below(gone)
+        if new_dirs:
+            self.scanned_dirs.update(new_dirs)
+            self.unwatched_dirs += len(self.dir_watcher.watch(new_dirs))
+            self.update_status()
+            
+    def add_found_files(self, files_info, found, types=None):
+        if not found:
+            return
+        records = [record for record, _ in found]
+        types = types or {}
+        categories = [types.get(record[3]) or classify_extension(record[1]) for record in records]
+        for record, category in zip(records, categories):
+            self.total_size += record[2]
+            self.file_counts[category] += 1
+        self.file_model.add_files(records, [mtime for _, mtime in found], categories)
+        self.folder_tree.adjust(records, categories=categories)
+        self.refresh_folders()
+        self.update_status()
+        
+    def apply_search(self):
+        self.search_timer.stop()
+        self.load_models()
+        self.file_model.set_query(self.search_edit.text())
+        self.update_status()
         
-        # Update status label
+    def refresh_folders(self):
+        if self.folder_model is None:
+            return
+        self.folder_model.refresh()
+        self.treemap.relayout()
+        
+    def update_status(self):
+        file_counts = self.file_counts
         total_files = sum(file_counts.values())
         status_text = (
-            f"Directory Statistics: {total_files:,} files ({total_size / (1024*1024*1024):.2f} GB) | "
-            f"Images: {file_counts['images']:,} | "
-            f"Videos: {file_counts['videos']:,} | "
-            f"Documents: {file_counts['documents']:,} | "
-            f"Other: {file_counts['other']:,}"
+            f"Directory Statistics: {total_files:,} files ({self.total_size / (1024*1024*1024):.2f} GB) | "
+            + " | ".join(f"{CATEGORY_LABELS[category]}: {file_counts[category]:,}" for category in CATEGORIES)
         )
+        if self.total_reclaimable is not None:
+            status_text += f" | {self.total_reclaimable / (1024*1024*1024):.2f} GB reclaimable"
+        shown = len(self.file_model.files_info) if self.file_model is not None else 0
+        if shown < total_files:
+            status_text += f" | Showing {shown:,} largest"
+        if self.file_model is not None and self.file_model.matches is not None:
+            status_text += f" | {len(self.file_model.matches):,} matching \"{self.file_model.query}\""
+        if self.dirs_skipped:
+            status_text += f" | Skipped {self.dirs_skipped:,} folders"
+            if self.time_saved is not None:
+                status_text += f" (~{self.time_saved:.1f} s saved)"
+        if self.sniff_stats and self.sniff_stats['recognised']:
+            status_text += f" | {self.sniff_stats['recognised']:,} typed by content"
+        if self.root_stats:
+            status_text += f" | {len(self.root_stats)} roots"
+        if self.scanning:
+            status_text += " | Scanning..."
+        if self.scan_cancelled:
+            status_text += " | Scan cancelled, results are partial"
+        if self.scan_telemetry is not None:
+            summary = self.scan_telemetry.as_dict()
+            status_text += f" | Scanned in {summary['elapsed']:.1f} s ({summary['files_per_s']:,.0f} files/s)"
+            self.status_label.setToolTip(self.telemetry_text(summary) + self.root_stats_text())
+        if self.watch_check.isChecked():
+            if self.scan_cancelled:
+                status_text += " | Not watching (cancelled scan)"
+            elif not self.watchable:
+                reason = "allocated sizes" if self.scanner is not None and self.scanner.allocated else "top-N results"
+                status_text += f" | Not watching ({reason})"
+            elif self.unwatched_dirs:
+                status_text += f" | Watching ({self.unwatched_dirs:,} folders could not be watched)"
+            else:
+                status_text += " | Watching"
         self.status_label.setText(status_text)
+        
+    def telemetry_text(self, summary):
+        # Full scan telemetry, shown as the status bar's tooltip
+        lines = [
+            f"{summary['files']:,} files in {summary['dirs']:,} folders "
+            f"({summary['dirs_cached']:,} served from the index)",
+            f"{summary['files_per_s']:,.0f} files/s, {summary['dirs_per_s']:,.0f} folders/s",
+            f"stat: {summary['stat_calls']:,} calls, mean {summary['stat_mean_us']:.1f} us, "
+            f"p50 <= {summary['stat_p50_us']} us, p99 <= {summary['stat_p99_us']} us",
+        ]
+        lines.extend(f"  {bucket} us: {count:,}" for bucket, count in summary['stat_histogram_us'].items())
+        lines.append("Phases: " + ", ".join(f"{name} {seconds:.2f} s" for name, seconds in summary['phases'].items()))
+        return "\n".join(lines)
 
+    def root_stats_text(self):
+        # Per-root lines appended to the telemetry tooltip
+        lines = ["", "Roots:"] if self.root_stats else []
+        for stats in self.root_stats:
+            summary = stats.as_dict()
+            elapsed = f", {summary['elapsed']:.1f} s" if summary['elapsed'] is not None else ""
+            lines.append(f"  {stats.root}: {summary['files']:,} files, "
+                         f"{summary['total_size'] / (1024*1024*1024):.2f} GB, {summary['dirs']:,} folders, "
+                         f"{stats.workers} thread{'s' if stats.workers != 1 else ''}{elapsed}")
+        return "\n".join(lines)
+        
+    def set_snapshot_buttons(self):
+        # Snapshots copy the results, so they wait for the scan to finish
+        if self.changes_model is None:
+            return
+        enabled = (not self.scanning and self.snapshot_worker is None and self.file_model is not None
+                   and len(self.file_model.files_info) > 0)
+        self.save_snapshot_button.setEnabled(enabled)
+        self.compare_snapshot_button.setEnabled(enabled)
+        
+    def default_snapshot_path(self):
+        name = "scan"
+        if self.scanner is not None:
+            name = os.path.basename(self.scanner.path.rstrip(os.sep)) or "root"
+        from snapshots import default_snapshot_dir
+        return os.path.join(default_snapshot_dir(), f"{name}-{datetime.now():%Y%m%d-%H%M%S}.fssnap")
+        
+    def save_snapshot(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Save Snapshot", self.default_snapshot_path(),
+                                              "Snapshots (*.fssnap)")
+        if path:
+            self.start_snapshot(path)
+            
+    def compare_snapshot(self):
+        # The current results are saved to the snapshot folder first, so
+        # they can be compared with later scans in turn
+        from snapshots import default_snapshot_dir
+        old_path, _ = QFileDialog.getOpenFileName(self, "Compare With Snapshot", default_snapshot_dir(),
+                                                  "Snapshots (*.fssnap)")
+        if old_path:
+            self.start_snapshot(self.default_snapshot_path(), old_path)
+            
+    def start_snapshot(self, path, compare_with=None):
+        # The store and folder totals are copied here, which is a few array
+        # copies; paths are sorted and compressed on the worker thread
+        from result_store import ResultStore
+        files_info = ResultStore()
+        files_info.merge(self.file_model.files_info)
+        tree = copy.copy(self.folder_tree)
+        tree.sizes = tree.sizes.copy()
+        roots = self.scanner.roots if self.scanner else []
+        self.snapshot_worker = SnapshotWorker(files_info, tree, roots, path, compare_with)
+        self.snapshot_worker.finished.connect(self.on_snapshot_done)
+        self.snapshot_worker.failed.connect(self.on_snapshot_failed)
+        self.set_snapshot_buttons()
+        self.changes_summary.setText("Saving snapshot..." if compare_with is None else "Comparing snapshots...")
+        self.snapshot_worker.start()
+        
+    def on_snapshot_failed(self, message):
+        self.snapshot_worker = None
+        self.set_snapshot_buttons()
+        self.changes_summary.setText("Snapshot failed")
+        QMessageBox.warning(self, "Snapshot Failed", message)
+        
+    def on_snapshot_done(self, info, diff):
+        self.snapshot_worker = None
+        self.set_snapshot_buttons()
+        saved = f"Saved {info['files']:,} files and {info['dirs']:,} folders to {info['path']}"
+        if diff is None:
+            self.changes_summary.setText(saved)
+            return
+        changes, summary = diff
+        self.changes_model.set_changes(changes)
+        self.changes_view.sortByColumn(5, Qt.DescendingOrder)
+        gigabytes = 1024 * 1024 * 1024
+        old_time = datetime.fromtimestamp(summary['old']['created']).strftime('%Y-%m-%d %H:%M')
+        self.changes_summary.setText(
+            f"Since {old_time}: {summary['files_added']:,} files added "
+            f"({summary['bytes_added'] / gigabytes:.2f} GB), {summary['files_removed']:,} removed "
+            f"({summary['bytes_removed'] / gigabytes:.2f} GB), {summary['files_grown']:,} grown, "
+            f"{summary['files_shrunk']:,} shrunk, net {summary['net_bytes'] / gigabytes:+.2f} GB | "
+            f"{summary['dirs_added']:,} folders added, {summary['dirs_removed']:,} removed | "
+            f"Showing the {len(changes):,} largest changes, compared in {summary['elapsed']:.1f} s\n{saved}")
+        self.show_tab('changes')
+
+    def find_duplicates(self):
+        if self.file_model is None or len(self.file_model.files_info) == 0:
+            return
+        
+        dup_progress = QProgressDialog("Finding duplicates...", "Cancel", 0, 100, self)
+        dup_progress.setWindowModality(Qt.WindowModal)
+        dup_progress.setAutoClose(True)
+        dup_progress.show()
+        
+        # Rows must not change while they are being compared
+        self.dir_watcher.hold()
+        self.duplicate_finder = DuplicateFinder(self.file_model.files_info, self.hash_cache_path)
+        self.duplicate_finder.progress.connect(dup_progress.setValue)
+        dup_progress.canceled.connect(self.duplicate_finder.cancel)
+        self.duplicate_finder.finished.connect(lambda groups, stats:
+            self.on_duplicates_found(groups, stats, dup_progress))
+        self.duplicate_finder.start()
+        
+    def on_duplicates_found(self, groups, stats, dup_progress):
+        dup_progress.close()
+        self.dir_watcher.release()
+        if stats['cancelled']:
+            self.status_label.setText("Duplicate search cancelled; hashes computed so far are cached")
+            return
+        self.show_tab('duplicates').model().set_groups(groups)
+        
+        # Report how much reading the size and partial-hash stages avoided
+        bytes_read = stats['partial_bytes_read'] + stats['full_bytes_read']
+        status_text = (
+            f"Duplicates: {stats['duplicate_groups']:,} groups, {stats['duplicate_files']:,} files, "
+            f"{stats['wasted_bytes'] / (1024*1024*1024):.2f} GB reclaimable | "
+            f"Read {bytes_read / (1024*1024):.1f} MB of {stats['candidate_bytes'] / (1024*1024):.1f} MB "
+            f"same-size candidates ({stats['cache_hits']:,} cached hashes)"
+        )
+        if stats['hard_links']:
+            status_text += f" | {stats['hard_links']:,} extra hard links skipped"
+        self.status_label.setText(status_text)
+        
+    def find_similar(self):
+        if self.file_model is None or len(self.file_model.files_info) == 0:
+            return
+        
+        similar_progress = QProgressDialog("Finding similar images and videos...", "Cancel", 0, 100, self)
+        similar_progress.setWindowModality(Qt.WindowModal)
+        similar_progress.setAutoClose(True)
+        similar_progress.show()
+        
+        # Rows must not change while they are being compared
+        self.dir_watcher.hold()
+        self.similarity_finder = SimilarityFinder(self.file_model.files_info, self.similar_threshold_spin.value(),
+                                                  self.similarity_cache_path)
+        self.similarity_finder.progress.connect(similar_progress.setValue)
+        similar_progress.canceled.connect(self.similarity_finder.cancel)
+        self.similarity_finder.finished.connect(lambda groups, stats:
+            self.on_similar_found(groups, stats, similar_progress))
+        self.similarity_finder.start()
+        
+    def on_similar_found(self, groups, stats, similar_progress):
+        similar_progress.close()
+        self.dir_watcher.release()
+        if stats['cancelled']:
+            self.similar_summary.setText("Search cancelled; hashes computed so far are cached")
+            return
+        self.similar_table.model().set_groups(groups)
+        self.show_tab('similar')
+        self.similar_summary.setText(
+            f"{stats['similar_groups']:,} groups, {stats['similar_files']:,} files, "
+            f"{stats['reclaimable_bytes'] / (1024*1024*1024):.2f} GB reclaimable by keeping the largest "
+            f"of each | Compared {stats['images']:,} images and {stats['videos']:,} videos: "
+            f"{stats['hashed']:,} hashed, {stats['cache_hits']:,} cached, {stats['unreadable']:,} unreadable, "
+            f"{stats['timed_out']:,} timed out, in {stats['elapsed']:.1f} s")
+        
+    def generate_thumbnails(self):
+        # The images and videos of the current tab: its selected rows, or
+        # every row it shows; on the Folders tab, the selected folder's files
+        if self.file_model is None or len(self.file_model.files_info) == 0:
+            return
+        import numpy as np
+        files_info = self.file_model.files_info
+        table = self.current_table()
+        if self.folder_model is not None and self.tabs.currentWidget() is self.folders_panel:
+            node = max(self.folder_model.node(self.folder_view.currentIndex()), 0)
+            rows = files_info.rows_in_directories([self.folder_tree.paths[node]], recursive=True)
+        elif table is not None:
+            rows = self.selected_rows(table)
+            if not len(rows):
+                rows = np.asarray(table.model().rows)
+        else:
+            rows = None
+        files = []
+        for category, kind in (('images', 'image'), ('videos', 'video')):
+            for row in files_info.rows_in_category(category, rows).tolist():
+                files.append((files_info.path(row), files_info.sizes[row], files_info.mtimes[row], kind))
+        if not files:
+            self.status_label.setText("No images or videos to make thumbnails for")
+            return
+        
+        thumbnail_progress = QProgressDialog(f"Generating thumbnails for {len(files):,} files...", "Cancel",
+                                             0, 100, self)
+        thumbnail_progress.setWindowModality(Qt.WindowModal)
+        thumbnail_progress.setAutoClose(True)
+        thumbnail_progress.show()
+        
+        self.thumbnail_batcher = ThumbnailBatcher(files, self.thumbnails.cache.cache_dir,
+                                                  self.thumbnails.cache.disk_limit)
+        self.thumbnail_batcher.progress.connect(thumbnail_progress.setValue)
+        thumbnail_progress.canceled.connect(self.thumbnail_batcher.cancel)
+        self.thumbnail_batcher.finished.connect(lambda stats:
+            self.on_thumbnails_generated(stats, thumbnail_progress))
+        self.thumbnail_batcher.start()
+        
+    def on_thumbnails_generated(self, stats, thumbnail_progress):
+        thumbnail_progress.close()
+        # The batch added and evicted files behind the preview cache's back
+        self.thumbnails.cache.reload_disk()
+        status_text = (
+            f"Thumbnails{' (cancelled)' if stats['cancelled'] else ''}: {stats['generated']:,} generated, "
+            f"{stats['cached']:,} already cached, {stats['failed']:,} unreadable, "
+            f"{stats['timed_out']:,} timed out, in {stats['elapsed']:.1f} s")
+        if stats['over_limit']:
+            status_text += (f" | More than the {self.thumbnail_cache_spin.value():,} MB preview cache holds: "
+                            f"{stats['evicted']:,} previews deleted, some of this batch's among them")
+        self.status_label.setText(status_text)
+        
+    def select_similar_copies(self):
+        # Rows of each group are consecutive, largest first
+        table = self.similar_table
+        model = table.model()
+        selection = QItemSelection()
+        start = 0
+        for group in model.groups:
+            if len(group) > 1:
+                selection.select(model.index(start + 1, 0), model.index(start + len(group) - 1, model.columnCount() - 1))
+            start += len(group)
+        table.selectionModel().select(selection, QItemSelectionModel.ClearAndSelect)
+        table.setFocus()
+        
     def update_preview(self):
-        current_table = self.tabs.currentWidget()
-        selected_items = current_table.selectedItems()
+        self.preview_timer.stop()
+        selected_rows = self.selected_rows(self.current_table())
         
-        if not selected_items:
+        if not len(selected_rows):
             self.clear_preview()
             return
         
-        # Get number of selected rows (divide by column count to get actual row count)
-        selected_rows = len(selected_items) // current_table.columnCount()
-        
         # Show delete button for any number of selected files
         self.delete_button.setVisible(True)
         
         # Handle multiple selection
-        if selected_rows > 1:
-            self.show_multiple_selection_preview(current_table, selected_items)
+        if len(selected_rows) > 1:
+            self.show_multiple_selection_preview(selected_rows)
             return
             
-        # Single file preview
-        row = current_table.row(selected_items[0])
-        file_path = current_table.item(row, current_table.columnCount() - 1).text()
+        # Single file preview; the category may come from the file's
+        # contents rather than its extension
+        files_info = self.file_model.files_info
+        file_path = files_info.path(int(selected_rows[0]))
+        category = files_info.category(int(selected_rows[0]))
         
         if not os.path.exists(file_path):
             self.clear_preview()
@@ -402,12 +1508,12 @@ class FileSorterApp(QMainWindow):
         self.file_type.setText(f"Type: {file_ext}")
         
         # Handle preview and buttons based on file type
-        if file_ext in self.image_extensions:
-            self.show_image_preview(file_path)
+        if category == 'images':
+            self.show_image_preview(file_path, file_stats)
             self.open_images_button.setVisible(True)
             self.open_documents_button.hide()
-        elif file_ext in self.video_extensions:
-            self.show_video_preview(file_path)
+        elif category == 'videos':
+            self.show_video_preview(file_path, file_stats)
             self.open_images_button.hide()
             self.open_documents_button.hide()
         else:
@@ -415,42 +1521,27 @@ class FileSorterApp(QMainWindow):
             self.open_images_button.hide()
             self.open_documents_button.setVisible(True)
             
-    def show_multiple_selection_preview(self, table, selected_items):
+    def show_multiple_selection_preview(self, selected_rows):
         # Clear single-file preview elements
+        self.cancel_thumbnail()
         self.preview_image.clear()
         self.play_button.hide()
         
-        # Get unique selected rows
-        selected_rows = set()
-        file_types = {'images': 0, 'videos': 0, 'documents': 0, 'other': 0}
-        selected_files = []
-        
-        for item in selected_items:
-            row = table.row(item)
-            if row not in selected_rows:
-                selected_rows.add(row)
-                file_path = table.item(row, table.columnCount() - 1).text()
-                if os.path.exists(file_path):
-                    selected_files.append(file_path)
-                    ext = os.path.splitext(file_path)[1].lower()
-                    
-                    if ext in self.image_extensions:
-                        file_types['images'] += 1
-                    elif ext in self.video_extensions:
-                        file_types['videos'] += 1
-                    elif ext in self.doc_extensions:
-                        file_types['documents'] += 1
-                    else:
-                        file_types['other'] += 1
-        
-        # Calculate total size
-        total_size = sum(os.path.getsize(f) for f in selected_files if os.path.exists(f))
+        # Totals come from the scan's columns, with no disk access; files
+        # changed since are corrected by watch mode or a refresh
+        files_info = self.file_model.files_info
+        file_types = files_info.category_counts(selected_rows)
+        total_size = files_info.total_size(selected_rows)
+        reclaimable = files_info.total_reclaimable(selected_rows)
         
         # Update preview info for multiple files
-        self.file_title.setText(f"Selected: {len(selected_rows)} files")
-        self.file_size.setText(f"Total Size: {total_size / (1024 * 1024):.2f} MB")
-        self.file_type.setText(f"Types: {file_types['images']} images, {file_types['videos']} videos, "
-                             f"{file_types['documents']} documents, {file_types['other']} other")
+        self.file_title.setText(f"Selected: {len(selected_rows):,} files")
+        size_text = f"Total Size: {total_size / (1024 * 1024):.2f} MB"
+        if reclaimable is not None:
+            size_text += f" ({reclaimable / (1024 * 1024):.2f} MB reclaimable)"
+        self.file_size.setText(size_text)
+        self.file_type.setText("Types: " + ", ".join(
+            f"{file_types[category]:,} {CATEGORY_LABELS[category].lower()}" for category in CATEGORIES))
         self.file_datetime.clear()
         
         # Show/hide appropriate buttons based on selection
@@ -459,106 +1550,64 @@ class FileSorterApp(QMainWindow):
         # Only show type-specific buttons if all selected files are of the same type
         if non_zero_types == 1:
             self.open_images_button.setVisible(file_types['images'] > 0)
-            self.open_documents_button.setVisible(file_types['documents'] > 0 or file_types['other'] > 0)
+            self.open_documents_button.setVisible(file_types['documents'] > 0 or file_types[OTHER] > 0)
         else:
             self.open_images_button.hide()
             self.open_documents_button.hide()
             
         self.delete_button.setVisible(True)
         
-    def open_selected_files(self, filter_extensions=None):
-        current_table = self.tabs.currentWidget()
-        selected_items = current_table.selectedItems()
+    def open_selected_files(self, filter_categories=None):
+        selected_rows = self.selected_rows(self.current_table())
         
-        if not selected_items:
+        if not len(selected_rows):
             return
             
-        # Get unique selected rows
-        selected_rows = set()
-        for item in selected_items:
-            selected_rows.add(current_table.row(item))
-            
-        # Open each selected file
-        for row in selected_rows:
-            file_path = current_table.item(row, current_table.columnCount() - 1).text()
-            if not os.path.exists(file_path):
-                continue
-                
-            if filter_extensions:
-                ext = os.path.splitext(file_path)[1].lower()
-                if ext not in filter_extensions:
-                    continue
-                    
-            os.startfile(file_path)
+        # Filter by category on the store's columns, then open each file
+        import numpy as np
+        files_info = self.file_model.files_info
+        if filter_categories:
+            selected_rows = np.concatenate([files_info.rows_in_category(category, selected_rows)
+                                            for category in filter_categories])
+        for row in selected_rows.tolist():
+            file_path = files_info.path(row)
+            if os.path.exists(file_path):
+                os.startfile(file_path)
 
-    def show_image_preview(self, file_path):
+    def show_image_preview(self, file_path, file_stats):
         self.play_button.hide()
-        pixmap = QPixmap(file_path)
-        scaled_pixmap = pixmap.scaled(QSize(280, 280), Qt.KeepAspectRatio, Qt.SmoothTransformation)
-        self.preview_image.setPixmap(scaled_pixmap)
-        
-    def get_video_thumbnail(self, video_path):
-        try:
-            # Open the video file
-            cap = cv2.VideoCapture(video_path)
-            if not cap.isOpened():
-                return None
-
-            # Get total frames
-            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            if total_frames == 0:
-                return None
-
-            # Seek to a frame about 1/3 through the video
-            target_frame = total_frames // 3
-            cap.set(cv2.CAP_PROP_POS_FRAMES, target_frame)
-
-            # Read the frame
-            ret, frame = cap.read()
-            cap.release()
-
-            if not ret:
-                return None
-
-            # Convert frame from BGR to RGB
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
-            # Resize frame while maintaining aspect ratio
-            height, width = frame_rgb.shape[:2]
-            max_size = 256
-            if width > height:
-                new_width = max_size
-                new_height = int(height * (max_size / width))
-            else:
-                new_height = max_size
-                new_width = int(width * (max_size / height))
-
-            frame_resized = cv2.resize(frame_rgb, (new_width, new_height))
-
-            # Convert numpy array to QImage
-            height, width, channel = frame_resized.shape
-            bytes_per_line = 3 * width
-            q_image = QImage(frame_resized.data, width, height, bytes_per_line, QImage.Format_RGB888)
-            
-            return QPixmap.fromImage(q_image)
-        except Exception as e:
-            print(f"Error generating video thumbnail: {str(e)}")
-            return None
-
-    def show_video_preview(self, file_path):
-        # Try to get video thumbnail
-        thumbnail = self.get_video_thumbnail(file_path)
+        self.request_thumbnail(file_path, file_stats, 'image')
         
-        if thumbnail:
-            self.preview_image.setPixmap(thumbnail)
+    def request_thumbnail(self, file_path, file_stats, kind):
+        # Thumbnails are generated off the GUI thread; a cached one is shown
+        # immediately, otherwise on_thumbnail_ready fills it in later
+        self.preview_path = file_path
+        self.preview_kind = kind
+        thumbnail = self.thumbnails.request(file_path, file_stats.st_size, file_stats.st_mtime_ns, kind)
+        if thumbnail is not None:
+            self.on_thumbnail_ready(file_path, thumbnail)
         else:
+            self.preview_image.clear()
+        
+    def on_thumbnail_ready(self, file_path, thumbnail):
+        if file_path != self.preview_path:
+            return
+        if not thumbnail.isNull():
+            self.preview_image.setPixmap(QPixmap.fromImage(thumbnail))
+        elif self.preview_kind == 'video':
             # Fallback to generic icon if thumbnail generation fails
             self.preview_image.setPixmap(QIcon.fromTheme("video-x-generic").pixmap(128, 128))
+        else:
+            self.preview_image.clear()
+
+    def show_video_preview(self, file_path, file_stats):
+        self.request_thumbnail(file_path, file_stats, 'video')
             
         self.play_button.show()
         self.play_button.setProperty("file_path", file_path)
         
     def show_file_icon(self, file_ext):
+        self.cancel_thumbnail()
         self.play_button.hide()
         icon_name = "text-x-generic"
         if file_ext in {'.pdf'}:
@@ -569,7 +1618,12 @@ class FileSorterApp(QMainWindow):
             icon_name = "application-vnd.ms-excel"
         self.preview_image.setPixmap(QIcon.fromTheme(icon_name).pixmap(128, 128))
         
+    def cancel_thumbnail(self):
+        self.preview_path = None
+        self.thumbnails.cancel()
+        
     def clear_preview(self):
+        self.cancel_thumbnail()
         self.preview_image.clear()
         self.file_title.clear()
         self.file_datetime.clear()
@@ -587,76 +1641,65 @@ class FileSorterApp(QMainWindow):
             os.startfile(file_path)
 
     def delete_selected_files(self):
-        current_table = self.tabs.currentWidget()
-        selected_items = current_table.selectedItems()
+        current_table = self.current_table()
+        selected_rows = self.selected_rows(current_table)
         
-        if not selected_items:
+        if not len(selected_rows):
             return
             
-        # Get unique selected rows and file paths
-        selected_rows = set()
-        file_paths = []
-        for item in selected_items:
-            row = current_table.row(item)
-            if row not in selected_rows:
-                selected_rows.add(row)
-                file_path = current_table.item(row, current_table.columnCount() - 1).text()
-                if os.path.exists(file_path):
-                    file_paths.append(file_path)
-        
-        if not file_paths:
+        # Rows whose files are already gone are dropped without asking
+        files_info = self.file_model.files_info
+        files, missing = [], []
+        for row in selected_rows.tolist():
+            file_path = files_info.path(row)
+            if os.path.exists(file_path):
+                files.append((row, file_path))
+            else:
+                missing.append(row)
+        
+        if not files:
+            self.remove_deleted_rows(files_info, missing)
             return
             
         # Ask user for confirmation and deletion method
         msg = QMessageBox()
         msg.setIcon(QMessageBox.Question)
-        msg.setText(f"Are you sure you want to delete {len(file_paths)} file(s)?")
+        msg.setText(f"Are you sure you want to delete {len(files)} file(s)?")
         msg.setInformativeText("Choose deletion method:")
         msg.setWindowTitle("Confirm Deletion")
         
         # Add buttons for different deletion methods
         recycle_button = msg.addButton("Move to Recycle Bin", QMessageBox.ActionRole)
         permanent_button = msg.addButton("Delete Permanently", QMessageBox.ActionRole)
-        cancel_button = msg.addButton("Cancel", QMessageBox.RejectRole)
+        msg.addButton("Cancel", QMessageBox.RejectRole)
         
         msg.exec_()
         
         clicked_button = msg.clickedButton()
         
-        if clicked_button == cancel_button:
+        # Cancel, or the dialog closed with Escape
+        if clicked_button not in (recycle_button, permanent_button):
             return
             
         try:
             # Clear selection before deleting to prevent crashes
             current_table.clearSelection()
             
-            # Delete files based on selected method
-            failed_files = []
-            for file_path in file_paths:
-                try:
-                    if clicked_button == recycle_button:
-                        # Normalize path for send2trash
-                        normalized_path = os.path.normpath(file_path)
-                        send2trash(normalized_path)
-                    elif clicked_button == permanent_button:
-                        os.remove(file_path)
-                except Exception as e:
-                    failed_files.append((file_path, str(e)))
-            
-            # Show errors if any files failed to delete
-            if failed_files:
-                error_msg = QMessageBox()
-                error_msg.setIcon(QMessageBox.Warning)
-                error_msg.setWindowTitle("Deletion Warnings")
-                error_msg.setText(f"Failed to delete {len(failed_files)} file(s):")
-                error_details = "\n".join([f"{path}: {error}" for path, error in failed_files])
-                error_msg.setDetailedText(error_details)
-                error_msg.exec_()
+            delete_progress = QProgressDialog("Deleting files...", "Cancel", 0, 100, self)
+            delete_progress.setWindowModality(Qt.WindowModal)
+            delete_progress.setAutoClose(True)
+            delete_progress.show()
             
-            # Refresh the directory after deletion
-            current_path = self.path_label.text()
-            if current_path and os.path.exists(current_path):
-                self.scan_directory(current_path)
+            # Files are deleted in batches on a worker thread so the window
+            # stays responsive, and Cancel stops after the current batch.
+            # Watch updates wait until the deleted rows have been removed
+            self.dir_watcher.hold()
+            self.deleter = FileDeleter(files, use_trash=clicked_button == recycle_button)
+            self.deleter.progress.connect(delete_progress.setValue)
+            delete_progress.canceled.connect(self.deleter.cancel)
+            self.deleter.finished.connect(lambda deleted, failed, cancelled:
+                self.on_delete_complete(files_info, deleted + missing, failed, delete_progress))
+            self.deleter.start()
                 
         except Exception as e:
             error_msg = QMessageBox()
@@ -666,6 +1709,43 @@ class FileSorterApp(QMainWindow):
             error_msg.setWindowTitle("Error")
             error_msg.exec_()
             
+    def on_delete_complete(self, files_info, deleted_rows, failed_files, delete_progress):
+        delete_progress.close()
+        self.remove_deleted_rows(files_info, deleted_rows)
+        self.dir_watcher.release()
+        
+        # Show errors if any files failed to delete
+        if failed_files:
+            error_msg = QMessageBox()
+            error_msg.setIcon(QMessageBox.Warning)
+            error_msg.setWindowTitle("Deletion Warnings")
+            error_msg.setText(f"Failed to delete {len(failed_files)} file(s):")
+            error_details = "\n".join([f"{path}: {error}" for path, error in failed_files])
+            error_msg.setDetailedText(error_details)
+            error_msg.exec_()
+            
+    def remove_deleted_rows(self, files_info, rows):
+        # Drop deleted files from the results in place instead of rescanning;
+        # skipped if a new scan replaced the results in the meantime
+        if not rows or files_info is not self.file_model.files_info:
+            return
+        self.total_size -= files_info.total_size(rows)
+        if self.total_reclaimable is not None:
+            self.total_reclaimable -= files_info.total_reclaimable(rows) or 0
+        for category, count in files_info.category_counts(rows).items():
+            self.file_counts[category] -= count
+        records = [files_info[row] for row in rows]
+        categories = [files_info.category(row) for row in rows]
+        if self.scanning:
+            # The scan's folder tree is built off-thread; it is corrected
+            # once the scan hands it over
+            self.removed_during_scan.extend(zip(records, categories))
+        else:
+            self.folder_tree.adjust(records, -1, categories)
+        self.file_model.remove_rows(rows)
+        self.refresh_folders()
+        self.update_status()
+            
 if __name__ == '__main__':
     app = QApplication(sys.argv)
     window = FileSorterApp()
@@ -0,0 +1,226 @@
+import ctypes
+import os
+import select
+import struct
+import sys
+import threading
+
+from PyQt5.QtCore import QObject, QFileSystemWatcher, QTimer, pyqtSignal
+
+# inotify flags, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+class InotifyWatcher:
+    """Watch directories with inotify from a reader thread.
+
+    Unlike QFileSystemWatcher's directory watches, this also reports files
+    written in place (IN_MODIFY), so size changes reach the results. Changed
+    directories are gathered in a set; `notify` is called from the reader
+    thread only when that set goes from empty to non-empty, and take()
+    drains it, so a burst of events costs one cross-thread wake-up.
+    """
+    MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+            IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+    def __init__(self, notify):
+        self.notify = notify
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.lock = threading.Lock()
+        self.paths = {}  # Watch descriptor -> directory
+        self.wds = {}  # Directory -> watch descriptor
+        self.changed = set()
+        self.stop_read, self.stop_write = os.pipe()
+        self.thread = threading.Thread(target=self._read_events, daemon=True)
+        self.thread.start()
+
+    def add(self, paths):
+        failed = []
+        with self.lock:
+            for path in paths:
+                if path in self.wds:
+                    continue
+                wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), self.MASK)
+                if wd < 0:
+                    failed.append(path)
+                    continue
+                self.paths[wd] = path
+                self.wds[path] = wd
+        return failed
+
+    def remove(self, paths):
+        with self.lock:
+            for path in paths:
+                wd = self.wds.pop(path, None)
+                if wd is not None:
+                    self.paths.pop(wd, None)
+                    self.libc.inotify_rm_watch(self.fd, wd)
+
+    def directories(self):
+        with self.lock:
+            return list(self.wds)
+
+    def take(self):
+        with self.lock:
+            changed, self.changed = self.changed, set()
+        return changed
+
+    def close(self):
+        os.write(self.stop_write, b'x')
+        self.thread.join()
+        for fd in (self.fd, self.stop_read, self.stop_write):
+            os.close(fd)
+
+    def _read_events(self):
+        while True:
+            readable, _, _ = select.select([self.fd, self.stop_read], [], [])
+            if self.stop_read in readable:
+                return
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            with self.lock:
+                was_empty = not self.changed
+                offset = 0
+                while offset < len(data):
+                    wd, mask, _, name_length = _EVENT_HEADER.unpack_from(data, offset)
+                    offset += _EVENT_HEADER.size + name_length
+                    if mask & IN_Q_OVERFLOW:
+                        # Events were dropped; every directory may have changed
+                        self.changed.update(self.wds)
+                        continue
+                    path = self.paths.get(wd)
+                    if path is None:
+                        continue
+                    self.changed.add(path)
+                    if mask & IN_IGNORED:
+                        # The kernel dropped the watch (directory removed)
+                        del self.paths[wd]
+                        self.wds.pop(path, None)
+                notify = was_empty and bool(self.changed)
+            if notify:
+                self.notify()
+
+
+class DirectoryWatcher(QObject):
+    """Report changed directories in coalesced batches.
+
+    Uses inotify on Linux (see InotifyWatcher) and QFileSystemWatcher
+    elsewhere, which uses ReadDirectoryChangesW on Windows. Notifications
+    are collected for `delay` milliseconds after the first one arrives and
+    then emitted together, so a burst such as a checkout or an unpacked
+    archive becomes a single directories_changed signal. While held (holds
+    nest), notifications keep accumulating and are emitted once every hold
+    is released.
+    """
+    directories_changed = pyqtSignal(list)
+    _inotify_ready = pyqtSignal()  # Emitted from the inotify reader thread
+
+    def __init__(self, delay=500, parent=None):
+        super().__init__(parent)
+        self.inotify = None
+        self.watcher = None
+        if sys.platform.startswith('linux'):
+            try:
+                self.inotify = InotifyWatcher(self._inotify_ready.emit)
+            except (OSError, AttributeError):
+                self.inotify = None
+        if self.inotify is not None:
+            self._inotify_ready.connect(self._on_inotify_ready)
+        else:
+            self.watcher = QFileSystemWatcher(self)
+            self.watcher.directoryChanged.connect(self._on_directory_changed)
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay)
+        self.timer.timeout.connect(self._flush)
+        self.pending = set()
+        self.holds = 0
+
+    def watch(self, paths):
+        """Start watching `paths`; returns the ones that could not be watched.
+
+        Watches are a limited resource (fs.inotify.max_user_watches on
+        Linux), so very large trees may not be watched completely.
+        """
+        if not paths:
+            return []
+        if self.inotify is not None:
+            return self.inotify.add(paths)
+        return self.watcher.addPaths(paths)
+
+    def unwatch(self, paths):
+        if not paths:
+            return
+        if self.inotify is not None:
+            self.inotify.remove(paths)
+        else:
+            self.watcher.removePaths(paths)
+
+    def unwatch_below(self, paths):
+        # Stop watching `paths` and every directory inside them
+        paths = set(paths)
+        prefixes = tuple(os.path.join(path, '') for path in paths)
+        self.unwatch([path for path in self.directories() if path in paths or path.startswith(prefixes)])
+
+    def directories(self):
+        if self.inotify is not None:
+            return self.inotify.directories()
+        return self.watcher.directories()
+
+    def clear(self):
+        self.unwatch(self.directories())
+        if self.inotify is not None:
+            self.inotify.take()
+        self.pending.clear()
+        self.timer.stop()
+
+    def hold(self):
+        self.holds += 1
+
+    def release(self):
+        self.holds = max(0, self.holds - 1)
+        if not self.holds and self.pending and not self.timer.isActive():
+            self.timer.start()
+
+    def defer(self, paths):
+        # Report `paths` again with the next batch
+        self.pending.update(paths)
+        if not self.holds and not self.timer.isActive():
+            self.timer.start()
+
+    def _on_inotify_ready(self):
+        self.defer(self.inotify.take())
+
+    def _on_directory_changed(self, path):
+        # The window opens on the first event and is not extended by later
+        # ones, so a continuous stream still yields regular updates
+        self.defer([path])
+
+    def _flush(self):
+        if self.inotify is not None:
+            self.pending.update(self.inotify.take())
+        if self.holds or not self.pending:
+            return
+        paths = sorted(self.pending)
+        self.pending.clear()
+        self.directories_changed.emit(paths)
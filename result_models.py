@@ -0,0 +1,616 @@
+import numpy as np
+from PyQt5.QtCore import (Qt, pyqtSignal, QAbstractTableModel, QAbstractItemModel, QAbstractProxyModel,
+                          QModelIndex)
+
+from dir_tree import DirectoryTree
+from result_store import ResultStore
+from scan_engine import CATEGORIES, CATEGORY_LABELS
+
+
+class FileTableModel(QAbstractTableModel):
+    # Source model shared by every tab; rows are produced on demand from the
+    # scan records instead of being copied into table items
+    files_about_to_be_removed = pyqtSignal(object)  # Sorted source rows, before removal
+    files_removed = pyqtSignal(object)  # The same rows, after the store is compacted
+    files_added = pyqtSignal(object)  # Rows appended to the end of the store
+    filter_changed = pyqtSignal()  # The search query changed; tabs rebuild their rows
+    categories_changed = pyqtSignal(object)  # Rows whose category changed, sorted
+    headers = ["Name", "Type", "Size", "Path", "Reclaimable"]
+    SIZE_COLUMN = 2
+    PATH_COLUMN = 3
+    RECLAIMABLE_COLUMN = 4  # Allocated bytes, once per inode; empty unless the scan counted them
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.files_info = ResultStore()
+        self._sort_keys = {}
+        self._sort_orders = {}  # Rows in name or path order, kept up to date as rows arrive
+        self.query = ''
+        self.matches = None  # Sorted rows matching the query, or None for all rows
+        
+    def set_files(self, files_info):
+        self.beginResetModel()
+        self.files_info = files_info
+        self._sort_keys = {}
+        self._sort_orders = {}
+        self.matches = files_info.search(self.query) if self.query else None
+        self.endResetModel()
+        
+    def set_query(self, query):
+        # Every tab shows only the rows matching the query
+        query = query.strip()
+        if query == self.query:
+            return
+        self.query = query
+        self.matches = self.files_info.search(query) if query else None
+        self.filter_changed.emit()
+        
+    def record(self, row):
+        return self.files_info[row]
+        
+    def remove_rows(self, rows):
+        # Only the proxies are attached to views, and they update themselves
+        # from these signals, so the remaining rows keep their place
+        rows = np.unique(np.asarray(rows, dtype=np.int64))
+        if not len(rows):
+            return
+        self.files_about_to_be_removed.emit(rows)
+        self.files_info.remove_rows(rows)
+        # Ranks keep their relative order, so they stay valid once compacted
+        self._sort_keys = {column: np.delete(ranks, rows) for column, ranks in self._sort_keys.items()}
+        for column, order in self._sort_orders.items():
+            order = order[~np.isin(order, rows)]
+            self._sort_orders[column] = order - np.searchsorted(rows, order)
+        if self.matches is not None:
+            kept = self.matches[~np.isin(self.matches, rows)]
+            self.matches = kept - np.searchsorted(rows, kept)
+        self.files_removed.emit(rows)
+        
+    def add_files(self, records, mtimes, categories=None):
+        first = len(self.files_info)
+        self.files_info.extend(records, mtimes)
+        if categories is not None:
+            self.files_info.set_categories(range(first, len(self.files_info)), categories)
+        self._rows_added(first)
+        
+    def merge_files(self, store):
+        # Rows packed off-thread, e.g. a streamed scan batch
+        first = len(self.files_info)
+        self.files_info.merge(store)
+        self._rows_added(first)
+        
+    def _rows_added(self, first):
+        if len(self.files_info) == first:
+            return
+        # New names shift every rank. Name and path ranks take the new rows
+        # in at their sorted places; type ranks are rebuilt on the next sort
+        self._sort_keys = {column: self._insert_ranks(column, first) for column in list(self._sort_orders)}
+        added = np.arange(first, len(self.files_info))
+        if self.matches is not None:
+            # Only the new rows are searched; the index catches up first
+            self.matches = np.concatenate((self.matches, self.files_info.search(self.query, added)))
+        self.files_added.emit(added)
+        
+    def set_categories(self, rows, categories):
+        # Rows move between category tabs in place
+        self.files_info.set_categories(rows, categories)
+        self.categories_changed.emit(np.unique(np.asarray(rows, dtype=np.int64)))
+        
+    def category_rows(self, category, rows=None):
+        # Rows of a category (None for all), limited to search matches
+        if self.matches is not None:
+            rows = self.matches if rows is None else rows[np.isin(rows, self.matches)]
+        if category is None:
+            return np.arange(len(self.files_info)) if rows is None else rows
+        return self.files_info.rows_in_category(category, rows)
+        
+    def sort_keys(self, rows, column, descending=False):
+        if column == self.SIZE_COLUMN:
+            keys = np.frombuffer(self.files_info.sizes, dtype=np.int64)[rows]
+        elif column == self.RECLAIMABLE_COLUMN:
+            reclaimable = self.files_info.reclaimable
+            keys = np.frombuffer(reclaimable if reclaimable is not None else self.files_info.sizes,
+                                 dtype=np.int64)[rows]
+        else:
+            keys = self.sort_ranks(column)[rows]
+        return -keys if descending else keys
+        
+    def sort_rows(self, rows, column, descending=False):
+        # Every column sorts on NumPy keys, so no Python __lt__ runs per
+        # comparison
+        return rows[np.argsort(self.sort_keys(rows, column, descending), kind='stable')]
+        
+    def sort_ranks(self, column):
+        # Rank of every row within its column; strings are ranked once per
+        # scan so each tab's sort is a single NumPy argsort
+        ranks = self._sort_keys.get(column)
+        if ranks is None:
+            store = self.files_info
+            if column == 1:
+                ranks = store.ext_ranks()
+            else:
+                order = self._sort_orders[column] = self._full_order(column)
+                ranks = self._ranks_from_order(order)
+            self._sort_keys[column] = ranks
+        return ranks
+        
+    def _full_order(self, column):
+        store = self.files_info
+        value = store.name if column == 0 else store.path
+        keys = [value(i).lower() for i in range(len(store))]
+        return np.array(sorted(range(len(keys)), key=keys.__getitem__), dtype=np.int64)
+        
+    @staticmethod
+    def _ranks_from_order(order):
+        ranks = np.empty(len(order), dtype=np.int64)
+        ranks[order] = np.arange(len(order))
+        return ranks
+        
+    def _insert_ranks(self, column, first):
+        # Ranks of a name or path column once rows from `first` on were
+        # appended. Each new key is placed by a binary search of the current
+        # order, so a streamed batch of k rows costs O(k log n) key lookups
+        # and one array insert instead of sorting every row again
+        store = self.files_info
+        order = self._sort_orders[column]
+        added = len(store) - first
+        if added * 4 > len(order):
+            # Large next to what is sorted already: sort everything again
+            order = self._sort_orders[column] = self._full_order(column)
+            return self._ranks_from_order(order)
+        value = store.name if column == 0 else store.path
+        places = []
+        for row in range(first, len(store)):
+            key = value(row).lower()
+            low, high = 0, len(order)
+            while low < high:
+                middle = (low + high) // 2
+                if key < value(int(order[middle])).lower():
+                    high = middle
+                else:
+                    low = middle + 1
+            places.append((low, key, row))
+        # New rows landing in the same gap go in key order, ties in row
+        # order, as a full sort would put them
+        places.sort()
+        order = np.insert(order, [place for place, _, _ in places], [row for _, _, row in places])
+        self._sort_orders[column] = order
+        return self._ranks_from_order(order)
+        
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.files_info)
+        
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+        
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        row, column = index.row(), index.column()
+        store = self.files_info
+        if column == 0:
+            return store.name(row)
+        elif column == 1:
+            return store.ext(row)
+        elif column == self.SIZE_COLUMN:
+            return f"{store.sizes[row] / (1024 * 1024):.2f} MB"
+        elif column == self.RECLAIMABLE_COLUMN:
+            if store.reclaimable is None:
+                return None
+            return f"{store.reclaimable[row] / (1024 * 1024):.2f} MB"
+        return store.path(row)
+        
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.headers[section]
+        return None
+
+class CategoryProxyModel(QAbstractProxyModel):
+    # Filtered, independently sorted view of a FileTableModel. The row
+    # mapping is an array of source rows, built with array operations so no
+    # Python callback runs per row the way filterAcceptsRow would
+    def __init__(self, source, category=None, columns=(0, 1, 2, 3), parent=None):
+        super().__init__(parent)
+        self.category = category
+        self.columns = list(columns)
+        self.rows = np.arange(0)
+        self._source_to_proxy = None
+        self.sort_column = -1
+        self.sort_order = Qt.AscendingOrder
+        self.setSourceModel(source)
+        source.modelAboutToBeReset.connect(self.beginResetModel)
+        source.modelReset.connect(self._on_source_reset)
+        source.files_about_to_be_removed.connect(self._on_files_about_to_be_removed)
+        source.files_removed.connect(self._on_files_removed)
+        source.files_added.connect(self._on_files_added)
+        source.filter_changed.connect(self._on_filter_changed)
+        source.categories_changed.connect(self._on_categories_changed)
+        self._rebuild()
+        
+    def _rebuild(self):
+        self.rows = self.sourceModel().category_rows(self.category)
+        self._sort_rows()
+        
+    def _on_source_reset(self):
+        self._rebuild()
+        self.endResetModel()
+        
+    def _on_filter_changed(self):
+        self.beginResetModel()
+        self._rebuild()
+        self.endResetModel()
+        
+    def _on_categories_changed(self, changed):
+        # Rows that left this tab's category go, those that joined it are
+        # inserted at their sorted positions
+        if self.category is None:
+            return
+        joined = self.sourceModel().category_rows(self.category, changed)
+        shown = np.isin(changed, self.rows)
+        self._on_files_about_to_be_removed(changed[shown & ~np.isin(changed, joined)])
+        self._on_files_added(joined[~np.isin(joined, self.rows)])
+        
+    def _on_files_about_to_be_removed(self, removed):
+        positions = np.flatnonzero(np.isin(self.rows, removed))
+        if not len(positions):
+            return
+        breaks = np.flatnonzero(np.diff(positions) != 1)
+        starts = np.concatenate(([positions[0]], positions[breaks + 1]))
+        ends = np.concatenate((positions[breaks], [positions[-1]]))
+        if len(starts) > 64:
+            # Too scattered to remove run by run
+            self.beginResetModel()
+            self.rows = np.delete(self.rows, positions)
+            self._source_to_proxy = None
+            self.endResetModel()
+            return
+        # Remove contiguous runs bottom-up so earlier positions stay valid
+        for start, end in zip(starts[::-1].tolist(), ends[::-1].tolist()):
+            self.beginRemoveRows(QModelIndex(), start, end)
+            self.rows = np.delete(self.rows, slice(start, end + 1))
+            self._source_to_proxy = None
+            self.endRemoveRows()
+        
+    def _on_files_removed(self, removed):
+        # Renumber the surviving source rows to match the compacted store
+        self.rows = self.rows - np.searchsorted(removed, self.rows)
+        self._source_to_proxy = None
+        
+    def _on_files_added(self, added):
+        source = self.sourceModel()
+        added = source.category_rows(self.category, added)
+        if not len(added):
+            return
+        # Insert new rows at their sorted positions; appended rows come last
+        # among equal keys, as a stable sort would place them
+        if self.sort_column < 0:
+            positions = np.full(len(added), len(self.rows))
+        else:
+            column = self.columns[self.sort_column]
+            descending = self.sort_order == Qt.DescendingOrder
+            added = source.sort_rows(added, column, descending)
+            positions = np.searchsorted(source.sort_keys(self.rows, column, descending),
+                                        source.sort_keys(added, column, descending), side='right')
+        starts = np.unique(positions)
+        if len(starts) > 64:
+            # Too scattered to insert run by run, e.g. a scan batch in a tab
+            # sorted by size; one layout change keeps the selection
+            self._change_layout(np.insert(self.rows, positions, added))
+            return
+        # Insert bottom-up so earlier positions stay valid
+        for start in starts[::-1].tolist():
+            group = added[positions == start]
+            self.beginInsertRows(QModelIndex(), start, start + len(group) - 1)
+            self.rows = np.insert(self.rows, start, group)
+            self._source_to_proxy = None
+            self.endInsertRows()
+        
+    def _sort_rows(self):
+        self._source_to_proxy = None
+        if self.sort_column < 0:
+            return
+        self.rows = self.sourceModel().sort_rows(
+            self.rows, self.columns[self.sort_column], self.sort_order == Qt.DescendingOrder)
+        
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.layoutAboutToBeChanged.emit()
+        persistent = self.persistentIndexList()
+        source_rows = [self.source_row(index.row()) for index in persistent]
+        self.sort_column = column
+        self.sort_order = order
+        self._sort_rows()
+        self.changePersistentIndexList(persistent, [
+            self.index(self.proxy_row(source_row), index.column())
+            for source_row, index in zip(source_rows, persistent)])
+        self.layoutChanged.emit()
+        
+    def _change_layout(self, rows):
+        # Swap in a new row mapping; selections and the current index follow
+        # their source rows
+        self.layoutAboutToBeChanged.emit()
+        persistent = self.persistentIndexList()
+        source_rows = [self.source_row(index.row()) for index in persistent]
+        self.rows = rows
+        self._source_to_proxy = None
+        self.changePersistentIndexList(persistent, [
+            self.index(self.proxy_row(source_row), index.column())
+            for source_row, index in zip(source_rows, persistent)])
+        self.layoutChanged.emit()
+        
+    def proxy_row(self, source_row):
+        # Reverse mapping is only needed for selections, so build it lazily
+        if self._source_to_proxy is None:
+            self._source_to_proxy = np.full(self.sourceModel().rowCount(), -1, dtype=np.int64)
+            self._source_to_proxy[self.rows] = np.arange(len(self.rows))
+        return int(self._source_to_proxy[source_row])
+        
+    def source_row(self, proxy_row):
+        return int(self.rows[proxy_row])
+        
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+        
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+        
+    def index(self, row, column, parent=QModelIndex()):
+        if parent.isValid() or not (0 <= row < len(self.rows) and 0 <= column < len(self.columns)):
+            return QModelIndex()
+        return self.createIndex(row, column)
+        
+    def parent(self, index=QModelIndex()):
+        return QModelIndex()
+        
+    def mapToSource(self, proxy_index):
+        if not proxy_index.isValid():
+            return QModelIndex()
+        return self.sourceModel().index(self.source_row(proxy_index.row()), self.columns[proxy_index.column()])
+        
+    def mapFromSource(self, source_index):
+        if not source_index.isValid() or source_index.column() not in self.columns:
+            return QModelIndex()
+        row = self.proxy_row(source_index.row())
+        if row < 0:
+            return QModelIndex()
+        return self.index(row, self.columns.index(source_index.column()))
+        
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal:
+            return self.sourceModel().headerData(self.columns[section], orientation, role)
+        if role == Qt.DisplayRole:
+            return section + 1
+        return None
+
+class DuplicateProxyModel(CategoryProxyModel):
+    # Rows of every duplicate group, one group after another, with the group
+    # number in an extra leading column
+    def __init__(self, source, parent=None):
+        self.groups = []
+        self.group_of_row = np.arange(0)
+        super().__init__(source, None, (0, 2, 3), parent)
+        
+    def set_groups(self, groups):
+        self.beginResetModel()
+        self.groups = groups
+        self._rebuild()
+        self.endResetModel()
+        
+    def _rebuild(self):
+        self._source_to_proxy = None
+        if self.groups:
+            self.rows = np.concatenate([np.asarray(group, dtype=np.int64) for group in self.groups])
+            self.group_of_row = np.repeat(np.arange(len(self.groups)), [len(group) for group in self.groups])
+        else:
+            self.rows = np.arange(0)
+            self.group_of_row = np.arange(0)
+        
+    def _on_source_reset(self):
+        # Source rows are renumbered on reset, so old groups no longer apply
+        self.groups = []
+        super()._on_source_reset()
+        
+    def _on_files_about_to_be_removed(self, removed):
+        self.beginResetModel()
+        
+    def _on_files_removed(self, removed):
+        # Drop deleted files from their groups, and groups left with one file
+        groups = []
+        for group in self.groups:
+            group = np.asarray(group, dtype=np.int64)
+            kept = group[~np.isin(group, removed)]
+            if len(kept) > 1:
+                groups.append(kept - np.searchsorted(removed, kept))
+        self.groups = groups
+        self._rebuild()
+        self.endResetModel()
+        
+    def _on_files_added(self, added):
+        # New files have not been compared, so they join no group
+        pass
+        
+    def _on_filter_changed(self):
+        # Groups are shown whole, whatever the search
+        pass
+        
+    def sort(self, column, order=Qt.AscendingOrder):
+        # Rows stay grouped, largest waste first
+        pass
+        
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns) + 1
+        
+    def index(self, row, column, parent=QModelIndex()):
+        if parent.isValid() or not (0 <= row < len(self.rows) and 0 <= column <= len(self.columns)):
+            return QModelIndex()
+        return self.createIndex(row, column)
+        
+    def mapToSource(self, proxy_index):
+        if not proxy_index.isValid():
+            return QModelIndex()
+        column = self.columns[max(proxy_index.column() - 1, 0)]
+        return self.sourceModel().index(self.source_row(proxy_index.row()), column)
+        
+    def mapFromSource(self, source_index):
+        proxy_index = super().mapFromSource(source_index)
+        if not proxy_index.isValid():
+            return proxy_index
+        return self.index(proxy_index.row(), proxy_index.column() + 1)
+        
+    def data(self, index, role=Qt.DisplayRole):
+        if index.isValid() and index.column() == 0:
+            return int(self.group_of_row[index.row()]) + 1 if role == Qt.DisplayRole else None
+        return super().data(index, role)
+        
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and section == 0:
+            return "Group" if role == Qt.DisplayRole else None
+        if orientation == Qt.Horizontal:
+            section -= 1
+        return super().headerData(section, orientation, role)
+
+class DirectoryTreeModel(QAbstractItemModel):
+    # Folder hierarchy over a DirectoryTree. Every index carries its node id,
+    # so index(), parent() and rowCount() are array lookups and expanding a
+    # folder computes nothing
+    headers = ["Folder", "Size", "Files", "Folders"] + [CATEGORY_LABELS[category] for category in CATEGORIES]
+    sort_keys = ['name', 'size', 'files', 'folders'] + list(CATEGORIES)
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.tree = DirectoryTree()
+        
+    def set_tree(self, tree):
+        self.beginResetModel()
+        self.tree = tree
+        self.endResetModel()
+        
+    def refresh(self):
+        # Totals changed in place; the shape of the tree did not
+        self.layoutAboutToBeChanged.emit()
+        self.layoutChanged.emit()
+        
+    def node(self, index):
+        return index.internalId() if index.isValid() else -1
+        
+    def index_for_node(self, node, column=0):
+        if not 0 <= node < len(self.tree):
+            return QModelIndex()
+        row = 0 if node == 0 else int(self.tree.child_position[node])
+        return self.createIndex(row, column, node)
+        
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        if not parent.isValid():
+            return 1 if len(self.tree) else 0
+        return self.tree.child_count(parent.internalId())
+        
+    def columnCount(self, parent=QModelIndex()):
+        return len(self.headers)
+        
+    def index(self, row, column, parent=QModelIndex()):
+        if not 0 <= column < len(self.headers):
+            return QModelIndex()
+        if not parent.isValid():
+            return self.createIndex(0, column, 0) if row == 0 and len(self.tree) else QModelIndex()
+        children = self.tree.children(parent.internalId())
+        if not 0 <= row < len(children):
+            return QModelIndex()
+        return self.createIndex(row, column, int(children[row]))
+        
+    def parent(self, index=QModelIndex()):
+        if not index.isValid() or index.internalId() == 0:
+            return QModelIndex()
+        return self.index_for_node(int(self.tree.parents[index.internalId()]))
+        
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        node, column = index.internalId(), index.column()
+        if role == Qt.TextAlignmentRole and column > 0:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        if role == Qt.ToolTipRole and column == 0:
+            return self.tree.paths[node]
+        if role != Qt.DisplayRole:
+            return None
+        tree = self.tree
+        if column == 0:
+            return tree.name(node)
+        elif column == 1:
+            return f"{tree.sizes[node] / (1024 * 1024):,.2f} MB"
+        elif column == 2:
+            return f"{tree.files(node):,}"
+        elif column == 3:
+            return f"{tree.folders[node]:,}"
+        return f"{tree.counts[node, column - 4]:,}"
+        
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.headers[section]
+        return None
+        
+    def sort(self, column, order=Qt.AscendingOrder):
+        # Re-orders every folder's children at once; persistent indexes
+        # follow their nodes to the new rows
+        self.layoutAboutToBeChanged.emit()
+        persistent = self.persistentIndexList()
+        nodes = [(index.internalId(), index.column()) for index in persistent]
+        self.tree.sort(self.sort_keys[column], order == Qt.DescendingOrder)
+        self.changePersistentIndexList(persistent, [
+            self.index_for_node(node, column) for node, column in nodes])
+        self.layoutChanged.emit()
+
+class ChangesModel(QAbstractTableModel):
+    # Largest changes between two snapshots, as returned by diff_snapshots
+    headers = ["Change", "Kind", "Path", "Old Size", "New Size", "Difference"]
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.changes = []
+        
+    def set_changes(self, changes):
+        self.beginResetModel()
+        self.changes = list(changes)
+        self.endResetModel()
+        
+    @staticmethod
+    def delta(change):
+        return (change[4] or 0) - (change[3] or 0)
+        
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.changes)
+        
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+        
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        change, column = self.changes[index.row()], index.column()
+        if role == Qt.TextAlignmentRole and column > 2:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        if role != Qt.DisplayRole:
+            return None
+        if column < 3:
+            return change[column]
+        size = self.delta(change) if column == 5 else change[column]
+        if size is None:
+            return ""
+        return f"{size / (1024 * 1024):+,.2f} MB" if column == 5 else f"{size / (1024 * 1024):,.2f} MB"
+        
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.headers[section]
+        return None
+        
+    def sort(self, column, order=Qt.AscendingOrder):
+        # At most a few thousand rows, so a plain sort is enough
+        if column == 5:
+            key = self.delta
+        elif column > 2:
+            key = lambda change: change[column] or 0
+        else:
+            key = lambda change: change[column]
+        self.layoutAboutToBeChanged.emit()
+        self.changes.sort(key=key, reverse=order == Qt.DescendingOrder)
+        self.layoutChanged.emit()
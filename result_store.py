@@ -0,0 +1,337 @@
+import os
+from array import array
+from itertools import accumulate
+
+import numpy as np
+
+from scan_engine import CATEGORIES, classify_extension
+from search_index import SearchIndex
+
+CATEGORY_CODES = {category: code for code, category in enumerate(CATEGORIES)}
+
+
+class ResultStore:
+    """Columnar store for scan records.
+
+    Sizes and mtimes live in typed arrays, extensions and categories are
+    small integer codes, and paths are split into an interned table of
+    parent directories plus basenames packed into one UTF-8 buffer. Indexing
+    and iteration rebuild the familiar (file, ext, size, file_path) tuples on
+    demand, so callers that expect the old list of tuples keep working.
+
+    Records from an allocated-size scan carry a fifth field, the file's
+    reclaimable size. The reclaimable column is created when the first such
+    record arrives and is None until then; rows added without one count
+    their apparent size.
+    """
+
+    def __init__(self, records=None, mtimes=None):
+        self.sizes = array('q')
+        self.mtimes = array('q')
+        self.reclaimable = None
+        self.ext_codes = array('H')
+        self.category_codes = array('B')
+        self.dir_ids = array('I')
+        self.name_offsets = array('Q', [0])
+        self.name_buffer = bytearray()
+        self.exts = []
+        self._ext_ids = {}
+        self.dirs = []
+        self._dir_ids = {}
+        self._search = None
+        if records is not None:
+            self.extend(records, mtimes)
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._record(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('ResultStore index out of range')
+        return self._record(index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._record(i)
+
+    def _record(self, i):
+        name = self.name(i)
+        return (name, self.ext(i), self.sizes[i], self.dirs[self.dir_ids[i]] + name)
+
+    def append(self, record, mtime=0):
+        name, ext, size, file_path = record[:4]
+        self._extend_reclaimable([record], [record[4] if len(record) > 4 else size])
+        # The parent prefix keeps its trailing separator so that prefix +
+        # name reproduces the original path exactly
+        prefix = file_path[:len(file_path) - len(name)]
+        dir_id = self._dir_ids.get(prefix)
+        if dir_id is None:
+            dir_id = self._dir_ids[prefix] = len(self.dirs)
+            self.dirs.append(prefix)
+        ext_id = self._ext_ids.get(ext)
+        if ext_id is None:
+            ext_id = self._ext_ids[ext] = len(self.exts)
+            self.exts.append(ext)
+
+        self.sizes.append(size)
+        self.mtimes.append(mtime)
+        self.ext_codes.append(ext_id)
+        self.category_codes.append(CATEGORY_CODES[classify_extension(ext)])
+        self.dir_ids.append(dir_id)
+        self.name_buffer += name.encode('utf-8', 'surrogatepass')
+        self.name_offsets.append(len(self.name_buffer))
+
+    def extend(self, records, mtimes=None):
+        # Column by column, so each array grows once per batch rather than
+        # once per record; scan batches are whole directories, so the
+        # parent prefix rarely changes between records
+        records = records if isinstance(records, list) else list(records)
+        if not records:
+            return
+        if len(records[0]) > 4:
+            self._extend_reclaimable(records, [record[4] for record in records])
+            records = [record[:4] for record in records]
+        elif self.reclaimable is not None:
+            self.reclaimable.extend([record[2] for record in records])
+        dirs, dir_lookup = self.dirs, self._dir_ids
+        exts, ext_lookup = self.exts, self._ext_ids
+        dir_ids = array('I')
+        ext_codes = array('H')
+        names = []
+        last_prefix = last_dir_id = None
+        for name, ext, size, file_path in records:
+            prefix = file_path[:len(file_path) - len(name)]
+            if prefix != last_prefix:
+                last_dir_id = dir_lookup.get(prefix)
+                if last_dir_id is None:
+                    last_dir_id = dir_lookup[prefix] = len(dirs)
+                    dirs.append(prefix)
+                last_prefix = prefix
+            dir_ids.append(last_dir_id)
+            ext_id = ext_lookup.get(ext)
+            if ext_id is None:
+                ext_id = ext_lookup[ext] = len(exts)
+                exts.append(ext)
+            ext_codes.append(ext_id)
+            names.append(name.encode('utf-8', 'surrogatepass'))
+
+        self.sizes.extend([record[2] for record in records])
+        self.mtimes.extend(mtimes if mtimes is not None else [0] * len(records))
+        self.ext_codes.extend(ext_codes)
+        ext_categories = [CATEGORY_CODES[classify_extension(ext)] for ext in exts]
+        self.category_codes.extend([ext_categories[ext_id] for ext_id in ext_codes])
+        self.dir_ids.extend(dir_ids)
+        offsets = accumulate(map(len, names), initial=len(self.name_buffer))
+        next(offsets)  # The starting offset is already stored
+        self.name_offsets.extend(offsets)
+        self.name_buffer += b''.join(names)
+
+    def _extend_reclaimable(self, records, sizes):
+        # Called before the rows are added; the column is created by the
+        # first record that carries a reclaimable size
+        if self.reclaimable is None:
+            if len(records[0]) <= 4:
+                return
+            self.reclaimable = array('q', self.sizes)
+        self.reclaimable.extend(sizes)
+
+    def merge(self, other):
+        """Append every row of another store, e.g. a batch built off-thread.
+
+        Directory and extension codes are remapped with array operations,
+        and categories are copied as they are, overrides included.
+        """
+        if not len(other):
+            return
+        if other.reclaimable is not None:
+            if self.reclaimable is None:
+                self.reclaimable = array('q', self.sizes)
+            self.reclaimable.extend(other.reclaimable)
+        elif self.reclaimable is not None:
+            self.reclaimable.extend(other.sizes)
+        dir_map = np.array([self._intern(prefix, self.dirs, self._dir_ids) for prefix in other.dirs], dtype=np.uint32)
+        ext_map = np.array([self._intern(ext, self.exts, self._ext_ids) for ext in other.exts], dtype=np.uint16)
+        self.sizes.extend(other.sizes)
+        self.mtimes.extend(other.mtimes)
+        self.ext_codes.frombytes(ext_map[np.frombuffer(other.ext_codes, dtype=np.uint16)].tobytes())
+        self.category_codes.extend(other.category_codes)
+        self.dir_ids.frombytes(dir_map[np.frombuffer(other.dir_ids, dtype=np.uint32)].tobytes())
+        offsets = np.frombuffer(other.name_offsets, dtype=np.uint64)[1:] + np.uint64(len(self.name_buffer))
+        self.name_offsets.frombytes(offsets.tobytes())
+        self.name_buffer += other.name_buffer
+
+    @staticmethod
+    def _intern(value, values, ids):
+        value_id = ids.get(value)
+        if value_id is None:
+            value_id = ids[value] = len(values)
+            values.append(value)
+        return value_id
+
+    def name(self, i):
+        return self.name_buffer[self.name_offsets[i]:self.name_offsets[i + 1]].decode('utf-8', 'surrogatepass')
+
+    def ext(self, i):
+        return self.exts[self.ext_codes[i]]
+
+    def path(self, i):
+        return self.dirs[self.dir_ids[i]] + self.name(i)
+
+    def category(self, i):
+        return CATEGORIES[self.category_codes[i]]
+
+    def set_categories(self, rows, categories):
+        # Override the extension's category, e.g. with one read from the
+        # file's contents
+        for row, category in zip(rows, categories):
+            self.category_codes[row] = CATEGORY_CODES[category]
+
+    def rows_in_category(self, category, rows=None):
+        """Return the row numbers of every record in `category` as an array.
+
+        With rows given, only those rows are considered.
+        """
+        codes = np.frombuffer(self.category_codes, dtype=np.uint8)
+        if rows is None:
+            return np.flatnonzero(codes == CATEGORY_CODES[category])
+        rows = np.asarray(rows, dtype=np.int64)
+        return rows[codes[rows] == CATEGORY_CODES[category]]
+
+    def rows_in_directories(self, paths, recursive=False):
+        """Return the rows of files directly inside any of `paths`.
+
+        With recursive set, files anywhere below them are included too.
+        """
+        prefixes = tuple(os.path.join(path, '') for path in paths)
+        if recursive:
+            dir_ids = [dir_id for dir_id, prefix in enumerate(self.dirs) if prefix.startswith(prefixes)]
+        else:
+            dir_ids = [self._dir_ids[prefix] for prefix in prefixes if prefix in self._dir_ids]
+        return np.flatnonzero(np.isin(np.frombuffer(self.dir_ids, dtype=np.uint32), dir_ids))
+
+    def rows_for_paths(self, paths):
+        """Return the row of each path as an array, with -1 where it is not stored."""
+        wanted = {}
+        for i, path in enumerate(paths):
+            name = os.path.basename(path)
+            dir_id = self._dir_ids.get(path[:len(path) - len(name)])
+            if dir_id is not None:
+                wanted.setdefault(dir_id, {})[name] = i
+        result = np.full(len(paths), -1, dtype=np.int64)
+        dir_ids = np.frombuffer(self.dir_ids, dtype=np.uint32)
+        for row in np.flatnonzero(np.isin(dir_ids, list(wanted))).tolist():
+            i = wanted[self.dir_ids[row]].get(self.name(row))
+            if i is not None:
+                result[i] = row
+        return result
+
+    def diff_listing(self, directory, records, mtimes):
+        """Compare a fresh listing of `directory` with its stored rows.
+
+        Returns (stale_rows, fresh): rows of files that disappeared or whose
+        size or mtime changed, and the (record, mtime) pairs to add for new
+        or changed files.
+        """
+        stored = {}
+        for row in self.rows_in_directories([directory]).tolist():
+            stored[self.name(row)] = (row, self.sizes[row], self.mtimes[row])
+        stale_rows = []
+        fresh = []
+        for record, mtime in zip(records, mtimes):
+            old = stored.pop(record[0], None)
+            if old is not None:
+                if old[1] == record[2] and old[2] == mtime:
+                    continue
+                stale_rows.append(old[0])
+            fresh.append((record, mtime))
+        stale_rows.extend(row for row, _, _ in stored.values())
+        return stale_rows, fresh
+
+    def search_index(self):
+        """Return the SearchIndex over this store, building it on first use."""
+        if self._search is None:
+            self._search = SearchIndex(self)
+        else:
+            self._search.update()
+        return self._search
+
+    def search(self, query, rows=None):
+        """Return the rows whose name (or path, if `query` has a separator) matches."""
+        return self.search_index().search(query, rows)
+
+    def sort_by_size(self, rows=None, descending=False):
+        """Return `rows` (default: all rows) ordered by file size.
+
+        The sort is stable, so equal sizes keep their relative order.
+        """
+        sizes = np.frombuffer(self.sizes, dtype=np.int64)
+        if rows is None:
+            rows = np.arange(len(sizes))
+        rows = np.asarray(rows, dtype=np.int64)
+        keys = sizes[rows]
+        if descending:
+            keys = -keys
+        return rows[np.argsort(keys, kind='stable')]
+
+    def ext_ranks(self):
+        """Return each row's extension rank in sorted extension order."""
+        ranks = np.empty(len(self.exts), dtype=np.int64)
+        ranks[sorted(range(len(self.exts)), key=self.exts.__getitem__)] = np.arange(len(self.exts))
+        return ranks[np.frombuffer(self.ext_codes, dtype=np.uint16)]
+
+    def remove_rows(self, rows):
+        """Delete the given rows in place; later rows shift down to fill gaps.
+
+        Directory and extension tables are left as they are, so removal is a
+        handful of vectorized column copies regardless of how many rows go.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if self._search is not None:
+            self._search.remove_rows(rows)
+        keep = np.ones(len(self), dtype=bool)
+        keep[rows] = False
+        for name, dtype in (('sizes', np.int64), ('mtimes', np.int64), ('reclaimable', np.int64),
+                            ('ext_codes', np.uint16), ('category_codes', np.uint8), ('dir_ids', np.uint32)):
+            column = getattr(self, name)
+            if column is None:
+                continue
+            kept = array(column.typecode)
+            kept.frombytes(np.frombuffer(column, dtype=dtype)[keep].tobytes())
+            setattr(self, name, kept)
+
+        offsets = np.frombuffer(self.name_offsets, dtype=np.uint64)
+        lengths = np.diff(offsets).astype(np.int64)
+        name_bytes = np.frombuffer(self.name_buffer, dtype=np.uint8)
+        self.name_buffer = bytearray(name_bytes[np.repeat(keep, lengths)].tobytes())
+        self.name_offsets = array('Q', [0])
+        self.name_offsets.frombytes(np.cumsum(lengths[keep], dtype=np.uint64).tobytes())
+
+    def total_size(self, rows=None):
+        sizes = np.frombuffer(self.sizes, dtype=np.int64)
+        return int(sizes.sum() if rows is None else sizes[np.asarray(rows, dtype=np.int64)].sum())
+
+    def total_reclaimable(self, rows=None):
+        """Sum of the reclaimable column, or None when the store has none."""
+        if self.reclaimable is None:
+            return None
+        sizes = np.frombuffer(self.reclaimable, dtype=np.int64)
+        return int(sizes.sum() if rows is None else sizes[np.asarray(rows, dtype=np.int64)].sum())
+
+    def category_counts(self, rows=None):
+        codes = np.frombuffer(self.category_codes, dtype=np.uint8)
+        if rows is not None:
+            codes = codes[np.asarray(rows, dtype=np.int64)]
+        counts = np.bincount(codes, minlength=len(CATEGORIES))
+        return {category: int(counts[code]) for code, category in enumerate(CATEGORIES)}
+
+    def nbytes(self):
+        # Approximate footprint of the store's own buffers and tables
+        column_bytes = sum(column.itemsize * len(column) for column in (
+            self.sizes, self.mtimes, self.reclaimable, self.ext_codes, self.category_codes,
+            self.dir_ids, self.name_offsets) if column is not None)
+        table_bytes = sum(len(prefix) + 49 for prefix in self.dirs) + sum(len(ext) + 49 for ext in self.exts)
+        return column_bytes + len(self.name_buffer) + table_bytes
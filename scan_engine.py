@@ -0,0 +1,982 @@
+import copy
+import fnmatch
+import heapq
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+
+# One row per category: (key, label, extensions). Files whose extension is
+# in none of them are 'other'. Tabs, totals and folder columns all follow
+# this order, so a category is added or changed here and nowhere else.
+CATEGORY_TABLE = (
+    ('images', 'Images', ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp')),
+    ('videos', 'Videos', ('.mp4', '.avi', '.mov', '.mkv', '.wmv')),
+    ('documents', 'Documents', ('.pdf', '.docx', '.txt', '.xlsx', '.pptx')),
+)
+OTHER = 'other'
+
+CATEGORIES = tuple(key for key, _, _ in CATEGORY_TABLE) + (OTHER,)
+CATEGORY_LABELS = {key: label for key, label, _ in CATEGORY_TABLE}
+CATEGORY_LABELS[OTHER] = 'Other'
+EXTENSION_CATEGORIES = {ext: key for key, _, extensions in CATEGORY_TABLE for ext in extensions}
+
+IMAGE_EXTENSIONS = {ext for ext, key in EXTENSION_CATEGORIES.items() if key == 'images'}
+VIDEO_EXTENSIONS = {ext for ext, key in EXTENSION_CATEGORIES.items() if key == 'videos'}
+DOC_EXTENSIONS = {ext for ext, key in EXTENSION_CATEGORIES.items() if key == 'documents'}
+
+
+# Where st_blocks is missing (Windows), the apparent size stands in for
+# the allocated size
+HAS_BLOCKS = hasattr(os.stat_result, 'st_blocks')
+
+
+def classify_extension(ext):
+    return EXTENSION_CATEGORIES.get(ext, OTHER)
+
+
+def run_bounded(jobs, func, workers, read_ahead, cancel=None):
+    """Run func(*args) for each (key, args) job in a thread pool.
+
+    Never holds more than read_ahead jobs in flight and yields (key, result)
+    as they finish. Jobs that raise OSError yield a result of None. Once
+    cancel (a threading.Event) is set no new jobs start; those in flight
+    still finish.
+    """
+    def run(args):
+        try:
+            return func(*args)
+        except OSError:
+            return None
+
+    jobs = iter(jobs)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        in_flight = {}
+        for key, args in jobs:
+            if cancel is not None and cancel.is_set():
+                break
+            in_flight[pool.submit(run, args)] = key
+            if len(in_flight) >= read_ahead:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield in_flight.pop(future), future.result()
+        for future in list(in_flight):
+            yield in_flight.pop(future), future.result()
+
+
+TIMED_OUT = object()  # The result run_killable yields for a job whose worker was killed
+
+
+def _serve_jobs(conn, func):
+    # Worker process of run_killable: run the jobs sent down the pipe until
+    # None arrives
+    while True:
+        args = conn.recv()
+        if args is None:
+            return
+        try:
+            result = func(*args)
+        except Exception:
+            result = None
+        conn.send(result)
+
+
+class _KillableWorker:
+    def __init__(self, context, func):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_serve_jobs, args=(child_conn, func), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.job = None
+        self.deadline = None
+
+    def send(self, job, timeout):
+        self.job = job
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        self.conn.send(job[1])
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.kill()
+        else:
+            self.conn.close()
+
+
+def run_killable(jobs, func, workers, timeout=None, cancel=None, start_method=None, cleanup=None):
+    """Run func(*args) for each (key, args) job in worker processes.
+
+    Every worker process has a pipe of its own and runs one job at a time,
+    so a job that hangs, e.g. a decoder stuck on a corrupt file, can be
+    stopped alone: once it has run for timeout seconds its worker is killed
+    and replaced, and the job yields TIMED_OUT. Yields (key, result) as jobs
+    finish; the result is None for a job that raised or whose worker died.
+    func and the arguments must be picklable. cleanup, if given, is called
+    as cleanup(args, pid) for every job whose worker was killed or died.
+
+    Once cancel (a threading.Event) is set no new jobs start; those running
+    finish. start_method is the multiprocessing start method (the
+    platform's default when None); callers with threads running, like the
+    GUI, should pass 'spawn'.
+    """
+    import multiprocessing
+    from multiprocessing.connection import wait as wait_connections
+
+    jobs = list(jobs)
+    if not jobs:
+        return
+    context = multiprocessing.get_context(start_method)
+    pool = [_KillableWorker(context, func) for _ in range(min(workers or os.cpu_count() or 1, len(jobs)))]
+    pending = iter(jobs)
+    try:
+        while True:
+            for worker in pool:
+                if worker.job is None and not (cancel is not None and cancel.is_set()):
+                    job = next(pending, None)
+                    if job is not None:
+                        worker.send(job, timeout)
+            busy = [worker for worker in pool if worker.job is not None]
+            if not busy:
+                return
+            deadlines = [worker.deadline for worker in busy if worker.deadline is not None]
+            wait_for = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+            ready = wait_connections([worker.conn for worker in busy], timeout=wait_for)
+            now = time.monotonic()
+            for position, worker in enumerate(pool):
+                job = worker.job
+                if job is None:
+                    continue
+                if worker.conn in ready:
+                    try:
+                        result = worker.conn.recv()
+                        died = False
+                    except (EOFError, OSError):
+                        # The worker died, e.g. a decoder crashed on the file
+                        result, died = None, True
+                elif worker.deadline is not None and now >= worker.deadline:
+                    result, died = TIMED_OUT, True
+                else:
+                    continue
+                worker.job = None
+                if died:
+                    # Stuck or dead; a fresh worker takes its place
+                    worker.kill()
+                    if cleanup is not None:
+                        cleanup(job[1], worker.process.pid)
+                    pool[position] = _KillableWorker(context, func)
+                yield job[0], result
+    finally:
+        for worker in pool:
+            worker.stop()
+
+
+def list_directory(root, mtimes=None, telemetry=None, inodes=None):
+    """List one directory, returning its file records and its subdirectories.
+
+    Sizes come from the DirEntry stat data, so on most platforms no extra
+    syscall is made per file. Symlinked directories are reported as neither
+    files nor subdirectories, matching os.walk(followlinks=False). If a list
+    is passed as mtimes, each record's st_mtime_ns is appended to it. If a
+    ScanTelemetry is passed, the listing and every stat call are timed. If
+    an InodeSet is passed, each record gets a fifth field, its reclaimable
+    size (see allocated_sizes).
+    """
+    if telemetry is not None:
+        return _list_directory_timed(root, mtimes, telemetry, inodes)
+    records = []
+    subdirs = []
+    stats = [] if inodes is not None else None
+    with os.scandir(root) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        subdirs.append(entry.path)
+                    continue
+                stat = entry.stat()
+            except OSError:
+                continue
+            name = entry.name
+            ext = os.path.splitext(name)[1].lower()
+            records.append((name, ext, stat.st_size, entry.path))
+            if mtimes is not None:
+                mtimes.append(stat.st_mtime_ns)
+            if stats is not None:
+                stats.append(stat)
+    if stats is not None:
+        records = [record + (size,) for record, size in zip(records, allocated_sizes(stats, inodes))]
+    return records, subdirs
+
+
+def _list_directory_timed(root, mtimes, telemetry, inodes=None):
+    # Same as list_directory, with the timing kept out of the fast path
+    clock = time.perf_counter_ns
+    started = clock()
+    histogram = [0] * len(telemetry.stat_histogram)
+    last_bucket = len(histogram) - 1
+    stat_ns = 0
+    records = []
+    subdirs = []
+    stats = [] if inodes is not None else None
+    with os.scandir(root) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        subdirs.append(entry.path)
+                    continue
+                before = clock()
+                stat = entry.stat()
+                elapsed = clock() - before
+            except OSError:
+                continue
+            stat_ns += elapsed
+            histogram[min((elapsed // 1000).bit_length(), last_bucket)] += 1
+            name = entry.name
+            ext = os.path.splitext(name)[1].lower()
+            records.append((name, ext, stat.st_size, entry.path))
+            if mtimes is not None:
+                mtimes.append(stat.st_mtime_ns)
+            if stats is not None:
+                stats.append(stat)
+    telemetry.record_listing(len(records), clock() - started, histogram, stat_ns)
+    if stats is not None:
+        records = [record + (size,) for record, size in zip(records, allocated_sizes(stats, inodes))]
+    return records, subdirs
+
+
+def allocated_sizes(stats, inodes):
+    """Reclaimable bytes of each stat result: its allocated size, once per inode.
+
+    The allocated size is st_blocks * 512, so a sparse file counts only the
+    blocks it has written. A file with several hard links is counted at
+    the first link found, and every later link to an inode already in the
+    InodeSet counts 0, so a tree of hardlinked backups adds up to the disk
+    space it really uses. Windows reports no blocks or inode numbers in
+    directory listings; there the apparent size is used and links are not
+    recognised.
+    """
+    sizes = [stat.st_blocks * 512 for stat in stats] if HAS_BLOCKS else [stat.st_size for stat in stats]
+    linked = {}
+    for position, stat in enumerate(stats):
+        if stat.st_nlink > 1 and stat.st_ino:
+            linked.setdefault(stat.st_dev, []).append(position)
+    for device, positions in linked.items():
+        first = inodes.add(device, [stats[position].st_ino for position in positions])
+        for position, is_first in zip(positions, first.tolist()):
+            if not is_first:
+                sizes[position] = 0
+    return sizes
+
+
+class InodeSet:
+    """Compact set of the (st_dev, st_ino) pairs seen during one scan.
+
+    Only hardlinked files are ever added, since a file with one link cannot
+    be seen twice. Each device's inode numbers live in an open-addressing
+    table of 64-bit integers that is grown to stay at most 5/8 full, about
+    20 bytes per inode, against over 100 for a Python set of tuples, so tens
+    of millions of hardlinked files fit in a few hundred MB. Batches are
+    inserted with array operations. Safe to use from several threads.
+    """
+    INITIAL_SLOTS = 1 << 10
+    # Fibonacci hashing: the top bits of the product spread runs of inode
+    # numbers evenly over the table
+    MULTIPLIER = 0x9E3779B97F4A7C15
+
+    def __init__(self):
+        self._tables = {}  # st_dev -> [table, count]; 0 marks an empty slot
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return sum(count for _, count in self._tables.values())
+
+    def nbytes(self):
+        with self._lock:
+            return sum(table.nbytes for table, _ in self._tables.values())
+
+    def add(self, device, inodes):
+        """Add non-zero inode numbers of one device.
+
+        Returns a boolean array that is true where an inode had not been
+        seen before, including earlier in the same call.
+        """
+        import numpy as np
+        keys = np.asarray(inodes, dtype=np.uint64)
+        unique, first_positions = np.unique(keys, return_index=True)
+        with self._lock:
+            entry = self._tables.get(device)
+            if entry is None:
+                entry = self._tables[device] = [np.zeros(self.INITIAL_SLOTS, dtype=np.uint64), 0]
+            if (entry[1] + len(unique)) * 8 > len(entry[0]) * 5:
+                entry[0] = self._grow(entry[0], entry[1] + len(unique))
+            added = self._insert(entry[0], unique)
+            entry[1] += int(added.sum())
+        first = np.zeros(len(keys), dtype=bool)
+        first[first_positions[added]] = True
+        return first
+
+    def _grow(self, table, count):
+        import numpy as np
+        slots = len(table)
+        while count * 8 > slots * 5:
+            slots *= 2
+        grown = np.zeros(slots, dtype=np.uint64)
+        self._insert(grown, table[table != 0])
+        return grown
+
+    def _insert(self, table, keys):
+        # Linear probing for distinct keys, one probe step per round for
+        # every key still looking. Keys racing for one empty slot claim it
+        # in order; the others find it taken and move on next round
+        import numpy as np
+        added = np.zeros(len(keys), dtype=bool)
+        mask = np.uint64(len(table) - 1)
+        shift = np.uint64(64 - (len(table).bit_length() - 1))
+        slots = (keys * np.uint64(self.MULTIPLIER)) >> shift
+        pending = np.arange(len(keys))
+        while len(pending):
+            current = table[slots[pending]]
+            found = current == keys[pending]
+            empty = current == 0
+            claimants = pending[empty]
+            _, winners = np.unique(slots[claimants], return_index=True)
+            winners = claimants[winners]
+            table[slots[winners]] = keys[winners]
+            added[winners] = True
+            occupied = pending[~found & ~empty]
+            slots[occupied] = (slots[occupied] + np.uint64(1)) & mask
+            pending = np.concatenate((occupied, np.setdiff1d(claimants, winners, assume_unique=True)))
+        return added
+
+
+class ScanTelemetry:
+    """Throughput and latency counters for one scan.
+
+    Listings report into it from any thread. Stat latencies are kept in a
+    histogram of power-of-two microsecond buckets: bucket 0 holds calls
+    under 1 us and bucket i calls from 2**(i-1) to 2**i us. phase() times
+    named stages of the caller's work.
+    """
+    BUCKETS = 24
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.finished = None
+        self.files = 0
+        self.dirs_listed = 0
+        self.dirs_cached = 0
+        self.list_ns = 0
+        self.stat_ns = 0
+        self.stat_histogram = [0] * self.BUCKETS
+        self.phases = {}
+        self._lock = threading.Lock()
+
+    def record_listing(self, files, list_ns, histogram, stat_ns):
+        with self._lock:
+            self.files += files
+            self.dirs_listed += 1
+            self.list_ns += list_ns
+            self.stat_ns += stat_ns
+            for bucket, count in enumerate(histogram):
+                self.stat_histogram[bucket] += count
+
+    def record_cached(self, files):
+        # A directory served from the scan index without being listed
+        with self._lock:
+            self.files += files
+            self.dirs_cached += 1
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - started
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    def elapsed(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    def stat_percentile(self, fraction):
+        """Upper bound, in microseconds, of the given fraction of stat calls."""
+        total = sum(self.stat_histogram)
+        if not total:
+            return 0
+        seen = 0
+        for bucket, count in enumerate(self.stat_histogram):
+            seen += count
+            if seen >= fraction * total:
+                return 1 << bucket
+        return 1 << (len(self.stat_histogram) - 1)
+
+    def as_dict(self):
+        elapsed = self.elapsed()
+        stat_calls = sum(self.stat_histogram)
+        dirs = self.dirs_listed + self.dirs_cached
+        return {
+            'elapsed': round(elapsed, 3),
+            'files': self.files,
+            'dirs': dirs,
+            'dirs_listed': self.dirs_listed,
+            'dirs_cached': self.dirs_cached,
+            'files_per_s': round(self.files / elapsed, 1) if elapsed else 0.0,
+            'dirs_per_s': round(dirs / elapsed, 1) if elapsed else 0.0,
+            'stat_calls': stat_calls,
+            'stat_mean_us': round(self.stat_ns / stat_calls / 1000, 2) if stat_calls else 0.0,
+            'stat_p50_us': self.stat_percentile(0.5),
+            'stat_p99_us': self.stat_percentile(0.99),
+            'stat_histogram_us': {
+                (f"<{1 << bucket}" if bucket == 0 else f"{1 << (bucket - 1)}-{1 << bucket}"): count
+                for bucket, count in enumerate(self.stat_histogram) if count
+            },
+            'listing_s': round(self.list_ns / 1e9, 3),
+            'phases': {name: round(seconds, 3) for name, seconds in self.phases.items()},
+        }
+
+
+class ProgressThrottle:
+    """Rate-limit progress reports from a worker to max_rate per second.
+
+    ready(value) is true when value differs from the last report and enough
+    time has passed; the caller then sends the update. Finishing states
+    should be sent unconditionally.
+    """
+
+    def __init__(self, max_rate=20):
+        self.interval = 1.0 / max_rate
+        self.last_time = 0.0
+        self.last_value = None
+
+    def ready(self, value):
+        now = time.monotonic()
+        if value == self.last_value or now - self.last_time < self.interval:
+            return False
+        self.last_time = now
+        self.last_value = value
+        return True
+
+
+def _match_form(path):
+    # Case-folded where the OS is case-insensitive, with '/' separators
+    return os.path.normcase(path).replace(os.sep, '/')
+
+
+class ScanFilter:
+    """Subtrees a scan should not descend into.
+
+    exclude holds glob patterns, matched against a directory's name, or
+    against its whole path when the pattern contains a separator, and
+    regular expressions prefixed with "re:", searched for in the path
+    written with '/' separators. With one_filesystem set, directories on a
+    different device from the scan root (other mounts, pseudo filesystems)
+    are skipped too. Subdirectories are pruned before they are queued, so
+    nothing below them is listed; every pruned directory is recorded in
+    skipped. Raises ValueError for an invalid regular expression.
+    """
+
+    def __init__(self, exclude=(), one_filesystem=False):
+        names, paths, regexes = [], [], []
+        for rule in exclude:
+            rule = rule.strip()
+            if not rule:
+                continue
+            if rule.startswith('re:'):
+                try:
+                    re.compile(rule[3:])
+                except re.error as e:
+                    raise ValueError(f"Invalid exclude pattern {rule!r}: {e}") from None
+                regexes.append(rule[3:])
+            elif '/' in rule or os.sep in rule:
+                paths.append(fnmatch.translate(_match_form(rule)))
+            else:
+                names.append(fnmatch.translate(os.path.normcase(rule)))
+        self.rules = [rule for rule in exclude if rule.strip()]
+        self._names = re.compile('|'.join(names)) if names else None
+        self._paths = re.compile('|'.join(paths)) if paths else None
+        self._regexes = re.compile('|'.join(f'(?:{regex})' for regex in regexes)) if regexes else None
+        self.one_filesystem = one_filesystem
+        self.root_device = None
+        self.skipped = []
+        self._lock = threading.Lock()
+
+    def active(self):
+        return bool(self.rules) or self.one_filesystem
+
+    def start(self, root):
+        """Reset the skipped list and note the root's device for a new scan."""
+        self.skipped = []
+        self.root_device = os.stat(root).st_dev if self.one_filesystem else None
+
+    def for_root(self, root):
+        """Return a filter for one root of a multi-root scan.
+
+        It has the same rules but its own skipped list, and stays on that
+        root's own device.
+        """
+        child = copy.copy(self)
+        child.skipped = []
+        child.root_device = os.stat(root).st_dev if self.one_filesystem else None
+        return child
+
+    def excludes(self, path):
+        form = _match_form(path)
+        if self._names is not None and self._names.match(form.rpartition('/')[2]):
+            return True
+        if self._paths is not None and self._paths.match(form):
+            return True
+        if self._regexes is not None and self._regexes.search(form):
+            return True
+        if self.root_device is not None:
+            try:
+                return os.lstat(path).st_dev != self.root_device
+            except OSError:
+                return False
+        return False
+
+    def prune(self, subdirs):
+        """Return the subdirectories to descend into, recording the rest."""
+        if not self.active():
+            return subdirs
+        kept = []
+        skipped = []
+        for subdir in subdirs:
+            (skipped if self.excludes(subdir) else kept).append(subdir)
+        if skipped:
+            with self._lock:
+                self.skipped.extend(skipped)
+        return kept
+
+
+def scan_tree(path, dirs=None, scan_filter=None, telemetry=None, inodes=None):
+    """Walk a tree once, top-down, yielding one batch per directory listed.
+
+    Each batch is (records, mtimes, dirs_visited, dirs_pending) where records
+    are the (file, ext, size, file_path) tuples found in that directory and
+    mtimes their st_mtime_ns values. The directory counters let callers
+    estimate progress without a separate counting pass. If a list is passed
+    as dirs, every directory listed is appended to it. A ScanFilter prunes
+    excluded subtrees before they are listed, and a ScanTelemetry collects
+    timings. With an InodeSet, records also carry their reclaimable size
+    (see allocated_sizes). Close the generator to stop early.
+    """
+    stack = [path]
+    dirs_visited = 0
+    while stack:
+        root = stack.pop()
+        mtimes = []
+        try:
+            records, subdirs = list_directory(root, mtimes, telemetry, inodes)
+        except OSError:
+            continue
+        dirs_visited += 1
+        if dirs is not None:
+            dirs.append(root)
+        if scan_filter is not None:
+            subdirs = scan_filter.prune(subdirs)
+        # Push in reverse so directories are visited in listing order
+        stack.extend(reversed(subdirs))
+        yield records, mtimes, dirs_visited, len(stack)
+
+
+def scan_tree_parallel(path, workers=8, dirs=None, scan_filter=None, telemetry=None, inodes=None):
+    """Walk a tree with a pool of threads draining a shared directory queue.
+
+    Yields the same (records, mtimes, dirs_visited, dirs_pending) batches as
+    scan_tree, but in completion order rather than top-down order. Totals
+    match the serial walk; only the order of batches differs between runs.
+    Unreadable directories are skipped; any other error raised while
+    listing or pruning a directory is raised from the generator. Closing
+    the generator stops the workers after their current listing.
+    """
+    work = queue.Queue()
+    results = queue.Queue()
+    lock = threading.Lock()
+    stop = threading.Event()
+    counters = {'visited': 0, 'pending': 1}
+
+    def worker():
+        while True:
+            root = work.get()
+            if root is None:
+                return
+            if stop.is_set():
+                continue
+            mtimes = []
+            try:
+                try:
+                    records, subdirs = list_directory(root, mtimes, telemetry, inodes)
+                    listed = True
+                except OSError:
+                    records, mtimes, subdirs = [], [], []
+                    listed = False
+                if scan_filter is not None:
+                    subdirs = scan_filter.prune(subdirs)
+            except Exception as error:
+                # The directory would stay pending forever and the consumer
+                # would wait for it; hand the error over to be raised there
+                results.put(error)
+                continue
+            # Count subdirectories before queueing them, and publish under the
+            # lock, so the batch that drops pending to zero is always the last
+            # one the consumer receives
+            with lock:
+                counters['visited'] += listed
+                if listed and dirs is not None:
+                    dirs.append(root)
+                counters['pending'] += len(subdirs) - 1
+                results.put((records, mtimes, counters['visited'], counters['pending']))
+            for subdir in subdirs:
+                work.put(subdir)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(max(1, workers))]
+    for thread in threads:
+        thread.start()
+    work.put(path)
+
+    try:
+        while True:
+            batch = results.get()
+            if isinstance(batch, Exception):
+                raise batch
+            yield batch
+            if batch[3] == 0:
+                break
+    finally:
+        stop.set()
+        for _ in threads:
+            work.put(None)
+        for thread in threads:
+            thread.join()
+
+
+def unique_roots(roots):
+    """Drop repeated roots and roots inside another root, keeping the order.
+
+    Roots are compared by their resolved paths, so a symlink to a folder
+    that is already scanned is dropped too. A root that contains earlier
+    roots replaces them.
+    """
+    kept = []
+    for root in roots:
+        resolved = os.path.normcase(os.path.realpath(root))
+        inside = os.path.join(resolved, '')
+        if any(resolved == other or resolved.startswith(os.path.join(other, '')) for _, other in kept):
+            continue
+        kept = [(path, other) for path, other in kept if not other.startswith(inside)]
+        kept.append((os.path.normpath(root), resolved))
+    return [path for path, _ in kept]
+
+
+def is_rotational(device):
+    """Return True if st_dev `device` is a spinning disk, as far as Linux's sysfs says.
+
+    Network, virtual and unknown devices count as not rotational.
+    """
+    if not hasattr(os, 'major'):
+        return False
+    base = f'/sys/dev/block/{os.major(device)}:{os.minor(device)}'
+    # Partitions have no queue of their own; it belongs to the parent disk
+    for path in (os.path.join(base, 'queue', 'rotational'), os.path.join(base, '..', 'queue', 'rotational')):
+        try:
+            with open(path) as f:
+                return f.read().strip() == '1'
+        except OSError:
+            continue
+    return False
+
+
+def device_workers(device, workers):
+    """Listing threads for one device.
+
+    A spinning disk gets one thread, because parallel listings there only
+    add seeks. SSDs and network filesystems get all `workers`.
+    """
+    return 1 if is_rotational(device) else workers
+
+
+def scan_roots(roots, workers=8, dirs=None, scan_filter=None, telemetry=None, root_stats=None,
+               budget=device_workers, inodes=None):
+    """Scan several roots at once, with one parallelism budget per device.
+
+    Repeated and nested roots are dropped (see unique_roots). Roots are
+    grouped by st_dev. Each device's roots are walked one after another by
+    budget(device, workers) threads, and different devices are walked
+    concurrently. A spinning disk is then never listed by competing walks,
+    while SSDs and network mounts still run fully parallel. Yields the same
+    (records, mtimes, dirs_visited, dirs_pending) batches as
+    scan_tree_parallel, with the counters summed over every root. If a dict
+    is passed as root_stats, it maps each root to its RootStats as the scan
+    proceeds. An error other than an unreadable directory is raised from
+    the generator. Closing the generator stops every device.
+    """
+    groups = {}
+    for root in unique_roots(roots):
+        try:
+            groups.setdefault(os.stat(root).st_dev, []).append(root)
+        except OSError:
+            continue
+    results = queue.Queue()
+    stop = threading.Event()
+
+    def scan_device(device, device_roots):
+        count = max(1, budget(device, workers))
+        try:
+            for root in device_roots:
+                if stop.is_set():
+                    break
+                stats = RootStats(root, device, count)
+                if root_stats is not None:
+                    root_stats[root] = stats
+                root_filter = scan_filter.for_root(root) if scan_filter is not None else None
+                started = time.perf_counter()
+                if count > 1:
+                    batches = scan_tree_parallel(root, count, dirs, root_filter, telemetry, inodes)
+                else:
+                    batches = scan_tree(root, dirs, root_filter, telemetry, inodes)
+                try:
+                    for records, mtimes, dirs_visited, dirs_pending in batches:
+                        if stop.is_set():
+                            break
+                        stats.add(records)
+                        stats.dirs_visited = dirs_visited
+                        results.put((root, records, mtimes, dirs_visited, dirs_pending))
+                finally:
+                    batches.close()
+                stats.elapsed = time.perf_counter() - started
+                if root_filter is not None:
+                    stats.dirs_skipped = len(root_filter.skipped)
+                    scan_filter.skipped.extend(root_filter.skipped)
+        except Exception as error:
+            # Raised from the generator, rather than ending the device early
+            results.put(error)
+        finally:
+            results.put(None)
+
+    threads = [threading.Thread(target=scan_device, args=item, daemon=True) for item in groups.items()]
+    for thread in threads:
+        thread.start()
+    # Roots not started yet count as one pending directory each
+    progress = {root: (0, 1) for device_roots in groups.values() for root in device_roots}
+    running = len(threads)
+    try:
+        while running:
+            item = results.get()
+            if item is None:
+                running -= 1
+                continue
+            if isinstance(item, Exception):
+                raise item
+            root, records, mtimes, dirs_visited, dirs_pending = item
+            progress[root] = (dirs_visited, dirs_pending)
+            yield (records, mtimes, sum(visited for visited, _ in progress.values()),
+                   sum(pending for _, pending in progress.values()))
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+def relist_directories(paths, known_dirs=(), scan_filter=None, roots=()):
+    """List directories again after they were reported as changed.
+
+    Returns (listings, gone, added, new_dirs). listings maps each directory
+    that still exists to its (records, mtimes); gone holds the ones that no
+    longer exist. Subdirectories not in known_dirs are walked in full: their
+    files are returned in added as (record, mtime) pairs and every directory
+    found is listed in new_dirs. With the scan's roots given, each directory
+    is filtered as part of the root that contains it, so one_filesystem
+    keeps to that root's own device.
+    """
+    listings = {}
+    gone = []
+    added = []
+    new_dirs = []
+    root_filters = {}
+    for root in paths:
+        mtimes = []
+        try:
+            records, subdirs = list_directory(root, mtimes)
+        except OSError:
+            gone.append(root)
+            continue
+        listings[root] = (records, mtimes)
+        path_filter = scan_filter
+        if scan_filter is not None and roots:
+            path_filter = _root_filter(scan_filter, root_filters, roots, root)
+        if path_filter is not None:
+            subdirs = path_filter.prune(subdirs)
+        for subdir in subdirs:
+            if subdir in known_dirs:
+                continue
+            for records, mtimes, _, _ in scan_tree(subdir, new_dirs, path_filter):
+                added.extend(zip(records, mtimes))
+    return listings, gone, added, new_dirs
+
+
+def _root_filter(scan_filter, root_filters, roots, path):
+    # The for_root() filter of the root containing path, made on first use;
+    # scan_filter itself when no root does or the root cannot be stat'ed
+    for root in roots:
+        if path == root or path.startswith(os.path.join(root, '')):
+            if root not in root_filters:
+                try:
+                    root_filters[root] = scan_filter.for_root(root)
+                except OSError:
+                    root_filters[root] = scan_filter
+            return root_filters[root]
+    return scan_filter
+
+
+class TopFiles:
+    """Keep only the N largest files seen, in O(N) memory.
+
+    With per_category set, a separate heap of N is kept for each category.
+    Files smaller than min_size are never retained. With allocated set,
+    files are ranked by the reclaimable size records carry from a scan with
+    an InodeSet instead of their apparent size.
+    """
+
+    def __init__(self, n, per_category=False, min_size=0, allocated=False):
+        self.n = n
+        self.per_category = per_category
+        self.min_size = min_size
+        self.size_field = 4 if allocated else 2
+        self.heaps = {}
+        self._seq = 0
+
+    def add(self, record, mtime=0):
+        size = record[self.size_field]
+        if size < self.min_size or self.n <= 0:
+            return
+        key = classify_extension(record[1]) if self.per_category else None
+        heap = self.heaps.get(key)
+        if heap is None:
+            heap = self.heaps[key] = []
+        # The sequence number breaks size ties so records are never compared
+        if len(heap) < self.n:
+            heapq.heappush(heap, (size, self._seq, record, mtime))
+        elif size > heap[0][0]:
+            heapq.heapreplace(heap, (size, self._seq, record, mtime))
+        else:
+            return
+        self._seq += 1
+
+    def extend(self, records, mtimes=None):
+        if mtimes is None:
+            mtimes = [0] * len(records)
+        for record, mtime in zip(records, mtimes):
+            self.add(record, mtime)
+
+    def results(self):
+        """Return the retained (record, mtime) pairs, largest first."""
+        entries = [entry for heap in self.heaps.values() for entry in heap]
+        entries.sort(key=lambda entry: (-entry[0], entry[1]))
+        return [(record, mtime) for _, _, record, mtime in entries]
+
+
+class ScanStats:
+    """Running file counts per category and total size, in constant memory.
+
+    reclaimable_size totals the reclaimable sizes of records that carry
+    one, and stays None when none do.
+    """
+
+    def __init__(self):
+        self.file_counts = {category: 0 for category in CATEGORIES}
+        self.total_size = 0
+        self.reclaimable_size = None
+        self.dirs_visited = 0
+        self.dirs_skipped = 0
+
+    def add(self, records):
+        file_counts = self.file_counts
+        for record in records:
+            self.total_size += record[2]
+            file_counts[classify_extension(record[1])] += 1
+        if records and len(records[0]) > 4:
+            self.reclaimable_size = (self.reclaimable_size or 0) + sum(record[4] for record in records)
+
+    def as_dict(self):
+        result = {
+            'files': sum(self.file_counts.values()),
+            'total_size': self.total_size,
+            'dirs': self.dirs_visited,
+            'dirs_skipped': self.dirs_skipped,
+            **self.file_counts,
+        }
+        if self.reclaimable_size is not None:
+            result['reclaimable_size'] = self.reclaimable_size
+        return result
+
+
+class RootStats(ScanStats):
+    """ScanStats for one root of a multi-root scan, plus where and how it was scanned."""
+
+    def __init__(self, root, device=None, workers=1):
+        super().__init__()
+        self.root = root
+        self.device = device
+        self.workers = workers
+        self.elapsed = None
+
+    def as_dict(self):
+        return {'root': self.root, 'device': self.device, 'workers': self.workers,
+                'elapsed': None if self.elapsed is None else round(self.elapsed, 3), **super().as_dict()}
+
+
+def iter_files(path, workers=1, stats=None, scan_filter=None, telemetry=None, root_stats=None, inodes=None):
+    """Yield (record, mtime) for every file under path as it is found.
+
+    Nothing is accumulated, so memory stays constant however large the tree
+    is. If a ScanStats is passed, it is updated as the walk proceeds. A
+    ScanFilter prunes excluded subtrees and a ScanTelemetry collects timings.
+    path may also be a list of roots, which are scanned with scan_roots and
+    reported per root in root_stats. With an InodeSet, records also carry
+    their reclaimable size.
+    """
+    roots = [path] if isinstance(path, str) else unique_roots(path)
+    if scan_filter is not None:
+        scan_filter.start(roots[0])
+    if len(roots) > 1:
+        batches = scan_roots(roots, workers, scan_filter=scan_filter, telemetry=telemetry, root_stats=root_stats,
+                             inodes=inodes)
+    elif workers > 1:
+        batches = scan_tree_parallel(roots[0], workers, scan_filter=scan_filter, telemetry=telemetry, inodes=inodes)
+    else:
+        batches = scan_tree(roots[0], scan_filter=scan_filter, telemetry=telemetry, inodes=inodes)
+    for records, mtimes, dirs_visited, _ in batches:
+        if stats is not None:
+            stats.add(records)
+            stats.dirs_visited = dirs_visited
+            if scan_filter is not None:
+                stats.dirs_skipped = len(scan_filter.skipped)
+        yield from zip(records, mtimes)
+
+
+def top_files(path, n, per_category=False, min_size=0, workers=1, stats=None, scan_filter=None,
+              telemetry=None, inodes=None):
+    """Return the (record, mtime) pairs of the n largest files, largest first.
+
+    With an InodeSet, files are ranked by their reclaimable size.
+    """
+    top = TopFiles(n, per_category, min_size, allocated=inodes is not None)
+    for record, mtime in iter_files(path, workers, stats, scan_filter, telemetry, inodes=inodes):
+        top.add(record, mtime)
+    return top.results()
@@ -0,0 +1,319 @@
+import os
+import queue
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from scan_engine import RootStats, classify_extension, device_workers, list_directory, unique_roots
+
+
+def default_index_path():
+    base = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'file_sorter', 'scan_index.sqlite')
+
+
+def _subtree_bounds(path):
+    # Every path strictly below `path` sorts between these two keys
+    prefix = os.path.join(path, '')
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _stat_and_list(root, stored_mtime, telemetry=None):
+    # Runs on a listing thread, away from the SQLite connection: stat the
+    # directory and list it unless the index's copy is still current.
+    # Returns (mtime, None) for a current directory
+    dir_mtime = os.stat(root).st_mtime_ns
+    if dir_mtime == stored_mtime:
+        return dir_mtime, None
+    mtimes = []
+    records, subdirs = list_directory(root, mtimes, telemetry)
+    return dir_mtime, (records, mtimes, subdirs)
+
+
+class _RootWalk:
+    # One root of a parallel walk: directories still to submit, and how
+    # many of its directories are being listed. In a multi-root scan it
+    # has its own filter, whose skipped list is added to the scan's
+    # filter when the root is done, and its own RootStats
+    def __init__(self, root, scan_filter=None, stats=None, parent_filter=None):
+        self.root = root
+        self.scan_filter = scan_filter
+        self.stats = stats
+        self.parent_filter = parent_filter
+        self.frontier = [root]
+        self.in_flight = 0
+        self.started = None
+
+    def finish(self):
+        if self.stats is not None and self.started is not None:
+            self.stats.elapsed = time.perf_counter() - self.started
+        if self.parent_filter is not None:
+            self.stats.dirs_skipped = len(self.scan_filter.skipped)
+            self.parent_filter.skipped.extend(self.scan_filter.skipped)
+
+
+class ScanIndex:
+    """On-disk index of scanned files and directory mtimes.
+
+    An incremental scan stats every known directory but only re-lists the
+    ones whose mtime changed; files in unchanged directories are served from
+    the stored rows. A directory's mtime does not change when a file inside
+    it is rewritten in place, so a full scan is still needed to pick up size
+    changes of existing files.
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or default_index_path()
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS dirs (
+                path TEXT PRIMARY KEY,
+                parent TEXT,
+                mtime INTEGER
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent);
+            CREATE TABLE IF NOT EXISTS files (
+                dir TEXT NOT NULL,
+                name TEXT NOT NULL,
+                ext TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime INTEGER NOT NULL,
+                category TEXT NOT NULL,
+                PRIMARY KEY (dir, name)
+            ) WITHOUT ROWID;
+        ''')
+
+    def close(self):
+        self.conn.close()
+
+    def scan(self, path, incremental=True, dirs=None, scan_filter=None, telemetry=None, workers=1):
+        """Walk `path` top-down, yielding (records, mtimes, visited, pending).
+
+        Batches have the same shape as scan_engine.scan_tree, and dirs, if
+        given, collects every directory visited. Subtrees pruned by
+        scan_filter are neither listed nor dropped from the index. The index
+        is updated as the walk proceeds and committed when it completes or
+        the generator is closed early.
+
+        With workers > 1, directories are checked and listed by that many
+        threads, as in scan_engine.scan_tree_parallel, and batches come in
+        completion order. The index itself is only read and written from
+        the thread consuming the batches.
+        """
+        if workers > 1:
+            return self._scan_parallel([(workers, [_RootWalk(os.path.normpath(path), scan_filter)])],
+                                       incremental, dirs, telemetry)
+        return self._scan_serial(path, incremental, dirs, scan_filter, telemetry)
+
+    def scan_roots(self, roots, incremental=True, workers=8, dirs=None, scan_filter=None, telemetry=None,
+                   root_stats=None, budget=device_workers):
+        """Scan several roots through the index, with one parallelism budget per device.
+
+        Roots are scheduled as by scan_engine.scan_roots: repeated and
+        nested roots are dropped, and roots are grouped by st_dev. Each
+        device's roots are walked one after another by budget(device,
+        workers) threads, and different devices are walked concurrently.
+        Yields the same batches as scan, with the counters summed over
+        every root. If a dict is passed as root_stats, it maps each root to
+        its RootStats. Closing the generator stops every device.
+        """
+        groups = {}
+        for root in unique_roots(roots):
+            try:
+                groups.setdefault(os.stat(root).st_dev, []).append(root)
+            except OSError:
+                continue
+        plan = []
+        for device, device_roots in groups.items():
+            count = max(1, budget(device, workers))
+            walks = []
+            for root in device_roots:
+                stats = RootStats(root, device, count)
+                if root_stats is not None:
+                    root_stats[root] = stats
+                root_filter = scan_filter.for_root(root) if scan_filter is not None else None
+                walks.append(_RootWalk(root, root_filter, stats, scan_filter))
+            plan.append((count, walks))
+        return self._scan_parallel(plan, incremental, dirs, telemetry)
+
+    def _scan_serial(self, path, incremental, dirs, scan_filter, telemetry):
+        conn = self.conn
+        stack = [os.path.normpath(path)]
+        dirs_visited = 0
+        try:
+            while stack:
+                root = stack.pop()
+                try:
+                    dir_mtime = os.stat(root).st_mtime_ns
+                except OSError:
+                    self._forget_subtree(root)
+                    continue
+
+                if incremental and self._stored_mtime(root) == dir_mtime:
+                    records, mtimes, subdirs = self._stored_listing(root, telemetry)
+                else:
+                    try:
+                        records, mtimes, subdirs = self._relist(root, dir_mtime, telemetry)
+                    except OSError:
+                        self._forget_subtree(root)
+                        continue
+
+                dirs_visited += 1
+                if dirs is not None:
+                    dirs.append(root)
+                if scan_filter is not None:
+                    subdirs = scan_filter.prune(subdirs)
+                stack.extend(reversed(subdirs))
+                yield records, mtimes, dirs_visited, len(stack)
+            conn.commit()
+        except GeneratorExit:
+            # Stopped early: every directory written so far is complete
+            conn.commit()
+            raise
+        except BaseException:
+            conn.rollback()
+            raise
+
+    def _scan_parallel(self, groups, incremental, dirs, telemetry):
+        # groups holds (threads, walks) per device: each device gets a pool
+        # of its own and walks its roots one after another. Only directory
+        # stats and listings run on the pools; every query and write stays
+        # on this thread, which owns the connection
+        conn = self.conn
+        devices = []
+        in_flight = {}
+        finished = queue.Queue()  # Futures in the order they finish
+        dirs_visited = 0
+
+        def fill(device):
+            # Keep the device's threads busy with the current root, and
+            # start its next root once nothing of the current one is left
+            walks = device['walks']
+            while walks and device['busy'] < device['limit']:
+                walk = walks[0]
+                if walk.frontier:
+                    if walk.started is None:
+                        walk.started = time.perf_counter()
+                    directory = walk.frontier.pop()
+                    stored_mtime = self._stored_mtime(directory) if incremental else None
+                    future = device['pool'].submit(_stat_and_list, directory, stored_mtime, telemetry)
+                    in_flight[future] = (device, walk, directory)
+                    future.add_done_callback(finished.put)
+                    walk.in_flight += 1
+                    device['busy'] += 1
+                elif walk.in_flight:
+                    break
+                else:
+                    walks.pop(0).finish()
+
+        def pending():
+            return sum(len(walk.frontier) + walk.in_flight for device in devices for walk in device['walks'])
+
+        try:
+            for threads, walks in groups:
+                # A few listings queued per thread, so none waits on this
+                # thread's index work
+                devices.append({'pool': ThreadPoolExecutor(max_workers=threads), 'limit': threads * 2,
+                                'walks': list(walks), 'busy': 0})
+            for device in devices:
+                fill(device)
+            while in_flight:
+                future = finished.get()
+                device, walk, root = in_flight.pop(future)
+                walk.in_flight -= 1
+                device['busy'] -= 1
+                try:
+                    dir_mtime, listing = future.result()
+                except OSError:
+                    self._forget_subtree(root)
+                    fill(device)
+                    continue
+                if listing is None:
+                    records, mtimes, subdirs = self._stored_listing(root, telemetry)
+                else:
+                    records, mtimes, subdirs = listing
+                    self._store_listing(root, dir_mtime, records, mtimes, subdirs)
+                dirs_visited += 1
+                if dirs is not None:
+                    dirs.append(root)
+                if walk.stats is not None:
+                    walk.stats.add(records)
+                    walk.stats.dirs_visited += 1
+                if walk.scan_filter is not None:
+                    subdirs = walk.scan_filter.prune(subdirs)
+                walk.frontier.extend(reversed(subdirs))
+                fill(device)
+                yield records, mtimes, dirs_visited, pending()
+            conn.commit()
+        except GeneratorExit:
+            # Stopped early: every directory written so far is complete
+            conn.commit()
+            raise
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            for device in devices:
+                device['pool'].shutdown(cancel_futures=True)
+
+    def subtree_counts(self, paths):
+        """Return (dirs, files) recorded at or below `paths` by earlier scans."""
+        dirs = files = 0
+        for path in paths:
+            low, high = _subtree_bounds(path)
+            dirs += self.conn.execute(
+                'SELECT COUNT(*) FROM dirs WHERE path = ? OR (path >= ? AND path < ?)', (path, low, high)).fetchone()[0]
+            files += self.conn.execute(
+                'SELECT COUNT(*) FROM files WHERE dir = ? OR (dir >= ? AND dir < ?)', (path, low, high)).fetchone()[0]
+        return dirs, files
+
+    def _stored_mtime(self, path):
+        row = self.conn.execute('SELECT mtime FROM dirs WHERE path = ?', (path,)).fetchone()
+        return row[0] if row is not None else None
+
+    def _stored_listing(self, root, telemetry=None):
+        # A directory unchanged since it was last listed, from the index
+        conn = self.conn
+        rows = conn.execute('SELECT name, ext, size, mtime FROM files WHERE dir = ?', (root,)).fetchall()
+        records = [(name, ext, size, os.path.join(root, name)) for name, ext, size, _ in rows]
+        mtimes = [row[3] for row in rows]
+        subdirs = [subdir for (subdir,) in conn.execute(
+            'SELECT path FROM dirs WHERE parent = ? ORDER BY path', (root,))]
+        if telemetry is not None:
+            telemetry.record_cached(len(records))
+        return records, mtimes, subdirs
+
+    def _relist(self, root, dir_mtime, telemetry=None):
+        mtimes = []
+        records, subdirs = list_directory(root, mtimes, telemetry)
+        self._store_listing(root, dir_mtime, records, mtimes, subdirs)
+        return records, mtimes, subdirs
+
+    def _store_listing(self, root, dir_mtime, records, mtimes, subdirs):
+        conn = self.conn
+        # Drop subtrees for directories that disappeared since the last scan
+        current = set(subdirs)
+        for (old_subdir,) in conn.execute('SELECT path FROM dirs WHERE parent = ?', (root,)).fetchall():
+            if old_subdir not in current:
+                self._forget_subtree(old_subdir)
+
+        conn.execute('DELETE FROM files WHERE dir = ?', (root,))
+        conn.executemany(
+            'INSERT INTO files (dir, name, ext, size, mtime, category) VALUES (?, ?, ?, ?, ?, ?)',
+            [(root, name, ext, size, mtime, classify_extension(ext))
+             for (name, ext, size, _), mtime in zip(records, mtimes)])
+        conn.execute(
+            'INSERT OR REPLACE INTO dirs (path, parent, mtime) VALUES (?, ?, ?)',
+            (root, os.path.dirname(root), dir_mtime))
+        # Register new subdirectories with no mtime so they are listed next
+        conn.executemany(
+            'INSERT OR IGNORE INTO dirs (path, parent, mtime) VALUES (?, ?, NULL)',
+            [(subdir, root) for subdir in subdirs])
+
+    def _forget_subtree(self, path):
+        low, high = _subtree_bounds(path)
+        self.conn.execute('DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)', (path, low, high))
+        self.conn.execute('DELETE FROM files WHERE dir = ? OR (dir >= ? AND dir < ?)', (path, low, high))
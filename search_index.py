@@ -0,0 +1,270 @@
+import fnmatch
+import os
+import re
+from itertools import repeat
+
+import numpy as np
+
+# Single-bit masks for the 64 signature buckets
+_BITS = np.left_shift(np.uint64(1), np.arange(64, dtype=np.uint64))
+_WILDCARDS = re.compile(r'\[[^\]]*\]|[*?]')
+_CHUNK_ROWS = 1 << 18
+
+
+def _lower(text):
+    return text.lower().encode('utf-8', 'surrogatepass')
+
+
+def _signatures(buffer, starts):
+    # Per-row bitmask of hashed trigrams and bigrams. Windows that run into
+    # the next row only add bits, so a row's signature can over-match but
+    # never under-match; search results are always verified.
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    count = len(starts) - 1
+    trigrams = np.empty(count, dtype=np.uint64)
+    bigrams = np.empty(count, dtype=np.uint64)
+    for first in range(0, count, _CHUNK_ROWS):
+        last = min(first + _CHUNK_ROWS, count)
+        begin, end = starts[first], starts[last]
+        chunk = np.concatenate((data[begin:end], np.zeros(2, dtype=np.uint8)))
+        # uint8 arithmetic wraps, which is fine for a hash taken mod 64
+        pair = chunk[:-1] * np.uint8(31)
+        pair += chunk[1:] * np.uint8(7)
+        triple = pair[:-1] * np.uint8(5)
+        triple += chunk[2:]
+        offsets = starts[first:last] - begin
+        bigrams[first:last] = np.bitwise_or.reduceat(_BITS[pair[:-1] & np.uint8(63)], offsets)
+        trigrams[first:last] = np.bitwise_or.reduceat(_BITS[triple & np.uint8(63)], offsets)
+    return trigrams, bigrams
+
+
+def _needle_signature(needle):
+    chunk = np.frombuffer(needle, dtype=np.uint8)
+    pair = chunk[:-1] * np.uint8(31) + chunk[1:] * np.uint8(7)
+    triple = pair[:-1] * np.uint8(5) + chunk[2:]
+    trigrams = np.bitwise_or.reduce(_BITS[triple & np.uint8(63)]) if len(chunk) > 2 else np.uint64(0)
+    bigrams = np.bitwise_or.reduce(_BITS[pair & np.uint8(63)]) if len(chunk) > 1 else np.uint64(0)
+    return np.uint64(trigrams), np.uint64(bigrams)
+
+
+class SearchIndex:
+    """Case-insensitive substring and glob search over a ResultStore.
+
+    Lowercased names are packed into one buffer, NUL-separated, next to a
+    64-bit trigram signature and a 64-bit bigram signature per row. A query
+    first keeps the rows whose signatures contain every bit of the query's
+    own, a couple of vector operations however many rows there are, and
+    only those candidates are checked exactly. Anchored globs such as
+    '*.jpg' are answered by comparing bytes at the row ends instead.
+
+    Queries without a path separator match file names; queries with one
+    match full paths, using the store's interned directories so each
+    directory is tested once. Rows appended to the store are indexed on the
+    next search, and remove_rows() compacts the index alongside the store.
+    Names whose lowercase form has a different UTF-8 length are matched as
+    stored.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.names = bytearray()
+        self.starts = np.zeros(1, dtype=np.int64)  # Row i is names[starts[i]:starts[i + 1] - 1]
+        self.trigrams = np.zeros(0, dtype=np.uint64)
+        self.bigrams = np.zeros(0, dtype=np.uint64)
+        self.dirs = []  # Lowercased store.dirs
+        self._dir_text = ''  # The same, each followed by a NUL, once joined
+        self._dir_starts = np.zeros(1, dtype=np.int64)
+        self.update()
+
+    def __len__(self):
+        return len(self.starts) - 1
+
+    def nbytes(self):
+        return len(self.names) + self.starts.nbytes + self.trigrams.nbytes + self.bigrams.nbytes
+
+    def update(self):
+        """Index rows and directories added to the store since the last call."""
+        store = self.store
+        self.dirs.extend(prefix.lower() for prefix in store.dirs[len(self.dirs):])
+        first, last = len(self), len(store)
+        if first >= last:
+            return
+        offsets = np.frombuffer(store.name_offsets, dtype=np.uint64)[first:last + 1].astype(np.int64)
+        raw = bytes(store.name_buffer[offsets[0]:offsets[-1]])
+        offsets -= offsets[0]
+        lowered = bytearray(raw.lower())
+        if not raw.isascii():
+            # bytes.lower() only folds ASCII; redo the rows that have more
+            high = np.flatnonzero(np.frombuffer(raw, dtype=np.uint8) >= 0x80)
+            for row in np.unique(np.searchsorted(offsets, high, side='right') - 1).tolist():
+                begin, end = offsets[row], offsets[row + 1]
+                name = _lower(raw[begin:end].decode('utf-8', 'surrogatepass'))
+                if len(name) == end - begin:
+                    lowered[begin:end] = name
+
+        # Insert a NUL after every name so matches never span two rows
+        count = last - first
+        starts = offsets[:-1] + np.arange(count)
+        packed = np.zeros(len(lowered) + count, dtype=np.uint8)
+        is_name = np.ones(len(packed), dtype=bool)
+        is_name[offsets[1:] + np.arange(count)] = False
+        packed[is_name] = np.frombuffer(lowered, dtype=np.uint8)
+        packed_starts = np.append(starts, len(packed))
+        trigrams, bigrams = _signatures(packed, packed_starts)
+
+        self.starts = np.concatenate((self.starts[:-1], packed_starts + len(self.names)))
+        self.names += packed.tobytes()
+        self.trigrams = np.concatenate((self.trigrams, trigrams))
+        self.bigrams = np.concatenate((self.bigrams, bigrams))
+
+    def remove_rows(self, rows):
+        # Called with the store's removed rows; rows not indexed yet are
+        # only in the store's tail and need nothing here
+        rows = np.asarray(rows, dtype=np.int64)
+        rows = rows[rows < len(self)]
+        if not len(rows):
+            return
+        keep = np.ones(len(self), dtype=bool)
+        keep[rows] = False
+        lengths = np.diff(self.starts)
+        data = np.frombuffer(self.names, dtype=np.uint8)
+        self.names = bytearray(data[np.repeat(keep, lengths)].tobytes())
+        self.starts = np.concatenate(([0], np.cumsum(lengths[keep])))
+        self.trigrams = self.trigrams[keep]
+        self.bigrams = self.bigrams[keep]
+
+    def search(self, query, rows=None):
+        """Return the sorted rows matching `query`, optionally only among `rows`.
+
+        Plain text matches as a substring; '*', '?' and '[...]' make it a
+        glob that must match the whole name, or for paths the last whole
+        components of the path ('photos/*.jpg' matches '/home/me/photos/a.jpg').
+        """
+        self.update()
+        query = query.strip().lower()
+        if os.altsep:
+            query = query.replace(os.altsep, os.sep)
+        rows = np.arange(len(self)) if rows is None else np.unique(np.asarray(rows, dtype=np.int64))
+        if not query or not len(rows):
+            return rows
+        path_mode = os.sep in query
+        if _WILDCARDS.search(query) is None:
+            return self._path_contains(query, rows) if path_mode else self._name_contains(_lower(query), rows)
+        return self._glob(query, path_mode, rows)
+
+    def _filter(self, needles, rows):
+        # Rows whose signatures include every needle's bits
+        trigrams = bigrams = np.uint64(0)
+        for needle in needles:
+            needle_trigrams, needle_bigrams = _needle_signature(needle)
+            trigrams |= needle_trigrams
+            bigrams |= needle_bigrams
+        if not trigrams and not bigrams:
+            return rows
+        keep = (self.trigrams[rows] & trigrams) == trigrams
+        keep &= (self.bigrams[rows] & bigrams) == bigrams
+        return rows[keep]
+
+    def _name_contains(self, needle, rows, filtered=False):
+        if len(needle) == 1 and len(rows) == len(self):
+            # No bigrams to filter on; one pass over the buffer is cheaper
+            # than testing every row
+            positions = np.flatnonzero(np.frombuffer(self.names, dtype=np.uint8) == needle[0])
+            hit = np.zeros(len(self), dtype=bool)
+            hit[np.searchsorted(self.starts, positions, side='right') - 1] = True
+            return np.flatnonzero(hit)
+        if not filtered:
+            rows = self._filter([needle], rows)
+        found = np.fromiter(map(self.names.find, repeat(needle),
+                                self.starts[rows].tolist(), (self.starts[rows + 1] - 1).tolist()),
+                            dtype=np.int64, count=len(rows))
+        return rows[found >= 0]
+
+    def _name_affix(self, needle, rows, suffix=False):
+        # Rows whose name starts (or ends) with needle, compared one byte
+        # position at a time across all rows at once
+        data = np.frombuffer(self.names, dtype=np.uint8)
+        rows = rows[self._lengths(rows) >= len(needle)]
+        base = self.starts[rows + 1] - 1 - len(needle) if suffix else self.starts[rows]
+        for position, byte in enumerate(needle):
+            match = data[base + position] == byte
+            rows, base = rows[match], base[match]
+        return rows
+
+    def _lengths(self, rows):
+        return self.starts[rows + 1] - self.starts[rows] - 1
+
+    def _dir_mask(self, needle):
+        # Directories containing needle, found in one joined string; a
+        # needle ending in NUL matches directories ending with the rest
+        if len(self._dir_starts) - 1 != len(self.dirs):
+            self._dir_text = '\0'.join(self.dirs) + '\0'
+            lengths = np.fromiter(map(len, self.dirs), dtype=np.int64, count=len(self.dirs)) + 1
+            self._dir_starts = np.concatenate(([0], np.cumsum(lengths)))
+        text = self._dir_text
+        if text.count(needle) > 1000:
+            # Many hits: piece lengths give every position without a loop
+            lengths = np.fromiter(map(len, text.split(needle)), dtype=np.int64)
+            positions = np.cumsum(lengths[:-1]) + np.arange(len(lengths) - 1) * len(needle)
+        else:
+            positions = []
+            position = text.find(needle)
+            while position >= 0:
+                positions.append(position)
+                position = text.find(needle, position + len(needle))
+        mask = np.zeros(len(self.dirs), dtype=bool)
+        mask[np.searchsorted(self._dir_starts, np.asarray(positions, dtype=np.int64), side='right') - 1] = True
+        return mask
+
+    def _path_contains(self, query, rows):
+        # The match lies inside the directory, inside the name, or ends in
+        # the name with its part up to the last separator ending the directory
+        dir_ids = np.frombuffer(self.store.dir_ids, dtype=np.uint32)
+        if len(rows) != len(self):
+            dir_ids = dir_ids[rows]
+        inside = self._dir_mask(query)
+        found = rows[inside[dir_ids]] if inside.any() else rows[:0]
+        split = query.rfind(os.sep) + 1
+        head, tail = query[:split], query[split:]
+        if not head:
+            found = np.union1d(found, self._name_contains(_lower(tail), rows))
+        elif tail:
+            ends = self._dir_mask(head + '\0')
+            if ends.any():
+                found = np.union1d(found, self._name_affix(_lower(tail), rows[ends[dir_ids]]))
+        return found
+
+    def _glob(self, query, path_mode, rows):
+        if path_mode and not query.startswith('*'):
+            query = '*' + query if query.startswith(os.sep) else '*' + os.sep + query
+        literals = [literal for literal in _WILDCARDS.split(query) if literal]
+        if not literals:
+            if not query.strip('*'):
+                return rows
+        elif path_mode:
+            # Every literal run must occur in the path; the longest is
+            # usually the most selective, so it narrows the rows first
+            for literal in sorted(literals, key=len, reverse=True):
+                if literal.strip(os.sep):
+                    rows = self._path_contains(literal, rows)
+        else:
+            rows = self._filter([_lower(literal) for literal in literals], rows)
+            if not query.startswith(('*', '?', '[')):
+                rows = self._name_affix(_lower(literals[0]), rows)
+            if not query.endswith(('*', '?', ']')):
+                rows = self._name_affix(_lower(literals[-1]), rows, suffix=True)
+            if query.strip('*') == literals[0]:
+                # 'lit*' and '*lit' are exact by now; '*lit*' is a substring
+                if query.startswith('*') and query.endswith('*'):
+                    return self._name_contains(_lower(literals[0]), rows, filtered=True)
+                return rows
+        pattern = re.compile(fnmatch.translate(query), re.DOTALL)
+        return rows[np.fromiter(map(pattern.match, self._texts(rows, path_mode)), dtype=bool, count=len(rows))]
+
+    def _texts(self, rows, path_mode):
+        names = self.names
+        dir_ids = self.store.dir_ids
+        dirs = self.dirs
+        for row, begin, end in zip(rows.tolist(), self.starts[rows].tolist(), (self.starts[rows + 1] - 1).tolist()):
+            name = names[begin:end].decode('utf-8', 'surrogatepass')
+            yield dirs[dir_ids[row]] + name if path_mode else name
@@ -0,0 +1,303 @@
+"""Scan snapshots on disk and streaming diffs between them.
+
+A snapshot holds every file and directory of a scan as (path, size, mtime,
+kind) entries, sorted by the UTF-8 bytes of their paths. Directory entries
+carry the total size of their subtree. The file starts with MAGIC, then
+HEADER (file, directory and byte counts plus the length of a JSON metadata
+block) and the metadata. Entries follow in blocks of up to BLOCK_ENTRIES,
+each a BLOCK header (entry count, compressed length) followed by zlib data:
+the sizes and mtimes as little-endian int64 columns, one kind byte per
+entry, and the NUL-separated paths. A block with no entries ends the file.
+
+Because both sides are sorted, diff_snapshots compares two snapshots a
+block at a time, like a merge join. Memory then depends on the block size
+and the number of changes kept, not on the number of entries.
+"""
+import json
+import os
+import struct
+import time
+import zlib
+from bisect import bisect_right
+
+import numpy as np
+
+MAGIC = b'FSSNAP1\n'
+HEADER = struct.Struct('<QQQI')  # files, directories, file bytes, metadata length
+BLOCK = struct.Struct('<II')  # entries, compressed length
+BLOCK_ENTRIES = 65536
+FILE, DIRECTORY = 0, 1
+KIND_NAMES = {FILE: 'file', DIRECTORY: 'folder'}
+CHANGES = ('added', 'removed', 'grown', 'shrunk')
+
+
+def default_snapshot_dir():
+    base = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'file_sorter', 'snapshots')
+
+
+def _encode(path):
+    return path.encode('utf-8', 'surrogatepass')
+
+
+def _decode(path):
+    return path.decode('utf-8', 'surrogatepass')
+
+
+class SnapshotWriter:
+    """Write sorted entries to a snapshot file.
+
+    Call write() with consecutive runs of entries in ascending path order,
+    then close(). The file is written under a temporary name and only
+    replaces `path` once it is complete.
+    """
+
+    def __init__(self, path, roots=(), created=None):
+        self.path = path
+        self.metadata = json.dumps({'roots': list(roots), 'created': created or time.time()}).encode()
+        self.files = self.dirs = self.bytes = 0
+        self._last = None
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._temp = path + '.tmp'
+        self._file = open(self._temp, 'wb')
+        self._file.write(MAGIC + HEADER.pack(0, 0, 0, len(self.metadata)) + self.metadata)
+
+    def write(self, paths, sizes, mtimes, kinds):
+        """Append entries: paths as bytes, sizes, mtimes and kinds as sequences of the same length."""
+        if not paths:
+            return
+        if self._last is not None and paths[0] <= self._last:
+            raise ValueError('snapshot entries must be written in ascending path order')
+        sizes = np.asarray(sizes, dtype='<i8')
+        mtimes = np.asarray(mtimes, dtype='<i8')
+        kinds = np.asarray(kinds, dtype=np.uint8)
+        for start in range(0, len(paths), BLOCK_ENTRIES):
+            end = min(start + BLOCK_ENTRIES, len(paths))
+            data = zlib.compress(b''.join((sizes[start:end].tobytes(), mtimes[start:end].tobytes(),
+                                           kinds[start:end].tobytes(), b'\0'.join(paths[start:end]))), 1)
+            self._file.write(BLOCK.pack(end - start, len(data)))
+            self._file.write(data)
+        is_file = kinds == FILE
+        self.files += int(np.count_nonzero(is_file))
+        self.dirs += len(paths) - int(np.count_nonzero(is_file))
+        self.bytes += int(sizes[is_file].sum())
+        self._last = paths[-1]
+
+    def close(self):
+        self._file.write(BLOCK.pack(0, 0))
+        self._file.seek(len(MAGIC))
+        self._file.write(HEADER.pack(self.files, self.dirs, self.bytes, len(self.metadata)))
+        self._file.close()
+        os.replace(self._temp, self.path)
+
+    def abort(self):
+        self._file.close()
+        os.remove(self._temp)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class SnapshotReader:
+    """Read a snapshot's header, then its entries a block at a time."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            if self._file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a file sorter snapshot")
+            self.files, self.dirs, self.bytes, metadata_length = HEADER.unpack(self._file.read(HEADER.size))
+            metadata = json.loads(self._file.read(metadata_length))
+        except (ValueError, struct.error):
+            self._file.close()
+            raise ValueError(f"{path} is not a file sorter snapshot") from None
+        self.roots = metadata.get('roots', [])
+        self.created = metadata.get('created')
+        self._entries_start = self._file.tell()
+
+    def blocks(self):
+        """Yield (paths, sizes, mtimes, kinds) per block; paths are bytes, the rest numpy arrays."""
+        self._file.seek(self._entries_start)
+        while True:
+            count, length = BLOCK.unpack(self._file.read(BLOCK.size))
+            if not count:
+                return
+            data = zlib.decompress(self._file.read(length))
+            sizes = np.frombuffer(data, dtype='<i8', count=count)
+            mtimes = np.frombuffer(data, dtype='<i8', count=count, offset=8 * count)
+            kinds = np.frombuffer(data, dtype=np.uint8, count=count, offset=16 * count)
+            yield data[17 * count:].split(b'\0'), sizes, mtimes, kinds
+
+    def __iter__(self):
+        # (path, size, mtime, kind) tuples, for callers that want plain values
+        for paths, sizes, mtimes, kinds in self.blocks():
+            yield from zip(map(_decode, paths), sizes.tolist(), mtimes.tolist(), kinds.tolist())
+
+    def info(self):
+        return {'path': self.path, 'roots': self.roots, 'created': self.created,
+                'files': self.files, 'dirs': self.dirs, 'bytes': self.bytes}
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def save_snapshot(path, store, tree=None, roots=()):
+    """Write a ResultStore's files, and a DirectoryTree's folders, as a snapshot.
+
+    Neither may change while this runs; pass copies when saving from a
+    background thread. Returns the snapshot's info() dict.
+    """
+    prefixes = [_encode(prefix) for prefix in store.dirs]
+    buffer = bytes(store.name_buffer)
+    offsets = store.name_offsets
+    paths = [prefixes[dir_id] + buffer[offsets[i]:offsets[i + 1]] for i, dir_id in enumerate(store.dir_ids)]
+    sizes = [np.array(store.sizes, dtype=np.int64)]
+    mtimes = [np.array(store.mtimes, dtype=np.int64)]
+    kinds = [np.full(len(paths), FILE, dtype=np.uint8)]
+    if tree is not None and len(tree):
+        paths.extend(map(_encode, tree.paths))
+        sizes.append(np.asarray(tree.sizes, dtype=np.int64))
+        mtimes.append(np.zeros(len(tree), dtype=np.int64))
+        kinds.append(np.full(len(tree), DIRECTORY, dtype=np.uint8))
+    order = np.array(sorted(range(len(paths)), key=paths.__getitem__), dtype=np.int64)
+    sizes, mtimes, kinds = (np.concatenate(column)[order] for column in (sizes, mtimes, kinds))
+    with SnapshotWriter(path, roots) as writer:
+        for start in range(0, len(order), BLOCK_ENTRIES):
+            rows = order[start:start + BLOCK_ENTRIES].tolist()
+            end = start + len(rows)
+            writer.write([paths[i] for i in rows], sizes[start:end], mtimes[start:end], kinds[start:end])
+    with SnapshotReader(path) as reader:
+        return reader.info()
+
+
+def diff_snapshots(old_path, new_path, limit=1000):
+    """Compare two snapshots and return (changes, summary).
+
+    changes lists up to `limit` added, removed, grown and shrunk files and
+    folders as (change, kind, path, old_size, new_size) tuples, largest
+    byte change first. kind is 'file' or 'folder', and the size missing on
+    one side is None. A path that turned from a file into a folder, or back,
+    counts as removed and added. summary counts every change by kind. It
+    also sums the file bytes of each change and the net change in file
+    bytes. Files whose size is unchanged but whose mtime moved are counted
+    as 'files_modified' and not listed.
+    """
+    started = time.perf_counter()
+    summary = {f"{kind}s_{change}" if kind == 'file' else f"dirs_{change}": 0
+               for kind in ('file', 'dir') for change in CHANGES}
+    summary['files_modified'] = 0
+    summary.update({f"bytes_{change}": 0 for change in CHANGES})
+    changes = []
+
+    def keep(candidates):
+        # candidates: (abs delta, change, kind, path, old, new); trim to the
+        # largest `limit` once enough have piled up
+        changes.extend(candidates)
+        if len(changes) > 2 * limit:
+            changes.sort(key=lambda change: change[0], reverse=True)
+            del changes[limit:]
+
+    def compare(old, new):
+        old_paths, old_sizes, old_mtimes, old_kinds = old
+        new_paths, new_sizes, new_mtimes, new_kinds = new
+        if old_paths == new_paths:
+            # The usual case: the same entries on both sides
+            matches = np.arange(len(new_paths))
+        else:
+            lookup = dict(zip(old_paths, range(len(old_paths))))
+            matches = np.fromiter((lookup.get(path, -1) for path in new_paths), dtype=np.int64,
+                                  count=len(new_paths))
+        matched = matches >= 0
+        matched[matched] &= old_kinds[matches[matched]] == new_kinds[matched]
+        old_rows = matches[matched]
+        new_rows = np.flatnonzero(matched)
+        removed = np.ones(len(old_paths), dtype=bool)
+        removed[old_rows] = False
+        removed = np.flatnonzero(removed)
+        added = np.flatnonzero(~matched)
+        deltas = new_sizes[new_rows] - old_sizes[old_rows]
+
+        is_file = new_kinds[new_rows] == FILE
+        grown = deltas > 0
+        shrunk = deltas < 0
+        for kind, mask, prefix in ((FILE, is_file, 'files'), (DIRECTORY, ~is_file, 'dirs')):
+            summary[f"{prefix}_grown"] += int(np.count_nonzero(mask & grown))
+            summary[f"{prefix}_shrunk"] += int(np.count_nonzero(mask & shrunk))
+            summary[f"{prefix}_added"] += int(np.count_nonzero(new_kinds[added] == kind))
+            summary[f"{prefix}_removed"] += int(np.count_nonzero(old_kinds[removed] == kind))
+        summary['files_modified'] += int(np.count_nonzero(
+            is_file & (deltas == 0) & (new_mtimes[new_rows] != old_mtimes[old_rows])))
+        summary['bytes_grown'] += int(deltas[is_file & grown].sum())
+        summary['bytes_shrunk'] += int(-deltas[is_file & shrunk].sum())
+        summary['bytes_added'] += int(new_sizes[added][new_kinds[added] == FILE].sum())
+        summary['bytes_removed'] += int(old_sizes[removed][old_kinds[removed] == FILE].sum())
+
+        # One array of candidates per window, cut to `limit` before any
+        # tuples are built
+        changed = np.flatnonzero(deltas)
+        magnitude = np.concatenate((new_sizes[added], old_sizes[removed], np.abs(deltas[changed])))
+        if len(magnitude) > limit:
+            top = np.argpartition(magnitude, len(magnitude) - limit)[len(magnitude) - limit:]
+        else:
+            top = np.arange(len(magnitude))
+        candidates = []
+        for position in top.tolist():
+            if position < len(added):
+                row = added[position]
+                candidates.append((int(new_sizes[row]), 'added', new_kinds[row], new_paths[row],
+                                   None, int(new_sizes[row])))
+                continue
+            position -= len(added)
+            if position < len(removed):
+                row = removed[position]
+                candidates.append((int(old_sizes[row]), 'removed', old_kinds[row], old_paths[row],
+                                   int(old_sizes[row]), None))
+                continue
+            row = changed[position - len(removed)]
+            old_size, new_size = int(old_sizes[old_rows[row]]), int(new_sizes[new_rows[row]])
+            candidates.append((abs(new_size - old_size), 'grown' if new_size > old_size else 'shrunk',
+                               new_kinds[new_rows[row]], new_paths[new_rows[row]], old_size, new_size))
+        keep(candidates)
+
+    with SnapshotReader(old_path) as old_reader, SnapshotReader(new_path) as new_reader:
+        sides = [[old_reader.blocks(), None], [new_reader.blocks(), None]]
+        for side in sides:
+            side[1] = next(side[0], None)
+        while sides[0][1] is not None or sides[1][1] is not None:
+            # Everything up to the smaller of the two last paths is present
+            # on both sides, so it can be compared now; the rest waits for
+            # the next block
+            lasts = [side[1][0][-1] for side in sides if side[1] is not None]
+            cut = min(lasts)
+            windows = []
+            for side in sides:
+                buffered = side[1]
+                if buffered is None:
+                    windows.append(([], *(np.zeros(0, dtype=dtype) for dtype in ('<i8', '<i8', np.uint8))))
+                    continue
+                split = bisect_right(buffered[0], cut)
+                windows.append(tuple(column[:split] for column in buffered))
+                rest = tuple(column[split:] for column in buffered)
+                side[1] = rest if len(rest[0]) else next(side[0], None)
+            compare(*windows)
+        summary['net_bytes'] = new_reader.bytes - old_reader.bytes
+        summary['old'] = old_reader.info()
+        summary['new'] = new_reader.info()
+
+    changes.sort(key=lambda change: change[0], reverse=True)
+    summary['elapsed'] = round(time.perf_counter() - started, 3)
+    return [(change, KIND_NAMES[int(kind)], _decode(path), old_size, new_size)
+            for _, change, kind, path, old_size, new_size in changes[:limit]], summary
@@ -0,0 +1,49 @@
+"""Magic-byte sniffing of file headers."""
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from content_types import sniff_files, sniff_header
+
+
+def ftyp(brand):
+    return b'\x00\x00\x00\x20ftyp' + brand + b'\x00\x00\x02\x00' + brand + b'mp41'
+
+
+class SniffHeaderTest(unittest.TestCase):
+    def test_iso_brands(self):
+        for brand in (b'isom', b'mp41', b'mp42', b'qt  ', b'3gp5', b'avc1', b'M4V '):
+            self.assertEqual(sniff_header(ftyp(brand)), 'videos', brand)
+        for brand in (b'heic', b'mif1', b'avif'):
+            self.assertEqual(sniff_header(ftyp(brand)), 'images', brand)
+        for brand in (b'M4A ', b'M4B ', b'M4P ', b'F4A '):
+            self.assertEqual(sniff_header(ftyp(brand)), 'other', brand)
+
+    def test_prefix_signatures(self):
+        self.assertEqual(sniff_header(b'\x89PNG\r\n\x1a\n' + bytes(20)), 'images')
+        self.assertEqual(sniff_header(b'RIFF\x00\x00\x00\x00AVI LIST'), 'videos')
+        self.assertEqual(sniff_header(b'RIFF\x00\x00\x00\x00WAVEfmt '), None)
+        self.assertEqual(sniff_header(b'%PDF-1.7\n'), 'documents')
+        self.assertEqual(sniff_header(b'plain text'), None)
+
+
+class SniffFilesTest(unittest.TestCase):
+    def test_audio_is_not_recognised_as_video(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            files = []
+            for i, header in enumerate((ftyp(b'M4A '), ftyp(b'isom'), b'hello')):
+                path = os.path.join(tmp, f'{i}.bin')
+                with open(path, 'wb') as f:
+                    f.write(header)
+                files.append((i, path, len(header), 0))
+            categories, stats = sniff_files(files, workers=2)
+        self.assertEqual(categories, {0: 'other', 1: 'videos'})
+        self.assertEqual(stats['recognised'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+"""find_duplicates on real files, including hard links to one inode."""
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from duplicates import PARTIAL_BYTES, find_duplicates
+from result_store import ResultStore
+from scan_engine import scan_tree
+
+
+def write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def scan(root):
+    store = ResultStore()
+    for records, mtimes, _, _ in scan_tree(root):
+        store.extend(records, mtimes)
+    return store
+
+
+def group_names(store, groups):
+    return sorted(sorted(os.path.basename(store.path(row)) for row in group) for group in groups)
+
+
+@unittest.skipUnless(hasattr(os, 'link'), 'hard links are not supported')
+class HardLinkTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.root = self.tmp.name
+        self.big = os.urandom(3 * PARTIAL_BYTES)
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def test_links_alone_are_not_duplicates(self):
+        write(self.path('a.bin'), self.big)
+        os.link(self.path('a.bin'), self.path('b.bin'))
+        os.link(self.path('a.bin'), self.path('c.bin'))
+        groups, stats = find_duplicates(scan(self.root))
+        self.assertEqual(groups, [])
+        self.assertEqual(stats['hard_links'], 2)
+        self.assertEqual(stats['size_candidates'], 0)
+        self.assertEqual(stats['wasted_bytes'], 0)
+
+    def test_links_count_once_among_copies(self):
+        write(self.path('a.bin'), self.big)
+        os.link(self.path('a.bin'), self.path('b.bin'))
+        write(self.path('copy.bin'), self.big)
+        write(self.path('other.bin'), os.urandom(len(self.big)))
+        store = scan(self.root)
+        groups, stats = find_duplicates(store)
+        self.assertEqual(len(groups), 1)
+        self.assertEqual(len(groups[0]), 2)
+        self.assertIn('copy.bin', group_names(store, groups)[0])
+        self.assertEqual(stats['hard_links'], 1)
+        self.assertEqual(stats['duplicate_files'], 2)
+        self.assertEqual(stats['wasted_bytes'], len(self.big))
+
+    def test_plain_copies(self):
+        for name in ('a.bin', 'b.bin', 'c.bin'):
+            write(self.path(name), self.big)
+        write(self.path('small1'), b'x' * 10)
+        write(self.path('small2'), b'x' * 10)
+        store = scan(self.root)
+        groups, stats = find_duplicates(store)
+        self.assertEqual(group_names(store, groups), [['a.bin', 'b.bin', 'c.bin'], ['small1', 'small2']])
+        self.assertEqual(stats['hard_links'], 0)
+        self.assertEqual(stats['wasted_bytes'], 2 * len(self.big) + 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+"""FileTableModel sort ranks as rows stream in and are removed."""
+import os
+import random
+import sys
+import unittest
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from result_store import ResultStore
+
+
+def random_record(rng):
+    name = ''.join(rng.choice('abAB_') for _ in range(rng.randint(1, 5))) + rng.choice(['.jpg', '.TXT', ''])
+    directory = rng.choice(['/r/x/', '/r/X/', '/r/a/b/', '/r/'])
+    return name, os.path.splitext(name)[1].lower(), rng.randint(0, 9), directory + name
+
+
+def batch(records):
+    store = ResultStore()
+    store.extend(records, [0] * len(records))
+    return store
+
+
+class SortRanksTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from PyQt5.QtCore import QCoreApplication
+        cls.app = QCoreApplication.instance() or QCoreApplication([])
+
+    def expected_order(self, model, column):
+        store = model.files_info
+        value = store.name if column == 0 else store.path
+        return sorted(range(len(store)), key=lambda row: value(row).lower())
+
+    def assert_sorted(self, model):
+        for column in (0, model.PATH_COLUMN):
+            order = np.argsort(model.sort_ranks(column), kind='stable').tolist()
+            self.assertEqual(order, self.expected_order(model, column))
+
+    def test_ranks_follow_streamed_batches_and_removals(self):
+        from result_models import FileTableModel
+        rng = random.Random(3)
+        model = FileTableModel()
+        model.merge_files(batch([random_record(rng) for _ in range(200)]))
+        self.assert_sorted(model)
+        for step in range(40):
+            model.merge_files(batch([random_record(rng) for _ in range(rng.choice((1, 5, 20)))]))
+            self.assert_sorted(model)
+            if step % 5 == 2:
+                model.remove_rows(rng.sample(range(len(model.files_info)), 7))
+                self.assert_sorted(model)
+
+    def test_batches_keep_the_name_order(self):
+        # Ranks are carried over rather than thrown away with each batch
+        from result_models import FileTableModel
+        rng = random.Random(4)
+        model = FileTableModel()
+        model.merge_files(batch([random_record(rng) for _ in range(400)]))
+        model.sort_ranks(0)
+        order = model._sort_orders[0]
+        model.merge_files(batch([random_record(rng) for _ in range(10)]))
+        self.assertIn(0, model._sort_keys)
+        self.assertEqual(len(model._sort_orders[0]), len(order) + 10)
+        self.assert_sorted(model)
+
+
+if __name__ == '__main__':
+    unittest.main()
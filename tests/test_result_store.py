@@ -0,0 +1,112 @@
+"""ResultStore row removal and merging, checked against plain lists of tuples."""
+import os
+import random
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from result_store import ResultStore
+
+
+def random_records(rng, count, reclaimable=False):
+    records = []
+    for _ in range(count):
+        name = ''.join(rng.choice('abcé_') for _ in range(rng.randint(1, 6))) + rng.choice(['.jpg', '.mp4', '.txt', ''])
+        directory = rng.choice(['/r/', '/r/x/', '/r/x/y/', '/s/'])
+        size = rng.randint(0, 5000)
+        record = (name, os.path.splitext(name)[1].lower(), size, directory + name)
+        records.append(record + (size // 2,) if reclaimable else record)
+    return records
+
+
+def columns(store):
+    """Every column of every row, as plain Python values."""
+    return [(store[i], store.mtimes[i], store.category(i),
+             None if store.reclaimable is None else store.reclaimable[i]) for i in range(len(store))]
+
+
+class RemoveRowsTest(unittest.TestCase):
+    def test_matches_list_deletion(self):
+        rng = random.Random(5)
+        for reclaimable in (False, True):
+            records = random_records(rng, 300, reclaimable)
+            mtimes = [rng.randint(0, 10 ** 9) for _ in records]
+            store = ResultStore(records, mtimes)
+            expected = columns(store)
+            for _ in range(5):
+                rows = sorted(rng.sample(range(len(store)), rng.randint(0, len(store) // 3)))
+                store.remove_rows(rows)
+                removed = set(rows)
+                expected = [row for i, row in enumerate(expected) if i not in removed]
+                self.assertEqual(columns(store), expected)
+                self.assertEqual(len(store.name_offsets), len(store) + 1)
+                self.assertEqual(store.name_offsets[-1], len(store.name_buffer))
+
+    def test_remove_everything_then_append(self):
+        records = random_records(random.Random(1), 20)
+        store = ResultStore(records)
+        store.remove_rows(range(len(store)))
+        self.assertEqual(len(store), 0)
+        self.assertEqual(bytes(store.name_buffer), b'')
+        store.append(records[0], 7)
+        self.assertEqual(list(store), [records[0][:4]])
+        self.assertEqual(store.mtimes[0], 7)
+
+    def test_category_overrides_survive(self):
+        records = random_records(random.Random(2), 10)
+        store = ResultStore(records)
+        store.set_categories([4, 8], ['images', 'videos'])
+        store.remove_rows([0, 5])
+        self.assertEqual(store.category(3), 'images')
+        self.assertEqual(store.category(6), 'videos')
+
+
+class MergeTest(unittest.TestCase):
+    def test_matches_extend(self):
+        rng = random.Random(3)
+        batches = [random_records(rng, rng.randint(0, 50)) for _ in range(8)]
+        mtimes = [[rng.randint(0, 10 ** 9) for _ in records] for records in batches]
+        merged = ResultStore()
+        extended = ResultStore()
+        for records, batch_mtimes in zip(batches, mtimes):
+            merged.merge(ResultStore(records, batch_mtimes))
+            extended.extend(records, batch_mtimes)
+        self.assertEqual(columns(merged), columns(extended))
+        # Codes are remapped onto the merged store's own tables
+        self.assertEqual(sorted(merged.dirs), sorted(set(merged.dirs)))
+        self.assertEqual(sorted(merged.exts), sorted(set(merged.exts)))
+
+    def test_reclaimable_column(self):
+        rng = random.Random(4)
+        plain = random_records(rng, 10)
+        allocated = random_records(rng, 10, reclaimable=True)
+        store = ResultStore(plain)
+        store.merge(ResultStore(allocated))
+        store.merge(ResultStore(plain))
+        # Rows without a reclaimable size count their apparent size
+        expected = ([record[2] for record in plain] + [record[4] for record in allocated]
+                    + [record[2] for record in plain])
+        self.assertEqual(list(store.reclaimable), expected)
+        self.assertEqual(store.total_reclaimable(), sum(expected))
+
+    def test_categories_copied(self):
+        records = random_records(random.Random(6), 5)
+        batch = ResultStore(records)
+        batch.set_categories([2], ['documents'])
+        store = ResultStore(records)
+        store.merge(batch)
+        self.assertEqual(store.category(7), 'documents')
+
+    def test_merge_then_remove(self):
+        rng = random.Random(7)
+        first, second = random_records(rng, 40), random_records(rng, 40)
+        store = ResultStore(first)
+        store.merge(ResultStore(second))
+        store.remove_rows(list(range(10, 60)))
+        self.assertEqual(list(store), (first + second)[:10] + (first + second)[60:])
+
+
+if __name__ == '__main__':
+    unittest.main()
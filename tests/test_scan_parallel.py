@@ -0,0 +1,313 @@
+"""Parallel scanning: totals against the serial walk, errors in listing
+threads, and the GUI's indexed scans."""
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import scan_index
+import tree_generator
+from scan_engine import ScanFilter, device_workers, relist_directories, scan_roots, scan_tree, scan_tree_parallel
+
+
+def make_tree(root, dirs=6, files=3):
+    for d in range(dirs):
+        directory = os.path.join(root, f'dir{d}', 'sub')
+        os.makedirs(directory)
+        for f in range(files):
+            with open(os.path.join(directory, f'file{f}.txt'), 'w') as out:
+                out.write('x' * (d + f))
+
+
+def consume(batches, timeout=10):
+    # Drain the generator on a thread, so a hang fails the test instead of
+    # blocking it
+    outcome = {}
+
+    def run():
+        try:
+            outcome['batches'] = list(batches)
+        except Exception as error:
+            outcome['error'] = error
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise AssertionError('scan did not finish')
+    return outcome
+
+
+class ConcurrencyProbe:
+    # Stands in for scan_index's list_directory, recording how many
+    # listings overlap and which directories were listed together
+    def __init__(self, delay=0.02):
+        self.original = scan_index.list_directory
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.running = set()
+        self.peak = 0
+        self.overlaps = []
+        self.listed = []
+
+    def __call__(self, root, *args, **kwargs):
+        with self.lock:
+            self.running.add(root)
+            self.peak = max(self.peak, len(self.running))
+            self.overlaps.append(set(self.running))
+            self.listed.append(root)
+        try:
+            time.sleep(self.delay)
+            return self.original(root, *args, **kwargs)
+        finally:
+            with self.lock:
+                self.running.discard(root)
+
+
+def gui_scanner(roots, index_path, incremental=False):
+    # A FileScanner set up the way the window sets it up: an index and a
+    # pool of listing threads
+    from PyQt5.QtCore import QCoreApplication
+    QCoreApplication.instance() or QCoreApplication([])
+    from file_sorter_new import FileScanner
+    return FileScanner(roots, 8, index_path, incremental)
+
+
+def scanned_paths(scanner):
+    found = {}
+    scanner.finished.connect(lambda files_info, counts, size: found.update(
+        paths=sorted(record[3] for record in files_info)))
+    scanner.run()
+    return found['paths']
+
+
+def summarize(batches, dirs):
+    # What a walk found, independent of the order of its batches
+    files = []
+    visited = pending = 0
+    for records, mtimes, visited, pending in batches:
+        files.extend(zip(records, mtimes))
+    return {'files': sorted(files), 'dirs': sorted(dirs), 'visited': visited, 'pending': pending,
+            'bytes': sum(record[2] for record, _ in files)}
+
+
+class TreeTotalsTest(unittest.TestCase):
+    # Parallel walks must find exactly what the serial walk finds, on a
+    # generated tree of sparse files
+    @classmethod
+    def setUpClass(cls):
+        cls.scratch = tempfile.TemporaryDirectory()
+        cls.root = os.path.join(cls.scratch.name, 'tree')
+        cls.manifest = tree_generator.generate_tree(cls.root, fanout=3, depth=3, files_per_dir=8)
+        dirs = []
+        cls.serial = summarize(scan_tree(cls.root, dirs), dirs)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.scratch.cleanup()
+
+    def test_serial_walk_matches_the_manifest(self):
+        # The manifest itself is written into the root
+        self.assertEqual(len(self.serial['files']), self.manifest['files'] + 1)
+        self.assertEqual(len(self.serial['dirs']), self.manifest['dirs'])
+        self.assertEqual(self.serial['visited'], self.manifest['dirs'])
+        self.assertEqual(self.serial['pending'], 0)
+
+    def test_scan_tree_parallel_matches_serial(self):
+        for workers in (1, 2, 8):
+            dirs = []
+            self.assertEqual(summarize(scan_tree_parallel(self.root, workers, dirs), dirs), self.serial)
+
+    def index_scan(self, index_path, incremental, workers):
+        index = scan_index.ScanIndex(index_path)
+        try:
+            dirs = []
+            return summarize(index.scan(self.root, incremental, dirs, workers=workers), dirs)
+        finally:
+            index.close()
+
+    def test_scan_index_parallel_matches_serial(self):
+        # A full scan, an incremental one served from the index, and one
+        # after a directory changed, each serial and with a pool
+        with tempfile.TemporaryDirectory() as scratch:
+            for workers in (1, 8):
+                index_path = os.path.join(scratch, f'index{workers}.sqlite')
+                self.assertEqual(self.index_scan(index_path, False, workers), self.serial)
+                self.assertEqual(self.index_scan(index_path, True, workers), self.serial)
+            added = os.path.join(self.root, 'added.txt')
+            with open(added, 'w') as out:
+                out.write('new')
+            try:
+                dirs = []
+                changed = summarize(scan_tree(self.root, dirs), dirs)
+                serial = self.index_scan(os.path.join(scratch, 'index1.sqlite'), True, 1)
+                parallel = self.index_scan(os.path.join(scratch, 'index8.sqlite'), True, 8)
+            finally:
+                os.remove(added)
+        self.assertEqual(serial, changed)
+        self.assertEqual(parallel, changed)
+
+    def test_multi_root_scans_match_serial(self):
+        # Subtrees as roots, given out of order and with a nested one that
+        # is dropped; scan_roots and the index's scan_roots must find what
+        # walking each root serially finds
+        subtrees = sorted(entry.path for entry in os.scandir(self.root) if entry.is_dir())
+        roots = [subtrees[2], subtrees[0], os.path.join(subtrees[0], os.listdir(subtrees[0])[0]), subtrees[1]]
+        dirs = []
+        serial = summarize((batch for root in subtrees[:3] for batch in scan_tree(root, dirs)), dirs)
+        serial['visited'] = len(dirs)
+        for budget in (lambda device, workers: 1, lambda device, workers: workers):
+            dirs = []
+            root_stats = {}
+            self.assertEqual(summarize(scan_roots(roots, 4, dirs, root_stats=root_stats, budget=budget), dirs),
+                             serial)
+            self.assertEqual(sorted(root_stats), subtrees[:3])
+            with tempfile.TemporaryDirectory() as scratch:
+                index = scan_index.ScanIndex(os.path.join(scratch, 'index.sqlite'))
+                try:
+                    for incremental in (False, True):
+                        dirs = []
+                        root_stats = {}
+                        batches = index.scan_roots(roots, incremental, 4, dirs, root_stats=root_stats, budget=budget)
+                        self.assertEqual(summarize(batches, dirs), serial)
+                        counted = [stats.as_dict() for stats in root_stats.values()]
+                        self.assertEqual(sum(stats['files'] for stats in counted), len(serial['files']))
+                        self.assertEqual(sum(stats['total_size'] for stats in counted), serial['bytes'])
+                        self.assertEqual(sum(stats['dirs'] for stats in counted), len(dirs))
+                finally:
+                    index.close()
+
+
+class BrokenFilter(ScanFilter):
+    def prune(self, subdirs):
+        raise ValueError('bad name')
+
+
+class ScanTreeParallelErrorTest(unittest.TestCase):
+    def test_error_in_worker_is_raised(self):
+        with tempfile.TemporaryDirectory() as root:
+            make_tree(root)
+            outcome = consume(scan_tree_parallel(root, 4, scan_filter=BrokenFilter(['x'])))
+        self.assertIsInstance(outcome.get('error'), ValueError)
+
+    def test_unreadable_directory_is_skipped(self):
+        with tempfile.TemporaryDirectory() as root:
+            make_tree(root)
+            outcome = consume(scan_tree_parallel(os.path.join(root, 'missing'), 4))
+        self.assertEqual(outcome['batches'], [([], [], 0, 0)])
+
+    def test_error_in_device_thread_is_raised(self):
+        with tempfile.TemporaryDirectory() as root:
+            make_tree(root)
+            roots = [os.path.join(root, 'dir0'), os.path.join(root, 'dir1')]
+            outcome = consume(scan_roots(roots, 4, scan_filter=BrokenFilter(['x'])))
+        self.assertIsInstance(outcome.get('error'), ValueError)
+
+
+class IndexedScanTest(unittest.TestCase):
+    def setUp(self):
+        self.scratch = tempfile.TemporaryDirectory()
+        self.addCleanup(self.scratch.cleanup)
+        self.root = os.path.join(self.scratch.name, 'tree')
+        make_tree(self.root)
+        self.index_path = os.path.join(self.scratch.name, 'index.sqlite')
+        self.expected = sorted(record[3] for records, _, _, _ in scan_tree(self.root) for record in records)
+
+    def test_gui_scan_lists_in_parallel(self):
+        probe = ConcurrencyProbe()
+        with mock.patch.object(scan_index, 'list_directory', probe):
+            paths = scanned_paths(gui_scanner(self.root, self.index_path))
+        self.assertEqual(paths, self.expected)
+        self.assertGreater(probe.peak, 1)
+
+    def test_incremental_rescan_reads_the_index(self):
+        scanned_paths(gui_scanner(self.root, self.index_path))
+        os.remove(os.path.join(self.root, 'dir0', 'sub', 'file0.txt'))
+        probe = ConcurrencyProbe()
+        scanner = gui_scanner(self.root, self.index_path, incremental=True)
+        with mock.patch.object(scan_index, 'list_directory', probe):
+            paths = scanned_paths(scanner)
+        removed = os.path.join(self.root, 'dir0', 'sub', 'file0.txt')
+        self.assertEqual(paths, [path for path in self.expected if path != removed])
+        self.assertEqual(probe.listed, [os.path.join(self.root, 'dir0', 'sub')])
+
+
+SHARED_MEMORY = '/dev/shm'
+
+
+@unittest.skipUnless(os.path.isdir(SHARED_MEMORY) and os.access(SHARED_MEMORY, os.W_OK),
+                     'needs a second filesystem at /dev/shm')
+class IndexedMultiRootScanTest(unittest.TestCase):
+    # Roots on two devices: the temporary directory and /dev/shm
+    def setUp(self):
+        self.scratch = tempfile.TemporaryDirectory()
+        self.addCleanup(self.scratch.cleanup)
+        self.other = tempfile.TemporaryDirectory(dir=SHARED_MEMORY)
+        self.addCleanup(self.other.cleanup)
+        self.roots = [os.path.join(self.scratch.name, 'tree'), os.path.join(self.other.name, 'tree')]
+        if len({os.stat(os.path.dirname(root)).st_dev for root in self.roots}) < 2:
+            self.skipTest('/dev/shm is on the same device as the temporary directory')
+        for root in self.roots:
+            make_tree(root)
+        self.index_path = os.path.join(self.scratch.name, 'index.sqlite')
+        self.expected = sorted(record[3] for root in self.roots
+                               for records, _, _, _ in scan_tree(root) for record in records)
+
+    def test_gui_scan_walks_devices_concurrently(self):
+        probe = ConcurrencyProbe()
+        scanner = gui_scanner(self.roots, self.index_path)
+        with mock.patch.object(scan_index, 'list_directory', probe):
+            paths = scanned_paths(scanner)
+        self.assertEqual(paths, self.expected)
+        self.assertEqual(len({stats.device for stats in scanner.root_stats.values()}), 2)
+        self.assertTrue(all(stats.workers == device_workers(stats.device, 8)
+                            for stats in scanner.root_stats.values()))
+        both = [running for running in probe.overlaps
+                if all(any(path.startswith(root) for path in running) for root in self.roots)]
+        self.assertTrue(both, 'the two devices were never listed at the same time')
+
+    def test_watcher_relists_with_each_roots_filter(self):
+        # The scanner starts its filter on the first root; a new folder under
+        # the second root is on that root's own device and must be walked
+        scan_filter = ScanFilter(one_filesystem=True)
+        scan_filter.start(self.roots[0])
+        changed = os.path.join(self.roots[1], 'dir0')
+        make_tree(os.path.join(changed, 'new'), dirs=1, files=2)
+        known = {os.path.join(changed, 'sub')}
+        _, _, added, new_dirs = relist_directories([changed], known, scan_filter, self.roots)
+        self.assertEqual(len(added), 2)
+        self.assertIn(os.path.join(changed, 'new'), new_dirs)
+        self.assertEqual(scan_filter.skipped, [])
+        # Without the roots, the first root's device prunes it
+        _, _, added, _ = relist_directories([changed], known, scan_filter)
+        self.assertEqual(added, [])
+        self.assertIn(os.path.join(changed, 'new'), scan_filter.skipped)
+
+    def test_device_budget_is_respected(self):
+        # A device given one thread is never listed twice at once, while the
+        # other device keeps its threads
+        slow_device = os.stat(self.roots[0]).st_dev
+        index = scan_index.ScanIndex(self.index_path)
+        self.addCleanup(index.close)
+        probe = ConcurrencyProbe()
+        root_stats = {}
+        with mock.patch.object(scan_index, 'list_directory', probe):
+            batches = index.scan_roots(self.roots, False, 8, root_stats=root_stats,
+                                       budget=lambda device, workers: 1 if device == slow_device else workers)
+            paths = sorted(record[3] for records, _, _, _ in batches for record in records)
+        self.assertEqual(paths, self.expected)
+        self.assertEqual(root_stats[self.roots[0]].workers, 1)
+        self.assertTrue(all(sum(path.startswith(self.roots[0]) for path in running) <= 1
+                            for running in probe.overlaps))
+        self.assertEqual(root_stats[self.roots[0]].dirs_visited, 13)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+"""SearchIndex queries checked against a brute-force scan of the same rows."""
+import fnmatch
+import os
+import random
+import sys
+import unittest
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from result_store import ResultStore
+from search_index import SearchIndex
+
+ALPHABET = 'abcAB._-éÉ'
+
+
+def random_records(rng, count):
+    records = []
+    for _ in range(count):
+        name = ''.join(rng.choice(ALPHABET) for _ in range(rng.randint(1, 8)))
+        directory = rng.choice(['/r/', '/r/ab/', '/r/Ab/c.d/', '/s/bca/'])
+        records.append((name, os.path.splitext(name)[1].lower(), 1, directory + name))
+    return records
+
+
+def random_query(rng):
+    query = ''.join(rng.choice('abcé._') for _ in range(rng.randint(1, 4)))
+    kind = rng.randrange(6)
+    if kind == 1:
+        query = '*' + query
+    elif kind == 2:
+        query = query + '*'
+    elif kind == 3:
+        query = '*' + query[:2] + '?' + query[2:] + '*'
+    elif kind == 4:
+        query = rng.choice(['ab/', '/c.d/', 'b/', 'bca/a']) + query
+    elif kind == 5:
+        query = rng.choice(['ab/', 'c.d/']) + '*' + query
+    return query
+
+
+def expected_rows(store, query, rows):
+    """The rows a query should match, by testing each one directly."""
+    query = query.strip().lower()
+    path_mode = os.sep in query
+    wildcard = any(char in query for char in '*?[')
+    if path_mode and wildcard and not query.startswith('*'):
+        query = '*' + query if query.startswith(os.sep) else '*' + os.sep + query
+    matches = []
+    for row in rows:
+        text = (store.path(row) if path_mode else store.name(row)).lower()
+        if fnmatch.fnmatchcase(text, query) if wildcard else query in text:
+            matches.append(row)
+    return matches
+
+
+class SearchIndexTest(unittest.TestCase):
+    def check(self, store, rng, queries=300, rows=None):
+        index = store.search_index()
+        all_rows = range(len(store)) if rows is None else sorted(set(rows))
+        for _ in range(queries):
+            query = random_query(rng)
+            self.assertEqual(index.search(query, rows).tolist(), expected_rows(store, query, all_rows), query)
+
+    def test_queries_match_brute_force(self):
+        rng = random.Random(17)
+        self.check(ResultStore(random_records(rng, 2000)), rng)
+
+    def test_restricted_rows(self):
+        rng = random.Random(18)
+        store = ResultStore(random_records(rng, 1000))
+        self.check(store, rng, rows=rng.sample(range(1000), 300))
+
+    def test_rows_added_after_build(self):
+        rng = random.Random(19)
+        store = ResultStore(random_records(rng, 500))
+        store.search_index()
+        for _ in range(3):
+            store.extend(random_records(rng, 200))
+            self.check(store, rng, queries=100)
+
+    def test_rows_removed(self):
+        rng = random.Random(20)
+        store = ResultStore(random_records(rng, 1000))
+        store.search_index()
+        store.remove_rows(sorted(rng.sample(range(1000), 400)))
+        self.check(store, rng)
+        # Rows appended but not indexed yet are removed from the store alone
+        store.extend(random_records(rng, 100))
+        store.remove_rows([0, len(store) - 1])
+        self.check(store, rng)
+
+    def test_signatures_never_under_match(self):
+        rng = random.Random(21)
+        store = ResultStore(random_records(rng, 3000))
+        index = SearchIndex(store)
+        rows = np.arange(len(index))
+        for _ in range(300):
+            needle = ''.join(rng.choice('abcé._') for _ in range(rng.randint(2, 5))).encode()
+            kept = set(index._filter([needle], rows).tolist())
+            containing = {row for row in rows.tolist()
+                          if needle in store.name(row).lower().encode('utf-8', 'surrogatepass')}
+            self.assertLessEqual(containing, kept)
+
+    def test_single_byte_scan(self):
+        store = ResultStore([('x.jpg', '.jpg', 1, '/r/x.jpg'), ('Yy', '', 1, '/r/Yy'), ('zx', '', 1, '/r/zx')])
+        self.assertEqual(store.search('x').tolist(), [0, 2])
+        self.assertEqual(store.search('Y').tolist(), [1])
+        self.assertEqual(store.search('').tolist(), [0, 1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+"""Similarity grouping against brute force, and the killable worker processes
+that decode files for it."""
+import os
+import random
+import sys
+import threading
+import time
+import unittest
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from scan_engine import TIMED_OUT, run_killable
+from similarity import group_similar, hash_shrunk, near_pairs, popcount
+
+
+def random_hashes(rng, count, clusters):
+    # Clusters of hashes a few bits from a centre, so many pairs are near
+    centres = [rng.getrandbits(64) for _ in range(clusters)]
+    hashes = []
+    for _ in range(count):
+        value = rng.choice(centres)
+        for _ in range(rng.randint(0, 8)):
+            value ^= 1 << rng.randrange(64)
+        hashes.append(value)
+    return np.array(hashes, dtype=np.uint64)
+
+
+def brute_pairs(hashes, threshold):
+    distance = popcount(hashes[:, None] ^ hashes[None, :])
+    i, j = np.nonzero(np.triu(distance <= threshold, k=1))
+    return set(zip(i.tolist(), j.tolist()))
+
+
+def brute_groups(signatures, threshold):
+    # Connected components of rows whose per-frame distances average at most threshold
+    signatures = signatures.reshape(len(signatures), -1)
+    frames = signatures.shape[1]
+    labels = list(range(len(signatures)))
+    for a in range(len(signatures)):
+        for b in range(a + 1, len(signatures)):
+            if popcount(signatures[a] ^ signatures[b]).sum() <= threshold * frames:
+                old, new = labels[b], labels[a]
+                labels = [new if label == old else label for label in labels]
+    groups = {}
+    for row, label in enumerate(labels):
+        groups.setdefault(label, []).append(row)
+    return sorted(group for group in groups.values() if len(group) > 1)
+
+
+class NearPairsTest(unittest.TestCase):
+    def test_matches_brute_force(self):
+        rng = random.Random(23)
+        for count, clusters in ((0, 1), (1, 1), (300, 5), (600, 40)):
+            hashes = random_hashes(rng, count, clusters)
+            for threshold in (0, 3, 6, 12):
+                i, j = near_pairs(hashes, threshold)
+                self.assertTrue(np.all(i < j))
+                self.assertEqual(set(zip(i.tolist(), j.tolist())), brute_pairs(hashes, threshold),
+                                 (count, threshold))
+
+    def test_small_pair_limit(self):
+        # Crowded chunk values are expanded in slices; none may be lost
+        hashes = np.repeat(random_hashes(random.Random(1), 5, 5), 40)
+        i, j = near_pairs(hashes, 4, pair_limit=7)
+        self.assertEqual(set(zip(i.tolist(), j.tolist())), brute_pairs(hashes, 4))
+
+
+class GroupSimilarTest(unittest.TestCase):
+    def test_single_frame(self):
+        rng = random.Random(24)
+        hashes = random_hashes(rng, 200, 12)
+        for threshold in (0, 4, 8):
+            groups = sorted(sorted(group) for group in group_similar(hashes, threshold))
+            self.assertEqual(groups, brute_groups(hashes, threshold))
+
+    def test_frames_average(self):
+        rng = random.Random(25)
+        signatures = np.stack([random_hashes(rng, 120, 4) for _ in range(4)], axis=1)
+        signatures[60:] = signatures[:60]  # Identical rows collapse before comparing
+        for threshold in (2, 6):
+            groups = sorted(sorted(group) for group in group_similar(signatures, threshold))
+            self.assertEqual(groups, brute_groups(signatures, threshold))
+
+    def test_chain_joins_one_group(self):
+        # 0-1 and 1-2 are near, 0-2 are not: union-find still joins all three
+        hashes = np.array([0, 0b111, 0b111111, (1 << 64) - 1], dtype=np.uint64)
+        self.assertEqual(group_similar(hashes, 3), [[0, 1, 2]])
+
+
+class HashShrunkTest(unittest.TestCase):
+    def test_results_line_up(self):
+        rng = np.random.default_rng(3)
+        shrunk = [rng.integers(0, 256, (1, 8, 9), dtype=np.uint8), None,
+                  rng.integers(0, 256, (4, 8, 9), dtype=np.uint8)]
+        hashes = hash_shrunk(shrunk)
+        self.assertIsNone(hashes[1])
+        self.assertEqual([len(hashes[0]), len(hashes[2])], [1, 4])
+        self.assertEqual(hashes[2].tolist(), hash_shrunk([shrunk[2]])[0].tolist())
+
+
+def _job(kind, value):
+    # Runs in a worker process of run_killable
+    if kind == 'hang':
+        time.sleep(60)
+    elif kind == 'raise':
+        raise ValueError(value)
+    elif kind == 'crash':
+        os._exit(3)
+    return value * 2
+
+
+class RunKillableTest(unittest.TestCase):
+    def test_results_timeouts_and_crashes(self):
+        jobs = [(0, ('ok', 1)), (1, ('hang', 0)), (2, ('raise', 0)), (3, ('crash', 0)), (4, ('ok', 5)),
+                (5, ('ok', 7))]
+        cleaned = []
+        started = time.monotonic()
+        results = dict(run_killable(jobs, _job, 2, timeout=1, cleanup=lambda args, pid: cleaned.append(args)))
+        self.assertLess(time.monotonic() - started, 20)
+        self.assertEqual(results, {0: 2, 1: TIMED_OUT, 2: None, 3: None, 4: 10, 5: 14})
+        self.assertEqual(sorted(cleaned), [('crash', 0), ('hang', 0)])
+
+    def test_cancel_starts_no_new_jobs(self):
+        cancel = threading.Event()
+        seen = []
+        for key, result in run_killable([(i, ('ok', i)) for i in range(20)], _job, 1, cancel=cancel):
+            seen.append(key)
+            cancel.set()
+        self.assertEqual(seen, [0])
+
+
+if __name__ == '__main__':
+    unittest.main()
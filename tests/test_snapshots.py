@@ -0,0 +1,150 @@
+"""diff_snapshots' block-wise merge join, checked against a diff of two dicts."""
+import os
+import random
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import snapshots
+from snapshots import CHANGES, DIRECTORY, FILE, KIND_NAMES, SnapshotReader, SnapshotWriter, diff_snapshots
+
+
+def random_entries(rng, count):
+    entries = {}
+    while len(entries) < count:
+        path = '/r/' + '/'.join(rng.choice(['a', 'b', 'é', 'c d']) + str(rng.randrange(40))
+                                for _ in range(rng.randint(1, 3)))
+        entries[path] = (rng.randint(0, 10 ** 6), rng.randint(0, 10 ** 9), rng.choice([FILE, FILE, DIRECTORY]))
+    return entries
+
+
+def mutate(rng, entries):
+    new = {}
+    for path, (size, mtime, kind) in entries.items():
+        roll = rng.random()
+        if roll < 0.15:
+            continue
+        if roll < 0.25:
+            size = max(0, size + rng.randint(-1000, 1000))
+        elif roll < 0.3:
+            mtime += 1
+        elif roll < 0.33:
+            kind = DIRECTORY if kind == FILE else FILE
+        new[path] = (size, mtime, kind)
+    new.update(random_entries(rng, len(entries) // 5))
+    return new
+
+
+def write(path, entries):
+    # Several uneven write() calls, each one spanning blocks
+    items = sorted((key.encode('utf-8', 'surrogatepass'), value) for key, value in entries.items())
+    with SnapshotWriter(path, ['/r']) as writer:
+        start = 0
+        while start < len(items):
+            chunk = items[start:start + random.Random(start).randint(1, 40)]
+            writer.write([key for key, _ in chunk], [value[0] for _, value in chunk],
+                         [value[1] for _, value in chunk], [value[2] for _, value in chunk])
+            start += len(chunk)
+
+
+def expected_diff(old, new):
+    changes = []
+    summary = {f"{'files' if kind == FILE else 'dirs'}_{change}": 0 for kind in (FILE, DIRECTORY) for change in CHANGES}
+    summary['files_modified'] = 0
+    summary.update({f"bytes_{change}": 0 for change in CHANGES})
+
+    def count(change, kind, path, old_size, new_size, delta):
+        summary[f"{'files' if kind == FILE else 'dirs'}_{change}"] += 1
+        if kind == FILE:
+            summary[f"bytes_{change}"] += delta
+        changes.append((change, KIND_NAMES[kind], path, old_size, new_size))
+
+    for path in sorted(old.keys() | new.keys()):
+        before, after = old.get(path), new.get(path)
+        if before is not None and after is not None and before[2] == after[2]:
+            delta = after[0] - before[0]
+            if delta:
+                count('grown' if delta > 0 else 'shrunk', after[2], path, before[0], after[0], abs(delta))
+            elif after[2] == FILE and after[1] != before[1]:
+                summary['files_modified'] += 1
+            continue
+        if before is not None:
+            count('removed', before[2], path, before[0], None, before[0])
+        if after is not None:
+            count('added', after[2], path, None, after[0], after[0])
+    return changes, summary
+
+
+def magnitude(change):
+    return abs((change[4] or 0) - (change[3] or 0))
+
+
+class DiffSnapshotsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        # Small blocks, so the two sides' blocks end at different paths
+        patcher = mock.patch.object(snapshots, 'BLOCK_ENTRIES', 7)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def diff(self, old, new, limit=10 ** 6):
+        old_path = os.path.join(self.tmp.name, 'old.snap')
+        new_path = os.path.join(self.tmp.name, 'new.snap')
+        write(old_path, old)
+        write(new_path, new)
+        return diff_snapshots(old_path, new_path, limit)
+
+    def test_matches_dict_diff(self):
+        rng = random.Random(20)
+        for size in (0, 1, 50, 600):
+            old = random_entries(rng, size)
+            new = mutate(rng, old)
+            changes, summary = self.diff(old, new)
+            expected_changes, expected_summary = expected_diff(old, new)
+            self.assertEqual(sorted(changes), sorted(expected_changes))
+            self.assertEqual([magnitude(change) for change in changes],
+                             sorted(map(magnitude, changes), reverse=True))
+            for key, value in expected_summary.items():
+                self.assertEqual(summary[key], value, key)
+            old_files = sum(size for size, _, kind in old.values() if kind == FILE)
+            new_files = sum(size for size, _, kind in new.values() if kind == FILE)
+            self.assertEqual(summary['net_bytes'], new_files - old_files)
+
+    def test_one_side_empty(self):
+        rng = random.Random(21)
+        entries = random_entries(rng, 100)
+        for old, new in (({}, entries), (entries, {})):
+            changes, _ = self.diff(old, new)
+            self.assertEqual(sorted(changes), sorted(expected_diff(old, new)[0]))
+
+    def test_limit_keeps_largest(self):
+        rng = random.Random(22)
+        old = random_entries(rng, 800)
+        new = mutate(rng, old)
+        changes, summary = self.diff(old, new, limit=25)
+        expected_changes, expected_summary = expected_diff(old, new)
+        self.assertEqual(len(changes), 25)
+        self.assertEqual([magnitude(change) for change in changes],
+                         sorted(map(magnitude, expected_changes), reverse=True)[:25])
+        self.assertLessEqual(set(changes), set(expected_changes))
+        # The summary still counts every change
+        self.assertEqual(summary['files_added'], expected_summary['files_added'])
+
+    def test_round_trip(self):
+        rng = random.Random(23)
+        entries = random_entries(rng, 100)
+        path = os.path.join(self.tmp.name, 'one.snap')
+        write(path, entries)
+        with SnapshotReader(path) as reader:
+            self.assertEqual(list(reader), sorted(((key, *value) for key, value in entries.items()),
+                                                  key=lambda entry: entry[0].encode('utf-8', 'surrogatepass')))
+            self.assertEqual(reader.files, sum(kind == FILE for _, _, kind in entries.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+"""The thumbnail cache folder's size limit, in the index and in a batch."""
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from thumbnail_batch import CacheFolder, pregenerate
+
+try:
+    import cv2
+    import numpy as np
+except ImportError:
+    cv2 = None
+
+
+def write_png(folder, name, size, age):
+    path = os.path.join(folder, name)
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    stamp = time.time() - age
+    os.utime(path, (stamp, stamp))
+    return path
+
+
+class CacheFolderTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.dir = self.tmp.name
+
+    def test_loads_oldest_first_and_evicts_them(self):
+        for name, age in (('new.png', 10), ('old.png', 300), ('mid.png', 100)):
+            write_png(self.dir, name, 100, age)
+        write_png(self.dir, 'notes.txt', 1000, 0)
+        folder = CacheFolder(self.dir, limit=350)
+        self.assertEqual((len(folder), folder.bytes), (3, 300))
+        write_png(self.dir, 'added.png', 100, 0)
+        self.assertEqual(folder.add('added.png', 100), ['old.png'])
+        self.assertEqual(sorted(os.listdir(self.dir)), ['added.png', 'mid.png', 'new.png', 'notes.txt'])
+
+    def test_used_files_are_kept(self):
+        for name, age in (('a.png', 300), ('b.png', 200)):
+            write_png(self.dir, name, 100, age)
+        folder = CacheFolder(self.dir, limit=250)
+        self.assertTrue(folder.use('a.png'))
+        self.assertFalse(folder.use('missing.png'))
+        self.assertEqual(folder.add('c.png', 100), ['b.png'])
+
+    def test_new_file_is_never_evicted(self):
+        folder = CacheFolder(self.dir, limit=50)
+        self.assertEqual(folder.add('huge.png', 500), [])
+        self.assertEqual(folder.bytes, 500)
+
+    def test_lower_limit_evicts_at_once(self):
+        for i in range(4):
+            write_png(self.dir, f'{i}.png', 100, 100 - i)
+        folder = CacheFolder(self.dir)
+        self.assertEqual(folder.set_limit(200), ['0.png', '1.png'])
+        self.assertEqual(sorted(os.listdir(self.dir)), ['2.png', '3.png'])
+        self.assertEqual(folder.bytes, 200)
+
+
+@unittest.skipIf(cv2 is None, 'OpenCV is not installed')
+class PregenerateLimitTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.cache_dir = os.path.join(self.tmp.name, 'cache')
+        rng = np.random.default_rng(24)
+        self.files = []
+        for i in range(6):
+            path = os.path.join(self.tmp.name, f'{i}.png')
+            # Noise compresses badly, so every preview is a sizeable PNG
+            cv2.imwrite(path, rng.integers(0, 256, (400, 400, 3), dtype=np.uint8))
+            stat = os.stat(path)
+            self.files.append((path, stat.st_size, stat.st_mtime_ns, 'image'))
+
+    def cache_bytes(self):
+        return sum(entry.stat().st_size for entry in os.scandir(self.cache_dir))
+
+    def test_fits(self):
+        stats = pregenerate(self.files, self.cache_dir, workers=1)
+        self.assertEqual(stats['generated'], 6)
+        self.assertEqual((stats['evicted'], stats['over_limit']), (0, False))
+        stats = pregenerate(self.files, self.cache_dir, workers=1)
+        self.assertEqual(stats['cached'], 6)
+
+    def test_batch_larger_than_limit(self):
+        pregenerate(self.files[:1], self.cache_dir, workers=1)
+        limit = 3 * self.cache_bytes()
+        stats = pregenerate(self.files, self.cache_dir, workers=1, cache_limit=limit)
+        self.assertEqual(stats['generated'], 5)
+        self.assertTrue(stats['over_limit'])
+        self.assertGreater(stats['evicted'], 0)
+        self.assertLessEqual(self.cache_bytes(), limit)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 6 - stats['evicted'])
+
+    def test_older_previews_make_room(self):
+        pregenerate(self.files[:3], self.cache_dir, workers=1)
+        limit = self.cache_bytes() + 1
+        stats = pregenerate(self.files[3:4], self.cache_dir, workers=1, cache_limit=limit)
+        # One older preview goes, but the batch itself fits
+        self.assertEqual((stats['evicted'], stats['over_limit']), (1, False))
+        self.assertLessEqual(self.cache_bytes(), limit)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,270 @@
+"""Make preview thumbnails ahead of time, in a pool of worker processes.
+
+Images get the thumbnail the preview pane shows, and videos a contact sheet
+of frames sampled across their length. Both are written as PNGs into the
+preview cache under the keys ThumbnailCache looks up, so the app finds
+them ready. Qt-free, so it can run headless from a scheduled job through
+the thumbnails command; OpenCV is needed.
+
+Files are rendered through scan_engine.run_killable: every worker process
+has a pipe of its own and renders one file at a time, and a file that
+takes longer than the timeout has its worker killed and replaced, so a
+corrupt or stalled video costs one timeout, not the batch.
+
+The cache folder is kept under the same size limit as the app's, through
+the CacheFolder index both use, so a batch never leaves more behind than
+the app would keep.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from scan_engine import TIMED_OUT, run_killable
+
+IMAGE_PREVIEW_SIZE = 280
+VIDEO_PREVIEW_SIZE = 320  # Width of a video's contact sheet
+SHEET_FRAMES = 6
+SHEET_COLUMNS = 2
+DEFAULT_TIMEOUT = 30  # Seconds one file may take before its worker is killed
+DEFAULT_CACHE_LIMIT = 256 * 1024 * 1024  # Bytes of PNGs kept in the cache folder
+KIND_VARIANTS = {'image': 'image', 'video': 'sheet'}  # Cache key variant of each kind of preview
+
+
+def default_thumbnail_cache_dir():
+    base = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'file_sorter', 'thumbnails')
+
+
+def thumbnail_key(path, size, mtime, variant=''):
+    return hashlib.sha1(f"{path}\0{size}\0{mtime}\0{variant}".encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+class CacheFolder:
+    """Least recently used index of the PNGs in a thumbnail cache folder.
+
+    Files are ordered by mtime when the index is loaded, so eviction order
+    survives restarts; readers touch the files they use. add() records a
+    new file and deletes the least recently used ones until the folder is
+    back under limit bytes, never the file just added. Safe to use from
+    several threads.
+    """
+
+    def __init__(self, cache_dir, limit=DEFAULT_CACHE_LIMIT):
+        self.cache_dir = cache_dir
+        self.limit = limit
+        self.bytes = 0
+        self._files = OrderedDict()  # Name -> size, least recently used first
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self.reload()
+
+    def reload(self):
+        """Read the folder again, e.g. after another process wrote to it."""
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith('.png'):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, entry.name, stat.st_size))
+        with self._lock:
+            self._files = OrderedDict((name, size) for _, name, size in sorted(entries))
+            self.bytes = sum(self._files.values())
+
+    def __contains__(self, name):
+        with self._lock:
+            return name in self._files
+
+    def __len__(self):
+        with self._lock:
+            return len(self._files)
+
+    def use(self, name):
+        """Mark a file as just used; returns False if it is not indexed."""
+        with self._lock:
+            if name not in self._files:
+                return False
+            self._files.move_to_end(name)
+            return True
+
+    def add(self, name, size):
+        """Record a file written to the folder; returns the names evicted for it."""
+        with self._lock:
+            self.bytes += size - self._files.pop(name, 0)
+            self._files[name] = size
+            evicted = self._evict()
+        self._remove(evicted)
+        return evicted
+
+    def forget(self, name):
+        with self._lock:
+            self.bytes -= self._files.pop(name, 0)
+
+    def set_limit(self, limit):
+        """Change the limit, evicting at once if the folder is now over it."""
+        with self._lock:
+            self.limit = limit
+            evicted = self._evict()
+        self._remove(evicted)
+        return evicted
+
+    def _evict(self):
+        evicted = []
+        while self.bytes > self.limit and len(self._files) > 1:
+            name, size = self._files.popitem(last=False)
+            self.bytes -= size
+            evicted.append(name)
+        return evicted
+
+    def _remove(self, names):
+        for name in names:
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+
+
+def render_image(path, max_size=IMAGE_PREVIEW_SIZE):
+    """Return a BGR thumbnail of an image scaled to fit max_size, or None.
+
+    JPEGs are decoded at the smallest of 1/8, 1/4 or 1/2 scale that is
+    still larger than the thumbnail. EXIF orientation is ignored, as it is
+    by the preview pane.
+    """
+    import cv2
+    import numpy as np
+    # Read through numpy so non-ASCII paths work on Windows
+    data = np.fromfile(path, dtype=np.uint8)
+    flags = cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION
+    image = None
+    if os.path.splitext(path)[1].lower() in ('.jpg', '.jpeg'):
+        image = cv2.imdecode(data, cv2.IMREAD_REDUCED_COLOR_8 | cv2.IMREAD_IGNORE_ORIENTATION)
+        if image is not None and max(image.shape[:2]) < max_size:
+            # Too small at 1/8; that size tells which scale is large enough
+            longest = max(image.shape[:2]) * 8
+            if longest // 4 >= max_size:
+                image = cv2.imdecode(data, cv2.IMREAD_REDUCED_COLOR_4 | cv2.IMREAD_IGNORE_ORIENTATION)
+            elif longest // 2 >= max_size:
+                image = cv2.imdecode(data, cv2.IMREAD_REDUCED_COLOR_2 | cv2.IMREAD_IGNORE_ORIENTATION)
+            else:
+                image = None
+    if image is None:
+        image = cv2.imdecode(data, flags)
+    if image is None or image.size == 0:
+        return None
+    height, width = image.shape[:2]
+    factor = max_size / max(height, width)
+    size = (max(1, round(width * factor)), max(1, round(height * factor)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA if factor < 1 else cv2.INTER_LINEAR)
+
+
+def render_video(path, timeout=None):
+    """Return a BGR contact sheet of a video, or None if no frame could be read."""
+    from video_frames import contact_sheet, sample_frames
+    samples = sample_frames(path, SHEET_FRAMES, timeout)
+    return contact_sheet(samples, SHEET_COLUMNS, VIDEO_PREVIEW_SIZE) if samples else None
+
+
+def _render_job(path, kind, target, timeout):
+    # Runs in a worker: render one file and write its PNG next to its final
+    # name first, so the cache never sees a partial file
+    import cv2
+    try:
+        image = render_video(path, timeout) if kind == 'video' else render_image(path)
+    except (OSError, ValueError, cv2.error):
+        image = None
+    if image is None:
+        return 'failed'
+    ok, encoded = cv2.imencode('.png', image)
+    if not ok:
+        return 'failed'
+    temporary = f"{target}.{os.getpid()}.tmp"
+    try:
+        encoded.tofile(temporary)
+        os.replace(temporary, target)
+    except OSError:
+        return 'failed'
+    return 'generated'
+
+
+def _remove_temporary(args, pid):
+    # The PNG a killed worker was writing
+    try:
+        os.remove(f"{args[2]}.{pid}.tmp")
+    except OSError:
+        pass
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def pregenerate(files, cache_dir=None, workers=None, timeout=DEFAULT_TIMEOUT, progress=None, cancel=None,
+                start_method=None, cache_limit=DEFAULT_CACHE_LIMIT):
+    """Render and cache previews for (path, size, mtime, kind) files.
+
+    kind is 'image' or 'video'; size and mtime (st_mtime_ns) are the values
+    the preview pane keys its cache by. Files whose preview is already
+    cached are skipped. Returns stats: files, generated, cached, failed,
+    timed_out, evicted, over_limit, cancelled and elapsed. progress, if
+    given, is called as progress(done, total).
+
+    The cache folder is trimmed to cache_limit bytes as previews are added,
+    least recently used first, as the app does. evicted counts the PNGs
+    deleted; over_limit is true when this batch's own previews did not fit
+    and some were evicted again.
+
+    cancel is an optional threading.Event: once it is set no new files are
+    started, and those being rendered finish. start_method is the
+    multiprocessing start method (the platform's default when None); callers
+    with threads running, like the GUI, should pass 'spawn'.
+    """
+    started = time.perf_counter()
+    folder = CacheFolder(cache_dir or default_thumbnail_cache_dir(), cache_limit)
+    jobs = []
+    batch = set()  # Names of this batch's previews
+    stats = {'files': 0, 'generated': 0, 'cached': 0, 'failed': 0, 'timed_out': 0, 'evicted': 0,
+             'over_limit': False, 'cancelled': False, 'elapsed': 0.0}
+    for path, size, mtime, kind in files:
+        stats['files'] += 1
+        name = thumbnail_key(path, size, mtime, KIND_VARIANTS[kind]) + '.png'
+        target = os.path.join(folder.cache_dir, name)
+        batch.add(name)
+        if folder.use(name):
+            # Asked for again, so it is recently used; its mtime says so
+            # to the next reader of the folder too
+            stats['cached'] += 1
+            try:
+                os.utime(target)
+            except OSError:
+                pass
+        else:
+            jobs.append((name, (path, kind, target, timeout)))
+    total = len(jobs)
+    done = 0
+    # The worker gives up on its own after the timeout; the grace period is
+    # for it to say so before it is killed
+    results = run_killable(jobs, _render_job, workers, timeout + 2, cancel, start_method, _remove_temporary)
+    for name, result in results:
+        if result is TIMED_OUT:
+            result = 'timed_out'
+        elif result == 'generated':
+            evicted = folder.add(name, _file_size(os.path.join(folder.cache_dir, name)))
+            stats['evicted'] += len(evicted)
+            stats['over_limit'] = stats['over_limit'] or not batch.isdisjoint(evicted)
+        else:
+            result = 'failed'
+        stats[result] += 1
+        done += 1
+        if progress is not None:
+            progress(done, total)
+    stats['cancelled'] = done < total
+    stats['elapsed'] = time.perf_counter() - started
+    return stats
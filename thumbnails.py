@@ -0,0 +1,207 @@
+import os
+import threading
+from collections import OrderedDict
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, Qt, pyqtSignal
+from PyQt5.QtGui import QImage, QImageReader, QImageIOHandler
+
+from thumbnail_batch import (DEFAULT_CACHE_LIMIT, DEFAULT_TIMEOUT, IMAGE_PREVIEW_SIZE, KIND_VARIANTS, CacheFolder,
+                             default_thumbnail_cache_dir, thumbnail_key)
+
+
+def get_image_thumbnail(image_path, max_size=IMAGE_PREVIEW_SIZE):
+    # Let the decoder produce the target size directly where it can (JPEG
+    # decodes at 1/2, 1/4 or 1/8 scale), instead of decoding every pixel of a
+    # large photo only to throw most of them away
+    reader = QImageReader(image_path)
+    full_size = reader.size()
+    if (full_size.isValid() and reader.supportsOption(QImageIOHandler.ScaledSize)
+            and (full_size.width() > max_size or full_size.height() > max_size)):
+        reader.setScaledSize(full_size.scaled(max_size, max_size, Qt.KeepAspectRatio))
+        image = reader.read()
+        if not image.isNull():
+            return image
+
+    # Formats without scaled decoding are decoded in full and scaled after
+    image = QImage(image_path)
+    if image.isNull():
+        return None
+    return image.scaled(max_size, max_size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+
+
+def get_video_thumbnail(video_path):
+    # OpenCV (and numpy with it) takes longer to import than the rest of the
+    # app, so it is loaded by the first video preview rather than at startup
+    import cv2
+    from thumbnail_batch import render_video
+
+    try:
+        # The same contact sheet the batch mode writes, so either can fill
+        # the cache for the other
+        sheet = render_video(video_path, DEFAULT_TIMEOUT)
+        if sheet is None:
+            return None
+        sheet = cv2.cvtColor(sheet, cv2.COLOR_BGR2RGB)
+
+        # Convert numpy array to QImage; copy so it outlives the array
+        height, width, channel = sheet.shape
+        bytes_per_line = 3 * width
+        return QImage(sheet.data, width, height, bytes_per_line, QImage.Format_RGB888).copy()
+    except Exception as e:
+        print(f"Error generating video thumbnail: {str(e)}")
+        return None
+
+
+class ThumbnailCache:
+    """Two-level LRU cache of thumbnails keyed by (path, size, mtime).
+
+    Recently used images are kept in memory up to memory_limit bytes; every
+    generated thumbnail is also written as a PNG under cache_dir, which is
+    trimmed to disk_limit bytes by evicting the least recently used files,
+    through the same CacheFolder index the thumbnails command uses. Safe to
+    use from several threads.
+    """
+
+    def __init__(self, cache_dir=None, memory_limit=64 * 1024 * 1024, disk_limit=DEFAULT_CACHE_LIMIT):
+        self.cache_dir = cache_dir or default_thumbnail_cache_dir()
+        self.memory_limit = memory_limit
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk = CacheFolder(self.cache_dir, disk_limit)
+
+    key = staticmethod(thumbnail_key)
+
+    @property
+    def disk_limit(self):
+        return self._disk.limit
+
+    def set_disk_limit(self, limit):
+        # Applied at once: a lower limit evicts straight away
+        self._disk.set_limit(limit)
+
+    def reload_disk(self):
+        # After the thumbnails batch has added and evicted files
+        self._disk.reload()
+
+    def get_memory(self, key):
+        with self._lock:
+            image = self._memory.get(key)
+            if image is not None:
+                self._memory.move_to_end(key)
+            return image
+
+    def get(self, key):
+        image = self.get_memory(key)
+        if image is not None:
+            return image
+        name = key + '.png'
+        file_path = os.path.join(self.cache_dir, name)
+        if not self._disk.use(name):
+            # Written since the index was loaded, e.g. by the thumbnails command
+            try:
+                size = os.path.getsize(file_path)
+            except OSError:
+                return None
+            self._disk.add(name, size)
+        image = QImage(file_path)
+        if image.isNull():
+            self._disk.forget(name)
+            return None
+        try:
+            os.utime(file_path)
+        except OSError:
+            pass
+        self._put_memory(key, image)
+        return image
+
+    def put(self, key, image):
+        self._put_memory(key, image)
+        name = key + '.png'
+        file_path = os.path.join(self.cache_dir, name)
+        if not image.save(file_path, 'PNG'):
+            return
+        try:
+            size = os.path.getsize(file_path)
+        except OSError:
+            return
+        self._disk.add(name, size)
+
+    def _put_memory(self, key, image):
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_bytes -= old.sizeInBytes()
+            self._memory[key] = image
+            self._memory_bytes += image.sizeInBytes()
+            while self._memory_bytes > self.memory_limit and len(self._memory) > 1:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted.sizeInBytes()
+
+
+class _ThumbnailSignals(QObject):
+    # QRunnable is not a QObject, so results are sent through this helper
+    ready = pyqtSignal(int, str, QImage)
+
+
+class _ThumbnailJob(QRunnable):
+    def __init__(self, service, request_id, path, key, kind):
+        super().__init__()
+        self.service = service
+        self.request_id = request_id
+        self.path = path
+        self.key = key
+        self.kind = kind
+
+    def run(self):
+        # Drop the job if the selection has already moved on
+        if self.request_id != self.service.latest_request:
+            return
+        image = self.service.cache.get(self.key)
+        if image is None:
+            if self.kind == 'video':
+                image = get_video_thumbnail(self.path)
+            else:
+                image = get_image_thumbnail(self.path)
+            if image is not None:
+                self.service.cache.put(self.key, image)
+        self.service.signals.ready.emit(self.request_id, self.path, image if image is not None else QImage())
+
+
+class ThumbnailService(QObject):
+    """Generate preview thumbnails on a background thread pool.
+
+    request() answers from the memory cache immediately when it can;
+    otherwise it queues a job and returns None, and thumbnail_ready fires
+    later with the path and image. Only the latest request is delivered:
+    queued jobs for earlier requests are discarded and late results for
+    them are ignored. A null QImage means no thumbnail could be made.
+    """
+    thumbnail_ready = pyqtSignal(str, QImage)
+
+    def __init__(self, cache=None, max_threads=2, parent=None):
+        super().__init__(parent)
+        self.cache = cache or ThumbnailCache()
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        self.signals = _ThumbnailSignals()
+        self.signals.ready.connect(self._on_ready)
+        self.latest_request = 0
+
+    def request(self, path, size, mtime, kind='image'):
+        self.latest_request += 1
+        self.pool.clear()
+        key = ThumbnailCache.key(path, size, mtime, KIND_VARIANTS[kind])
+        image = self.cache.get_memory(key)
+        if image is not None:
+            return image
+        self.pool.start(_ThumbnailJob(self, self.latest_request, path, key, kind))
+        return None
+
+    def cancel(self):
+        self.latest_request += 1
+        self.pool.clear()
+
+    def _on_ready(self, request_id, path, image):
+        if request_id == self.latest_request:
+            self.thumbnail_ready.emit(path, image)
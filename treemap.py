@@ -0,0 +1,161 @@
+from PyQt5.QtCore import QRectF, Qt, pyqtSignal
+from PyQt5.QtGui import QColor, QPainter, QPen
+from PyQt5.QtWidgets import QToolTip, QWidget
+
+MAX_TILES = 200  # Children drawn individually; smaller ones share one tile
+MIN_LABEL_WIDTH = 60
+
+
+def _worst_ratio(row_sum, row_max, row_min, side):
+    # Worst aspect ratio of a row of tiles laid along a side of this length
+    side_sq = side * side
+    sum_sq = row_sum * row_sum
+    return max(row_max * side_sq / sum_sq, sum_sq / (side_sq * row_min))
+
+
+def squarify(values, x, y, width, height):
+    """Lay out positive values, largest first, as near-square rectangles.
+
+    Uses the squarified treemap algorithm (Bruls, Huizing and van Wijk):
+    tiles are added to the current row while that improves its worst
+    aspect ratio, then the row is fixed along the shorter side. Returns one
+    (x, y, width, height) tuple per value, in the same order.
+    """
+    total = float(sum(values))
+    if total <= 0 or width <= 0 or height <= 0:
+        return [(x, y, 0.0, 0.0) for _ in values]
+    scale = width * height / total
+    areas = [value * scale for value in values]
+    rects = []
+    i = 0
+    while i < len(areas):
+        side = min(width, height)
+        row_sum = row_max = row_min = areas[i]
+        end = i + 1
+        while end < len(areas):
+            area = areas[end]
+            if (_worst_ratio(row_sum + area, max(row_max, area), min(row_min, area), side)
+                    > _worst_ratio(row_sum, row_max, row_min, side)):
+                break
+            row_sum += area
+            row_max = max(row_max, area)
+            row_min = min(row_min, area)
+            end += 1
+        if width >= height:
+            # Fix the row as a column on the left
+            column_width = row_sum / height
+            offset = y
+            for area in areas[i:end]:
+                rects.append((x, offset, column_width, area / column_width))
+                offset += area / column_width
+            x += column_width
+            width -= column_width
+        else:
+            row_height = row_sum / width
+            offset = x
+            for area in areas[i:end]:
+                rects.append((offset, y, area / row_height, row_height))
+                offset += area / row_height
+            y += row_height
+            height -= row_height
+        i = end
+    return rects
+
+
+class TreemapWidget(QWidget):
+    """Treemap of one DirectoryTree node's children, sized by bytes.
+
+    Each child is drawn with its own largest children nested inside, and
+    files directly in a folder share one tile. Clicking a folder emits
+    node_clicked. The layout is only computed for the node on screen, when
+    the node or the widget size changes.
+    """
+    node_clicked = pyqtSignal(int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.tree = None
+        self.node = 0
+        self.tiles = []  # (rect, node or -1, label, depth)
+        self.setMouseTracking(True)
+        self.setMinimumHeight(150)
+
+    def set_tree(self, tree):
+        self.tree = tree
+        self.node = 0
+        self.relayout()
+
+    def set_node(self, node):
+        if node != self.node:
+            self.node = node
+            self.relayout()
+
+    def relayout(self):
+        self.tiles = []
+        if self.tree is not None and len(self.tree):
+            self._layout(self.node, QRectF(self.rect()).adjusted(1, 1, -1, -1), 0)
+        self.update()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.relayout()
+
+    def _layout(self, node, rect, depth):
+        tree = self.tree
+        children = tree.children(node)
+        sizes = tree.sizes[children]
+        order = sizes.argsort()[::-1]
+        children = children[order][:MAX_TILES]
+        values = [(int(size), int(child), tree.name(int(child))) for size, child in zip(sizes[order], children)
+                  if size > 0]
+        rest = int(sizes[order][MAX_TILES:].sum())
+        if rest > 0:
+            values.append((rest, -1, f"{len(order) - MAX_TILES:,} smaller folders"))
+        direct = tree.direct_size(node)
+        if direct > 0:
+            values.append((direct, -1, "(files)"))
+        values.sort(key=lambda value: value[0], reverse=True)
+        if not values:
+            return
+
+        for (size, child, name), (x, y, width, height) in zip(
+                values, squarify([value[0] for value in values], rect.x(), rect.y(), rect.width(), rect.height())):
+            tile = QRectF(x, y, width, height)
+            self.tiles.append((tile, child, f"{name}\n{size / (1024 * 1024):.1f} MB", depth))
+            # One nested level, inside a margin that leaves room for the label
+            label_height = self.fontMetrics().height() + 2
+            if depth == 0 and child >= 0 and width > 40 and height > label_height + 20:
+                self._layout(child, tile.adjusted(3, label_height, -3, -3), depth + 1)
+
+    def tile_at(self, pos):
+        # Innermost tile under the point; nested tiles come after their parent
+        for tile in reversed(self.tiles):
+            if tile[0].contains(pos):
+                return tile
+        return None
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), self.palette().base())
+        for rect, node, label, depth in self.tiles:
+            hue = (node * 47) % 360 if node >= 0 else 0
+            color = QColor.fromHsv(hue, 60 if node >= 0 else 0, 235 - depth * 25)
+            painter.fillRect(rect, color)
+            painter.setPen(QPen(QColor(90, 90, 90)))
+            painter.drawRect(rect)
+            if depth == 0 and rect.width() >= MIN_LABEL_WIDTH and rect.height() >= self.fontMetrics().height():
+                painter.setPen(Qt.black)
+                painter.drawText(rect.adjusted(3, 1, -3, -1), Qt.AlignLeft | Qt.AlignTop,
+                                 label.split('\n')[0])
+
+    def mouseMoveEvent(self, event):
+        tile = self.tile_at(event.pos())
+        if tile is not None:
+            QToolTip.showText(event.globalPos(), tile[2], self)
+        else:
+            QToolTip.hideText()
+
+    def mousePressEvent(self, event):
+        tile = self.tile_at(event.pos())
+        if tile is not None and tile[1] >= 0:
+            self.node_clicked.emit(tile[1])
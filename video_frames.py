@@ -0,0 +1,82 @@
+"""Grab frames from video files with OpenCV.
+
+Qt-free, so preview thumbnails, contact sheets, perceptual hashing in
+worker processes and headless commands all read frames the same way,
+through sample_frames.
+"""
+import time
+
+import cv2
+import numpy as np
+
+
+def sample_frames(video_path, count, timeout=None):
+    """Return (milliseconds, frame) pairs at `count` evenly spaced times of a video.
+
+    Each stop is reached by seeking to a timestamp, which the decoder
+    resolves from the nearest keyframe before it, so no frame numbers (an
+    estimate in many containers) are relied on. A frame that cannot be read
+    is None. Returns None when the video cannot be opened or reports no
+    length. With a timeout in seconds, FFmpeg gives up opening or reading
+    after that long, and no more stops are sampled once it has passed.
+    """
+    deadline = None
+    params = []
+    if timeout is not None:
+        deadline = time.monotonic() + timeout
+        params = [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, int(timeout * 1000),
+                  cv2.CAP_PROP_READ_TIMEOUT_MSEC, int(timeout * 1000)]
+    cap = cv2.VideoCapture(video_path, cv2.CAP_ANY, params)
+    try:
+        if not cap.isOpened():
+            return None
+        frame_count = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        if frame_count <= 0 or fps <= 0:
+            return None
+        duration = frame_count / fps * 1000
+        samples = []
+        for stop in range(count):
+            # Centred in equal slices, so neither the often black first
+            # frame nor the end of the stream is asked for
+            milliseconds = duration * (stop + 0.5) / count
+            frame = None
+            if deadline is None or time.monotonic() < deadline:
+                cap.set(cv2.CAP_PROP_POS_MSEC, milliseconds)
+                ok, frame = cap.read()
+                frame = frame if ok else None
+            samples.append((milliseconds, frame))
+        return samples
+    finally:
+        cap.release()
+
+
+def contact_sheet(samples, columns, width):
+    """Lay sampled (milliseconds, frame) pairs out in a grid `width` pixels wide.
+
+    Tiles keep the first frame's aspect ratio and are labelled with their
+    time; missing frames leave a dark tile. Returns a BGR image, or None if
+    no frame was read.
+    """
+    frames = [frame for _, frame in samples if frame is not None]
+    if not frames:
+        return None
+    tile_width = width // columns
+    height, frame_width = frames[0].shape[:2]
+    tile_height = max(1, round(height * tile_width / frame_width))
+    rows = -(-len(samples) // columns)
+    sheet = np.full((rows * tile_height, columns * tile_width, 3), 32, dtype=np.uint8)
+    for position, (milliseconds, frame) in enumerate(samples):
+        if frame is None:
+            continue
+        top = (position // columns) * tile_height
+        left = (position % columns) * tile_width
+        tile = cv2.resize(frame, (tile_width, tile_height), interpolation=cv2.INTER_AREA)
+        minutes, seconds = divmod(int(milliseconds // 1000), 60)
+        label = f"{minutes // 60}:{minutes % 60:02d}:{seconds:02d}" if minutes >= 60 else f"{minutes}:{seconds:02d}"
+        # Dark outline first so the label reads on light and dark frames
+        for color, thickness in (((0, 0, 0), 3), ((255, 255, 255), 1)):
+            cv2.putText(tile, label, (4, tile_height - 6), cv2.FONT_HERSHEY_SIMPLEX, 0.4, color, thickness,
+                        cv2.LINE_AA)
+        sheet[top:top + tile_height, left:left + tile_width] = tile
+    return sheet